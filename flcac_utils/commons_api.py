@@ -2,28 +2,43 @@
 Functions to support accessing the FLCAC via API
 """
 
-import urllib.request
-import requests
 import io
 import json
 from pathlib import Path
-import pandas as pd
 import zipfile
-import yaml
+from datetime import datetime
+from flcac_utils.transport import LiveTransport
 import olca_schema as olca
 
 parent_path = Path(__file__).parent
 data_path = parent_path / 'data'
 
-commons_base = 'https://www.lcacommons.gov/lca-collaboration'
+default_base = 'https://www.lcacommons.gov/lca-collaboration'
+commons_base = default_base
+
+# all requests to the FLCAC are sent through the transport, see set_transport
+transport = LiveTransport()
+
+def set_transport(new_transport=None, base_url=None):
+    """
+    Replaces the transport used for all requests, e.g. with a
+    RecordingTransport or ReplayTransport from flcac_utils.transport.
+    Pass base_url to send requests to a local stand-in server.
+    Calling with no arguments restores the live FLCAC.
+    """
+    global transport, commons_base
+    transport = new_transport if new_transport else LiveTransport()
+    commons_base = base_url if base_url else default_base
 
 def get_config():
+    import yaml
     with open(data_path / "repos.yml", "r") as file:
         config = yaml.safe_load(file)
     return config
 
 def login():
     """Logs in to the API and returns the auth token."""
+    import requests
     username = input("Enter your username: ")
     password = input("Enter your password: ")
     
@@ -34,7 +49,7 @@ def login():
     }
 
     try:
-        response = requests.post(url, json=payload)
+        response = transport.post(url, json=payload)
         if response.status_code == 200:
             print("Login successful.")
             return response.cookies.get("JSESSIONID")
@@ -48,6 +63,7 @@ def login():
 
 def get_repository_info(token, group, repo):
     """Gets repository metadata to check supported types."""
+    import requests
     url = f"{commons_base}/ws/repository/{group}/{repo}"
     
     if token:
@@ -62,7 +78,7 @@ def get_repository_info(token, group, repo):
     }
     
     try:
-        response = requests.get(url, cookies=cookies, headers=headers)
+        response = transport.get(url, cookies=cookies, headers=headers)
         if response.status_code == 200:
             repo_info = response.json()
             # print("\nRepository Information:")
@@ -77,6 +93,7 @@ def get_repository_info(token, group, repo):
 
 def get_recent_commits(token, group, repo):
     """Fetches recent commits to get the hash of our latest commit."""
+    import requests
     if not token:
         endpoints = [
             f'{commons_base}/ws/public/repository/{group}/{repo}',
@@ -103,7 +120,7 @@ def get_recent_commits(token, group, repo):
     for url in endpoints:
         try:
             # print(f"\nTrying commits endpoint: {url}")
-            response = requests.get(url, cookies=cookies, headers=headers)
+            response = transport.get(url, cookies=cookies, headers=headers)
             # print(f"Response status: {response.status_code}")
             
             if response.status_code == 200:
@@ -164,7 +181,7 @@ def get_single_object(repo, object_type, refId, auth=False):
     f = olca_class.from_dict(d)
     return f
 
-def _get_object(owner, repo, object_type, refId, token):
+def _get_object_response(owner, repo, object_type, refId, token):
     url = (f'{commons_base}/'
            f'ws/public/browse/{owner}/{repo}/{object_type}/{refId}')
     cookies = {"JSESSIONID": token}
@@ -172,8 +189,10 @@ def _get_object(owner, repo, object_type, refId, token):
         "Accept": "application/json",
         "Content-Type": "application/json"
     }
+    return transport.get(url, cookies=cookies, headers=headers)
 
-    resp = requests.get(url, cookies=cookies, headers=headers)
+def _get_object(owner, repo, object_type, refId, token):
+    resp = _get_object_response(owner, repo, object_type, refId, token)
     json = resp.json()
     return json
 
@@ -190,11 +209,11 @@ def return_request(owner, repo, object_type = 'PROCESS', **kwargs):
         "Content-Type": "application/json"
     }
 
-    resp = requests.get(url, cookies=cookies, headers=headers)
+    resp = transport.get(url, cookies=cookies, headers=headers)
     json_token = resp.content.decode()
     # URL used to download json once token is identified
-    download_url = 'https://www.lcacommons.gov/lca-collaboration/ws/public/download/json'
-    resp = requests.get(url = f'{download_url}/{json_token}', cookies=cookies)
+    download_url = f'{commons_base}/ws/public/download/json'
+    resp = transport.get(url = f'{download_url}/{json_token}', cookies=cookies)
     return resp
 
 def read_json(f, path):
@@ -210,67 +229,145 @@ def check_obj_append(d, search_objs, obj_type):
         return False
     elif not search_objs:
         return True
+    elif search_objs.get(obj_type, '') is None:
+        # None indicates all objects of this type
+        return True
     elif search_objs and d.get('name') in search_objs[obj_type]:
         return True
     else:
         return False
 
-def process_response(resp, object_types, search_objs=None):
+# object types accepted by process_response, the archive folder prefix used to
+# identify them and the olca class used to build them
+entry_types = [
+    ('PROCESS', 'process', olca.Process),
+    ('IMPACT_METHOD', 'lcia_categories', olca.ImpactCategory),
+    ('IMPACT_METHOD', 'lcia_methods', olca.ImpactMethod),
+    ('ACTORS', 'actor', olca.Actor),
+    ('SOURCES', 'source', olca.Source),
+    ('DQ_SYSTEM', 'dq_system', olca.DQSystem),
+    ('FLOWS', 'flows', olca.Flow),
+    ]
+
+# model types included in each object type of repos.yml
+sync_types = {
+    'PROCESS': ['PROCESS'],
+    'FLOWS': ['FLOW'],
+    'ACTORS': ['ACTOR'],
+    'SOURCES': ['SOURCE'],
+    'DQ_SYSTEM': ['DQ_SYSTEM'],
+    'IMPACT_METHOD': ['IMPACT_METHOD', 'IMPACT_CATEGORY'],
+    }
+
+# JSON-LD folder for each model type used by the browse endpoints
+folder_map = {
+    'PROCESS': 'processes',
+    'FLOW': 'flows',
+    'ACTOR': 'actors',
+    'SOURCE': 'sources',
+    'DQ_SYSTEM': 'dq_systems',
+    'IMPACT_METHOD': 'lcia_methods',
+    'IMPACT_CATEGORY': 'lcia_categories',
+    'FLOW_PROPERTY': 'flow_properties',
+    'UNIT_GROUP': 'unit_groups',
+    'LOCATION': 'locations',
+    'PARAMETER': 'parameters',
+    'CURRENCY': 'currencies',
+    'SOCIAL_INDICATOR': 'social_indicators',
+    }
+
+class LazyObject:
+    """
+    Lightweight proxy for an olca object read from an archive. The id, name
+    and category, and to_ref(), are answered from the json dict; the full
+    olca object is only built on first access to any other attribute.
+    """
+    __slots__ = ('_d', '_olca_class', '_obj')
+
+    def __init__(self, d, olca_class):
+        object.__setattr__(self, '_d', d)
+        object.__setattr__(self, '_olca_class', olca_class)
+        object.__setattr__(self, '_obj', None)
+
+    def materialize(self):
+        """Returns the full olca object, building it if needed"""
+        if self._obj is None:
+            object.__setattr__(self, '_obj', self._olca_class.from_dict(self._d))
+        return self._obj
+
+    @property
+    def id(self):
+        return self._obj.id if self._obj else self._d.get('@id')
+
+    @property
+    def name(self):
+        return self._obj.name if self._obj else self._d.get('name')
+
+    @property
+    def category(self):
+        return self._obj.category if self._obj else self._d.get('category')
+
+    def to_ref(self):
+        if self._obj:
+            return self._obj.to_ref()
+        ref = olca.Ref(id=self.id, name=self.name)
+        ref.category = self.category
+        ref.ref_type = olca.RefType.get(self._olca_class.__name__)
+        return ref
+
+    def __getattr__(self, attr):
+        return getattr(self.materialize(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.materialize(), attr, value)
+
+    def __repr__(self):
+        return f'LazyObject({self._olca_class.__name__}, {self.name!r})'
+
+    def __reduce__(self):
+        d = self._obj.to_dict() if self._obj else self._d
+        return (LazyObject, (d, self._olca_class))
+
+def parse_entries(names, read, object_types, search_objs=None, lazy=False):
+    """Builds olca objects for the archive entries in names. read is a
+    function returning the json dict for an entry name. If lazy, returns
+    LazyObject proxies instead of full olca objects."""
     object_list = []
+    for name in names:
+        ## extract only the objects within the relevant subfolder
+        for obj_type, prefix, olca_class in entry_types:
+            if obj_type not in object_types or not name.startswith(prefix):
+                continue
+            d = read(name)
+            if check_obj_append(d, search_objs, obj_type=obj_type):
+                object_list.append(LazyObject(d, olca_class) if lazy
+                                   else olca_class.from_dict(d))
+    return object_list
+
+def process_response(resp, object_types, search_objs=None, lazy=False):
     with zipfile.ZipFile(io.BytesIO(resp.content), "r") as f:
-        for name in f.namelist():
-            ## extract only the objects within the relevant subfolder
-            if "PROCESS" in object_types:
-                if name.startswith('process'):
-                    d = read_json(f, name)
-                    if check_obj_append(d, search_objs, obj_type='PROCESS'):
-                        l = olca.Process.from_dict(d)
-                        object_list.append(l)
-                    else: continue
-            if 'IMPACT_METHOD' in object_types:
-                if name.startswith('lcia_categories'):
-                    d = read_json(f, name)
-                    if check_obj_append(d, search_objs, obj_type='IMPACT_METHOD'):
-                        l = olca.ImpactCategory.from_dict(d)
-                        object_list.append(l)
-                    else: continue
-                elif name.startswith('lcia_methods'):
-                    d = read_json(f, name)
-                    if check_obj_append(d, search_objs, obj_type='IMPACT_METHOD'):
-                        l = olca.ImpactMethod.from_dict(d)
-                        object_list.append(l)
-                    else: continue
-            if 'ACTORS' in object_types:
-                if name.startswith('actor'):
-                    d = read_json(f, name)
-                    if check_obj_append(d, search_objs, obj_type='ACTORS'):
-                        l = olca.Actor.from_dict(d)
-                        object_list.append(l)
-                    else: continue
-            if 'SOURCES' in object_types:
-                if name.startswith('source'):
-                    d = read_json(f, name)
-                    if check_obj_append(d, search_objs, obj_type='SOURCES'):
-                        l = olca.Source.from_dict(d)
-                        object_list.append(l)
-                    else: continue
-            if 'DQ_SYSTEM' in object_types:
-                if name.startswith('dq_system'):
-                    d = read_json(f, name)
-                    if check_obj_append(d, search_objs, obj_type='DQ_SYSTEM'):
-                        l = olca.DQSystem.from_dict(d)
-                        object_list.append(l)
-                    else: continue
-            if 'FLOWS' in object_types:
-                if name.startswith('flows'):
-                    d = read_json(f, name)
-                    if check_obj_append(d, search_objs, obj_type='FLOWS'):
-                        l = olca.Flow.from_dict(d)
-                        object_list.append(l)
-                    else: continue
+        object_list = parse_entries(f.namelist(),
+                                    lambda name: read_json(f, name),
+                                    object_types, search_objs, lazy=lazy)
     return object_list
 
-def read_commons_data(object_dict, auth=False):
+def _api_path(object_types):
+    """Returns the archive path requested from the API for the object types"""
+    api_objects = [i for i in object_types if i in
+                   ('PROCESS', 'DQ_SYSTEM', 'IMPACT_METHOD')]
+    return api_objects[0] if api_objects else 'PROCESS'
+
+def read_commons_data(object_dict, auth=False, lazy=False, plan=None):
+    """
+    Reads objects from repos on the FLCAC, object_dict takes the form of
+        {<repo>: <object type>} or {<repo>: [<object type>, ...]} or
+        {<repo>: {<object type>: [<object name>, ...]}}
+    If a CommonsRequestPlan is passed, objects are read through the plan so
+    that each archive is only downloaded once.
+    Returns a dictionary of {<repo>: [olca objects]}
+    """
+    if plan is not None:
+        return plan.read(object_dict, lazy=lazy)
     token = login() if auth else None
     
     config = get_config()
@@ -286,17 +383,373 @@ def read_commons_data(object_dict, auth=False):
             object_types = list(object_types.keys())
         elif type(object_types) == str:
             object_types = [object_types]
-        api_objects = [i for i in object_types if i in 
-                       ('PROCESS', 'DQ_SYSTEM', 'IMPACT_METHOD')]
-        api_objects = ['PROCESS'] if not api_objects else api_objects
         resp = return_request(owner = repo_data.get('owner'),
                               repo = repo_data.get('repo'),
-                              object_type = api_objects[0],
+                              object_type = _api_path(object_types),
                               token = token
                               )
         data_dict[repo] = process_response(resp,
                                            object_types=object_types,
-                                           search_objs=search_objs)
+                                           search_objs=search_objs,
+                                           lazy=lazy)
+    return data_dict
+
+class CommonsRequestPlan:
+    """
+    Coalesces object requests from several callers (e.g., extract_flows,
+    extract_processes, extract_actors_from_process_meta, extract_dqsystems)
+    so that each (repo, path) archive is downloaded once and each entry is
+    parsed once. Pass the plan to read_commons_data or the util extract_*
+    functions as plan=.
+
+    Requests added with add() before the first read are parsed together;
+    later requests reuse the downloaded archive. Objects are shared between
+    callers.
+    """
+
+    def __init__(self, auth=False, token=None):
+        self.auth = auth
+        self.token = token
+        self.requests = {}  # (repo, path): {object type: set of names or None}
+        self.parsed = {}  # (repo, path): {object type: set of names or None}
+        self.archives = {}  # (repo, path): archive bytes
+        self.objects = {}  # (repo, path): {(object type, id): LazyObject}
+        self.n_downloads = 0
+
+    @staticmethod
+    def _normalize(object_types):
+        """Returns a dict of {object type: set of names or None for all}"""
+        if type(object_types) == str:
+            return {object_types: None}
+        if type(object_types) == dict:
+            return {k: None if v is None else
+                    {v} if type(v) == str else set(v)
+                    for k, v in object_types.items()}
+        return {k: None for k in object_types}
+
+    def add(self, object_dict):
+        """Adds the requests in object_dict (see read_commons_data)"""
+        config = get_config()
+        for repo, object_types in object_dict.items():
+            if not config.get(repo):
+                raise ValueError(f'{repo} not found in config!')
+            req = self._normalize(object_types)
+            planned = self.requests.setdefault((repo, _api_path(req)), {})
+            for t, names in req.items():
+                if names is None or (t in planned and planned[t] is None):
+                    planned[t] = None
+                else:
+                    planned[t] = planned.get(t, set()) | names
+        return self
+
+    def _pending(self, key):
+        """Returns the part of the requests for key not yet parsed"""
+        parsed = self.parsed.get(key, {})
+        pending = {}
+        for t, names in self.requests[key].items():
+            if t in parsed and parsed[t] is None:
+                continue
+            if names is None:
+                pending[t] = None
+            elif names - parsed.get(t, set()):
+                pending[t] = names - parsed.get(t, set())
+        return pending
+
+    def fetch(self):
+        """Downloads and parses all pending requests"""
+        config = get_config()
+        for key in self.requests:
+            pending = self._pending(key)
+            if not pending:
+                continue
+            repo, path = key
+            if key not in self.archives:
+                if self.auth and self.token is None:
+                    self.token = login()
+                repo_data = config.get(repo)
+                print(f'Accessing API for {repo}')
+                resp = return_request(owner=repo_data.get('owner'),
+                                      repo=repo_data.get('repo'),
+                                      object_type=path,
+                                      token=self.token)
+                self.archives[key] = resp.content
+                self.n_downloads += 1
+            with zipfile.ZipFile(io.BytesIO(self.archives[key]), "r") as f:
+                objs = parse_entries(f.namelist(),
+                                     lambda name: read_json(f, name),
+                                     list(pending), search_objs=pending,
+                                     lazy=True)
+            stored = self.objects.setdefault(key, {})
+            for o in objs:
+                stored.setdefault((o._olca_class, o.id), o)
+            parsed = self.parsed.setdefault(key, {})
+            for t, names in pending.items():
+                parsed[t] = None if names is None else (
+                    parsed.get(t, set()) | names)
+
+    def read(self, object_dict, lazy=False):
+        """Returns objects for object_dict in the same form as
+        read_commons_data, fetching any requests not yet parsed"""
+        self.add(object_dict)
+        self.fetch()
+        type_map = {}
+        for obj_type, _, olca_class in entry_types:
+            type_map.setdefault(obj_type, set()).add(olca_class)
+        data_dict = {}
+        for repo, object_types in object_dict.items():
+            req = self._normalize(object_types)
+            key = (repo, _api_path(req))
+            objs = []
+            for (olca_class, _), o in self.objects.get(key, {}).items():
+                for t, names in req.items():
+                    if (olca_class in type_map.get(t, ()) and
+                            (names is None or o.name in names)):
+                        objs.append(o if lazy else o.materialize())
+                        break
+            data_dict[repo] = objs
+        return data_dict
+
+    def clear(self):
+        """Releases downloaded archives and parsed objects"""
+        self.requests = {}
+        self.parsed = {}
+        self.archives = {}
+        self.objects = {}
+
+def _get_commit_history(owner, repo, token):
+    """Returns the list of commits for the repo, or None if the history can
+    not be read."""
+    import requests
+    url = f'{commons_base}/ws/public/history/{owner}/{repo}'
+    cookies = {"JSESSIONID": token} if token else None
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/json"
+    }
+    try:
+        resp = transport.get(url, cookies=cookies, headers=headers)
+        if resp.status_code != 200:
+            return None
+        data = resp.json()
+    except (requests.exceptions.RequestException, json.JSONDecodeError):
+        return None
+    if isinstance(data, dict):
+        data = data.get('data', []) or data.get('commits', [])
+    return data if isinstance(data, list) else None
+
+def _get_commit_references(owner, repo, commit_id, token):
+    """Returns the list of objects changed in a single commit as dicts of
+    {'type': <model type>, 'id': <refId>, 'deleted': bool}, or None if the
+    references can not be read."""
+    import requests
+    url = (f'{commons_base}/'
+           f'ws/public/history/references/{owner}/{repo}/{commit_id}')
+    cookies = {"JSESSIONID": token} if token else None
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/json"
+    }
+    try:
+        resp = transport.get(url, cookies=cookies, headers=headers)
+        if resp.status_code != 200:
+            return None
+        data = resp.json()
+    except (requests.exceptions.RequestException, json.JSONDecodeError):
+        return None
+    if isinstance(data, dict):
+        data = data.get('data', []) or data.get('references', [])
+    refs = []
+    for r in data:
+        ref_type = r.get('type') or r.get('modelType')
+        ref_id = r.get('refId') or r.get('@id') or r.get('id')
+        if not ref_type or not ref_id:
+            return None
+        deleted = (r.get('deleted', False) or
+                   str(r.get('mode', '')).upper() == 'DELETE')
+        refs.append({'type': ref_type, 'id': ref_id, 'deleted': deleted})
+    return refs
+
+def get_changed_objects(owner, repo, since_commit, token=None):
+    """
+    Identifies the objects changed in a repo since since_commit.
+
+    Returns a dict of {(model type, refId): deleted} where the latest change
+    to each object wins, or None if the changes can not be determined and a
+    full download is required.
+    """
+    commits = _get_commit_history(owner, repo, token)
+    if not commits:
+        return None
+    commits = sorted(commits, key=lambda c: c.get('commitTimestamp', 0))
+    ids = [c.get('id') or c.get('commitId') for c in commits]
+    if since_commit not in ids:
+        # history does not reach back to the last sync
+        return None
+    changes = {}
+    for commit_id in ids[ids.index(since_commit) + 1:]:
+        refs = _get_commit_references(owner, repo, commit_id, token)
+        if refs is None:
+            return None
+        for r in refs:
+            changes[(r['type'], r['id'])] = r['deleted']
+    return changes
+
+def _read_sync_state(mirror_path):
+    import yaml
+    state_file = mirror_path / 'sync_state.yml'
+    if not state_file.exists():
+        return {}
+    with open(state_file, 'r') as file:
+        return yaml.safe_load(file) or {}
+
+def _write_sync_state(mirror_path, state):
+    import yaml
+    with open(mirror_path / 'sync_state.yml', 'w') as file:
+        yaml.safe_dump(state, file)
+
+def _get_mirror_object(owner, repo, object_type, refId, token):
+    """Returns the JSON-LD dict of a changed object, or None if the response
+    is not a valid object"""
+    import requests
+    try:
+        resp = _get_object_response(owner, repo, object_type, refId, token)
+        if resp.status_code != 200:
+            print(f'WARNING: {object_type} {refId} returned status code '
+                  f'{resp.status_code}')
+            return None
+        d = resp.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f'WARNING: {object_type} {refId} could not be read: {e}')
+        return None
+    if not isinstance(d, dict) or d.get('@id') != refId:
+        print(f'WARNING: {object_type} {refId} is not a valid object')
+        return None
+    return d
+
+def _full_sync(owner, repo, repo_path, object_types, token):
+    """Replaces the mirror for a repo with fresh archive downloads."""
+    if repo_path.exists():
+        for f in repo_path.rglob('*.json'):
+            f.unlink()
+    repo_path.mkdir(parents=True, exist_ok=True)
+    n = 0
+    for object_type in object_types:
+        resp = return_request(owner=owner, repo=repo,
+                              object_type=object_type, token=token)
+        with zipfile.ZipFile(io.BytesIO(resp.content), "r") as f:
+            for name in f.namelist():
+                if not name.endswith('.json'):
+                    continue
+                target = repo_path / name
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(f.read(name))
+                n += 1
+    return n
+
+def sync_repository(repo, mirror_path, auth=False, token=None,
+                    force_full=False):
+    """
+    Keeps a local mirror of a configured repo up to date. The mirror is a
+    folder of JSON-LD files in mirror_path / repo, and the last synced commit
+    is stored in mirror_path / 'sync_state.yml'.
+
+    When the repo has a newer commit, only objects changed since the last
+    sync are downloaded and patched into the mirror. A full download is used
+    on first sync, when force_full is True or when the changes can not be
+    determined. Changed objects are limited to the object_types of the repo
+    (and types already in the mirror). If any changed object can not be
+    downloaded, the stored commit is not advanced so the next sync retries.
+
+    Returns the head commit of the mirror
+    """
+    if token is None and auth:
+        token = login()
+    config = get_config()
+    repo_data = config.get(repo)
+    if not repo_data:
+        raise ValueError(f'{repo} not found in config!')
+    owner = repo_data.get('owner')
+    repo_name = repo_data.get('repo')
+    mirror_path = Path(mirror_path)
+    mirror_path.mkdir(parents=True, exist_ok=True)
+    repo_path = mirror_path / repo
+
+    state = _read_sync_state(mirror_path)
+    last_commit = state.get(repo, {}).get('commit')
+    head = get_recent_commits(token, owner, repo_name)
+    if head and head == last_commit and not force_full:
+        print(f'{repo} is up to date')
+        return head
+
+    object_types = repo_data.get('object_types', ['PROCESS'])
+    changes = None
+    if last_commit and repo_path.exists() and not force_full:
+        changes = get_changed_objects(owner, repo_name, last_commit, token)
+    if changes is None:
+        print(f'Downloading full repository for {repo}')
+        n = _full_sync(owner, repo_name, repo_path, object_types, token)
+        print(f'{n} objects written to {repo_path}')
+    else:
+        # model types of the configured object types, plus any type already
+        # in the mirror as a dependency of the full download
+        model_types = {t for o in object_types for t in sync_types.get(o, [o])}
+        model_types |= {t for t, folder in folder_map.items()
+                        if (repo_path / folder).exists()}
+        changes = {k: v for k, v in changes.items() if k[0] in model_types}
+        print(f'Updating {len(changes)} changed objects for {repo}')
+        failed = 0
+        for (object_type, ref_id), deleted in changes.items():
+            folder = folder_map.get(object_type)
+            if not folder:
+                print(f'WARNING: unknown object type {object_type}')
+                continue
+            target = repo_path / folder / f'{ref_id}.json'
+            if deleted:
+                target.unlink(missing_ok=True)
+                continue
+            d = _get_mirror_object(owner=owner, repo=repo_name,
+                                   object_type=object_type, refId=ref_id,
+                                   token=token)
+            if d is None:
+                failed += 1
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(json.dumps(d), encoding='utf-8')
+        if failed:
+            # keep the last synced commit so that the next sync retries
+            print(f'WARNING: {failed} objects could not be updated, {repo} '
+                  f'remains at commit {last_commit}')
+            return last_commit
+
+    state[repo] = {'commit': head,
+                   'synced': datetime.now().isoformat(timespec='seconds')}
+    _write_sync_state(mirror_path, state)
+    return head
+
+def read_mirror_data(object_dict, mirror_path, lazy=False):
+    """
+    Reads objects from a local mirror created by sync_repository. Takes the
+    same object_dict as read_commons_data and returns the same data_dict.
+    """
+    mirror_path = Path(mirror_path)
+    data_dict = {}
+    for repo, object_types in object_dict.items():
+        search_objs = {}
+        repo_path = mirror_path / repo
+        if not repo_path.exists():
+            raise FileNotFoundError(f'No mirror found for {repo}, '
+                                    'run sync_repository first')
+        if type(object_types) == dict:
+            search_objs = object_types.copy()
+            object_types = list(object_types.keys())
+        elif type(object_types) == str:
+            object_types = [object_types]
+        names = sorted(f.relative_to(repo_path).as_posix()
+                       for f in repo_path.rglob('*.json'))
+        data_dict[repo] = parse_entries(
+            names,
+            lambda name: json.loads((repo_path / name).read_text(encoding='utf-8')),
+            object_types, search_objs, lazy=lazy)
     return data_dict
 
 if __name__ == '__main__':
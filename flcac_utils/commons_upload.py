@@ -0,0 +1,236 @@
+"""
+Upload of JSON-LD archives (e.g. from write_objects) to a repository on the
+FLCAC. Archives are split into bounded batches which are sent concurrently
+with retry. Progress is kept in a local journal so that an interrupted upload
+resumes with the batches not yet accepted by the server.
+
+Experimental: the upload routes in endpoints are not part of the documented
+LCA Collaboration Server API and have not been verified against the FLCAC.
+They are only exercised against the local stand-in server in the tests. Set
+endpoints to the routes of the target server before uploading.
+"""
+
+import hashlib
+import io
+import json
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import flcac_utils.commons_api as api
+
+# endpoints relative to commons_api.commons_base, formatted with owner, repo
+# and upload_id. Placeholders, not verified against the Collaboration Server
+# API, see the module docstring
+endpoints = {
+    'start': '/ws/upload/{owner}/{repo}',
+    'batch': '/ws/upload/{owner}/{repo}/{upload_id}/{index}',
+    'commit': '/ws/upload/{owner}/{repo}/{upload_id}/commit',
+}
+
+# status codes for which a batch is sent again
+retry_status = {408, 429, 500, 502, 503, 504}
+
+
+def split_archive(zip_path, max_batch_bytes: int = 50 * 2 ** 20,
+                  members: list = None) -> list:
+    """
+    Groups the JSON-LD files in an archive into batches of at most
+    max_batch_bytes (compressed). Files larger than max_batch_bytes are sent
+    in a batch of their own.
+
+    :param members: list of member names to include, e.g. from archive_delta,
+        defaults to all files in the archive
+    :return: list of lists of member names
+    """
+    with zipfile.ZipFile(zip_path) as z:
+        infos = [i for i in z.infolist() if not i.is_dir()]
+    if members is not None:
+        keep = set(members)
+        infos = [i for i in infos if i.filename in keep]
+    batches = []
+    batch = []
+    size = 0
+    for info in infos:
+        if batch and size + info.compress_size > max_batch_bytes:
+            batches.append(batch)
+            batch = []
+            size = 0
+        batch.append(info.filename)
+        size += info.compress_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def archive_delta(zip_path, previous_zip) -> list:
+    """Returns the members of zip_path that are not in previous_zip or whose
+    content differs, to upload only the changes of an incremental build"""
+    with zipfile.ZipFile(previous_zip) as z:
+        previous = {i.filename: (i.CRC, i.file_size) for i in z.infolist()}
+    with zipfile.ZipFile(zip_path) as z:
+        return [i.filename for i in z.infolist() if not i.is_dir() and
+                previous.get(i.filename) != (i.CRC, i.file_size)]
+
+
+def _batch_content(zip_path, names) -> bytes:
+    """Writes the members in names to a new zip archive in memory"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_path) as src, \
+            zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as dst:
+        for name in names:
+            dst.writestr(src.getinfo(name), src.read(name),
+                         compress_type=zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+
+def _fingerprint(zip_path, batches) -> str:
+    """Identifies an archive and its batches, so that a journal is only
+    resumed for the same upload"""
+    stat = Path(zip_path).stat()
+    key = json.dumps([stat.st_size, stat.st_mtime_ns, batches])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _read_journal(journal_path) -> dict:
+    if not journal_path.exists():
+        return {}
+    with open(journal_path, 'r') as f:
+        return json.load(f)
+
+
+def _write_journal(journal_path, journal):
+    tmp = journal_path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(journal, f, indent=2)
+    tmp.replace(journal_path)
+
+
+def _post(url, retries, backoff, **kwargs):
+    """Sends a POST through the commons_api transport, retrying on
+    connection errors and retry_status responses"""
+    import requests
+    for attempt in range(retries + 1):
+        try:
+            resp = api.transport.post(url, **kwargs)
+            if resp.status_code not in retry_status:
+                return resp
+            error = f'status code {resp.status_code}'
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+    raise RuntimeError(f'POST {url} failed after {retries + 1} attempts: '
+                       f'{error}')
+
+
+def upload_archive(repo, zip_path, message: str, auth=False, token=None,
+                   members: list = None,
+                   max_batch_bytes: int = 50 * 2 ** 20,
+                   workers: int = 4,
+                   retries: int = 3,
+                   backoff: float = 1.0,
+                   journal_path=None):
+    """
+    Uploads a JSON-LD archive to a configured repo and commits it with
+    message. Batches accepted by the server are recorded in a journal, by
+    default next to the archive, and are skipped when the upload is run again
+    after a failure. The journal is removed once the commit is confirmed.
+
+    :param repo: str, repo name in repos.yml
+    :param members: list of member names to upload, e.g. from archive_delta,
+        defaults to the full archive
+    :param max_batch_bytes: int, upper bound on the compressed size of each
+        batch, see split_archive
+    :param workers: int, number of batches sent at the same time
+    :param retries: int, number of times a failed batch is sent again
+    :param backoff: float, seconds to wait before the first retry, doubled
+        for each further retry
+    :return: the head commit of the repo after the upload
+    """
+    print('WARNING: upload_archive is experimental, the upload endpoints '
+          'have not been verified against the FLCAC')
+    if token is None and auth:
+        token = api.login()
+    repo_data = api.get_config().get(repo)
+    if not repo_data:
+        raise ValueError(f'{repo} not found in config!')
+    owner = repo_data.get('owner')
+    repo_name = repo_data.get('repo')
+    zip_path = Path(zip_path)
+    if journal_path is None:
+        journal_path = zip_path.with_name(f'{zip_path.stem}.upload.json')
+    journal_path = Path(journal_path)
+    cookies = {"JSESSIONID": token} if token else None
+    base = api.commons_base
+    fmt = {'owner': owner, 'repo': repo_name}
+
+    batches = split_archive(zip_path, max_batch_bytes, members)
+    if not batches:
+        print(f'No objects to upload to {repo}')
+        return None
+    fingerprint = _fingerprint(zip_path, batches)
+    journal = _read_journal(journal_path)
+    if journal.get('fingerprint') != fingerprint:
+        resp = _post(f'{base}{endpoints["start"].format(**fmt)}',
+                     retries, backoff, cookies=cookies,
+                     json={'batches': len(batches)})
+        if resp.status_code != 200:
+            raise RuntimeError(f'Upload to {repo} could not be started: '
+                               f'{resp.status_code} {resp.text}')
+        journal = {'fingerprint': fingerprint,
+                   'upload_id': resp.json()['uploadId'],
+                   'head': api.get_recent_commits(token, owner, repo_name),
+                   'done': []}
+        _write_journal(journal_path, journal)
+    else:
+        print(f'Resuming upload to {repo}, {len(journal["done"])} of '
+              f'{len(batches)} batches already sent')
+    fmt['upload_id'] = journal['upload_id']
+    lock = threading.Lock()
+
+    def send(index):
+        content = _batch_content(zip_path, batches[index])
+        headers = {'Content-Type': 'application/zip',
+                   'X-Batch-Sha1': hashlib.sha1(content).hexdigest()}
+        url = f'{base}{endpoints["batch"].format(index=index, **fmt)}'
+        resp = _post(url, retries, backoff, data=content, headers=headers,
+                     cookies=cookies)
+        if resp.status_code != 200:
+            raise RuntimeError(f'Batch {index} was rejected: '
+                               f'{resp.status_code} {resp.text}')
+        with lock:
+            journal['done'].append(index)
+            _write_journal(journal_path, journal)
+
+    pending = [i for i in range(len(batches)) if i not in journal['done']]
+    # send the largest batches (in compressed bytes) first so that they do
+    # not finish last
+    with zipfile.ZipFile(zip_path) as z:
+        size = {i.filename: i.compress_size for i in z.infolist()}
+    pending.sort(key=lambda i: -sum(size[n] for n in batches[i]))
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(send, i) for i in pending]
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                errors.append(future.exception())
+    if errors:
+        raise RuntimeError(f'{len(errors)} of {len(batches)} batches failed, '
+                           f'run again to resume: {errors[0]}')
+
+    resp = _post(f'{base}{endpoints["commit"].format(**fmt)}', retries,
+                 backoff, cookies=cookies,
+                 json={'message': message, 'batches': len(batches)})
+    if resp.status_code != 200:
+        raise RuntimeError(f'Upload to {repo} could not be committed: '
+                           f'{resp.status_code} {resp.text}')
+    head = api.get_recent_commits(token, owner, repo_name)
+    if head is None or head == journal['head']:
+        raise RuntimeError(f'Commit to {repo} could not be confirmed, '
+                           f'head is {head}')
+    journal_path.unlink(missing_ok=True)
+    print(f'Uploaded {len(batches)} batches to {repo}, commit {head}')
+    return head
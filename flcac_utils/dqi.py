@@ -0,0 +1,174 @@
+"""
+Data quality indicator (DQI) scores held as an integer matrix with one row
+per exchange (or process) and one column per indicator, for bulk operations
+on pedigree strings such as "(1;2;3;2;2)"
+"""
+
+import numpy as np
+import pandas as pd
+import olca_schema as olca
+
+
+class DQIArray:
+    """
+    Matrix of DQI scores (rows x indicators). A score of 0 marks a missing
+    value, written as an empty entry e.g. "(1;;3;2;2)".
+
+    :param scores: 2D array-like of integer scores
+    """
+
+    def __init__(self, scores):
+        self.scores = np.atleast_2d(np.asarray(scores, dtype=np.int8))
+
+    @classmethod
+    def from_strings(cls, values, n_indicators: int = None) -> 'DQIArray':
+        """
+        Parses DQI strings. Each distinct string is parsed once. Missing
+        values (None, NaN, '') give rows of missing scores.
+
+        :param values: list or Series of DQI strings
+        :param n_indicators: int, optional, number of indicators expected,
+            defaults to the longest entry
+        """
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        parsed = [[int(v) if v.strip() else 0
+                   for v in str(s).strip().strip('()').split(';')]
+                  if str(s).strip() else [] for s in uniques]
+        width = max([len(p) for p in parsed] + [n_indicators or 0])
+        if n_indicators is not None and width > n_indicators:
+            raise ValueError(f'DQI entries with more than {n_indicators} '
+                             'indicators')
+        table = np.zeros((len(parsed) + 1, width), dtype=np.int8)
+        for i, p in enumerate(parsed):
+            table[i, :len(p)] = p
+        # the last row is used for missing values, code -1
+        return cls(table[codes])
+
+    def to_strings(self) -> np.ndarray:
+        """Formats each row as a DQI string, formatting each distinct row
+        once. Rows with all scores missing are returned as None."""
+        if self.n_indicators <= 8:
+            # pack each row of scores into one integer to find distinct rows
+            packed = (self.scores.astype(np.int64) <<
+                      (8 * np.arange(self.n_indicators))).sum(axis=1)
+            inverse = pd.factorize(packed)[0]
+            first = np.unique(inverse, return_index=True)[1]
+            uniques = self.scores[first]
+        else:
+            uniques, inverse = np.unique(self.scores, axis=0,
+                                         return_inverse=True)
+        formatted = np.array(
+            [None if not row.any() else
+             '(' + ';'.join(str(v) if v else '' for v in row) + ')'
+             for row in uniques], dtype=object)
+        return formatted[inverse.ravel()]
+
+    def to_series(self, index=None) -> pd.Series:
+        return pd.Series(self.to_strings(), index=index, dtype=object)
+
+    def __len__(self):
+        return self.scores.shape[0]
+
+    def __getitem__(self, key) -> 'DQIArray':
+        return DQIArray(self.scores[key])
+
+    def __eq__(self, other):
+        return (isinstance(other, DQIArray) and
+                np.array_equal(self.scores, other.scores))
+
+    @property
+    def n_indicators(self) -> int:
+        return self.scores.shape[1]
+
+    def increment(self, pos: int, by: int = 1, mask=None,
+                  max_score: int = 5) -> 'DQIArray':
+        """
+        Adds by to the indicator at pos (1-based, as in increment_dqi_value)
+        for all rows, or rows where mask is True. Missing scores are left
+        missing and results are clamped to 1..max_score.
+        """
+        if not 1 <= pos <= self.n_indicators:
+            raise IndexError("Position is out of range")
+        scores = self.scores.copy()
+        col = scores[:, pos - 1]
+        rows = col > 0 if mask is None else (col > 0) & np.asarray(mask)
+        col[rows] = np.clip(col[rows] + by, 1, max_score)
+        return DQIArray(scores)
+
+    def clamp(self, lower: int = 1, upper: int = 5) -> 'DQIArray':
+        """Limits non-missing scores to lower..upper"""
+        scores = np.where(self.scores > 0,
+                          np.clip(self.scores, lower, upper), 0)
+        return DQIArray(scores)
+
+    def aggregate(self, groups, method: str = 'worst', weights=None
+                  ) -> tuple:
+        """
+        Aggregates rows to one row per group, e.g. exchange scores to a
+        process level dqEntry. Missing scores are ignored.
+
+        :param groups: array-like group label for each row, e.g. ProcessID
+        :param method: 'worst' for the highest score of each indicator, or
+            'weighted' for the weighted mean score rounded to an integer
+        :param weights: array-like, weight of each row for 'weighted', e.g.
+            absolute exchange amounts, defaults to equal weights
+        :return: tuple of (group labels, DQIArray)
+        """
+        codes, labels = pd.factorize(pd.Series(groups, dtype=object))
+        n = len(labels)
+        scores = self.scores.astype(float)
+        if method == 'worst':
+            out = np.zeros((n, self.n_indicators))
+            for j in range(self.n_indicators):
+                np.maximum.at(out[:, j], codes, scores[:, j])
+        elif method == 'weighted':
+            w = (np.ones(len(self)) if weights is None
+                 else np.abs(np.asarray(weights, dtype=float)))
+            w = w[:, None] * (scores > 0)
+            total = np.zeros((n, self.n_indicators))
+            weight = np.zeros((n, self.n_indicators))
+            np.add.at(total, codes, scores * w)
+            np.add.at(weight, codes, w)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out = np.where(weight > 0, total / weight, 0)
+            # round half up so that a tie is scored as the worse value,
+            # ignoring floating point error in the weighted mean
+            out = np.floor(np.round(out, 9) + 0.5)
+        else:
+            raise ValueError("method must be 'worst' or 'weighted'")
+        return labels.to_numpy(), DQIArray(out)
+
+    def validate(self, dq_system: olca.DQSystem):
+        """
+        Raises a ValueError if the number of indicators or any score does not
+        match the indicators and scores defined in dq_system
+        """
+        indicators = sorted(dq_system.indicators or [],
+                            key=lambda i: i.position or 0)
+        if len(indicators) != self.n_indicators:
+            raise ValueError(f'DQI entries have {self.n_indicators} '
+                             f'indicators, {dq_system.name} has '
+                             f'{len(indicators)}')
+        for j, indicator in enumerate(indicators):
+            n_scores = len(indicator.scores or [])
+            if (self.scores[:, j] > n_scores).any():
+                raise ValueError(f'DQI scores above {n_scores} for '
+                                 f'{indicator.name}')
+
+
+def aggregate_process_dqi(df: pd.DataFrame, method: str = 'worst',
+                          weighted_by_amount: bool = False) -> pd.Series:
+    """
+    Returns a process level dqEntry string for each ProcessID from the
+    exchange_dqi column of an exchange DataFrame (see exchange_schema).
+
+    :param method: str, see DQIArray.aggregate
+    :param weighted_by_amount: bool, for method 'weighted', weights exchanges
+        by their absolute amount rather than equally
+    """
+    dqi = DQIArray.from_strings(df['exchange_dqi'])
+    weights = df['amount'] if weighted_by_amount else None
+    labels, scores = dqi.aggregate(df['ProcessID'], method=method,
+                                   weights=weights)
+    return pd.Series(scores.to_strings(), index=labels, name='dq_entry',
+                     dtype=object)
@@ -2,14 +2,17 @@
 # !pip install olca-schema
 
 
+import json
 import olca_schema as olca
 import olca_schema.zipio as zipio #for writing to json
 import olca_schema.units as units
 from datetime import datetime, time
 from typing import List
+import numpy as np
 import pandas as pd
-from esupy.util import make_uuid
-from esupy.location import olca_location_meta
+from flcac_utils.dqi import DQIArray
+from flcac_utils.uuids import cached_uuid, make_uuids
+from flcac_utils.unit_conversion import unit_dict, unknown_units
 from pathlib import Path
 
 
@@ -37,11 +40,6 @@ exchange_schema = {
     # "tag": {'dtype': 'str', 'required': False}
 }
 
-# convert units to units in olca_schema.units
-unit_dict = {
-    "metric ton": "ton"
-}
-
 
 def _set_base_attributes(
         entity,
@@ -49,7 +47,7 @@ def _set_base_attributes(
         ):
     """Sets base attributes for new flows."""
     if (entity.id is None) or (entity.id == ''):
-        entity.id = make_uuid(name)
+        entity.id = cached_uuid(name)
     if entity.name is None:
         entity.name = name
     #entity.version = '00.00.001'
@@ -71,8 +69,7 @@ def validate_exchange_data(df):
             raise ValueError(f'ERROR: Missing data in {c}')
 
     ## validate units align with olca
-    x = {u: units.unit_ref(u) for u in set(df['unit'])}
-    keys = [k for k,v in x.items() if v is None]
+    keys = unknown_units(df['unit'])
     if keys:
         raise ValueError('Incorrect units present in exchange data: ',
                          f'{", ".join(keys)}')
@@ -103,16 +100,92 @@ def validate_reference_default_provider(df: pd.DataFrame) -> List[str]:
     return df.loc[violations_mask, 'ProcessName'].astype(str).tolist()
 
 
+def consolidate_exchanges(df: pd.DataFrame,
+                          dqi_method: str = 'worst',
+                          weighted_by_amount: bool = True,
+                          sep: str = '; '
+                          ) -> pd.DataFrame:
+    """
+    Merges rows of exchange data for the same process, flow, direction, unit
+    and default provider (e.g. emissions reported per source) into a single
+    exchange before build_process_dict. Amounts are summed, distinct
+    descriptions are joined with sep and exchange_dqi is merged with
+    dqi.DQIArray.aggregate. Other columns are taken from the first row.
+
+    :param df: DataFrame of process and exchange data; see exchange_schema
+    :param dqi_method: str, 'worst' or 'weighted', see DQIArray.aggregate
+    :param weighted_by_amount: bool, for dqi_method 'weighted', weights rows
+        by their absolute amount rather than equally
+    :return: DataFrame with one row per exchange
+    """
+    keys = [c for c in ['ProcessID', 'ProcessName', 'FlowUUID', 'IsInput',
+                        'reference', 'avoided_product', 'unit',
+                        'default_provider', 'location'] if c in df.columns]
+    # treat missing and empty keys (e.g. no default provider) the same
+    key_df = df[keys].astype(object).fillna('')
+    codes = key_df.groupby(keys, sort=False).ngroup().to_numpy()
+    n = codes.max() + 1 if len(codes) else 0
+    if n == len(df):
+        print('No duplicate exchanges to consolidate')
+        return df
+    out = df.loc[~pd.Series(codes).duplicated().to_numpy()].copy()
+    out['amount'] = np.bincount(codes, weights=df['amount'].to_numpy(float),
+                                minlength=n)
+    size = np.bincount(codes, minlength=n)
+    merged = size > 1
+    rows = np.isin(codes, np.flatnonzero(merged))
+    if 'description' in df.columns:
+        desc = (df.loc[rows, 'description'].astype(object)
+                .groupby(codes[rows], sort=True)
+                .agg(lambda s: sep.join(dict.fromkeys(
+                    v for v in s if isinstance(v, str) and v.strip()))
+                     or None))
+        out.loc[out.index[merged], 'description'] = desc.to_numpy()
+    if 'exchange_dqi' in df.columns and df['exchange_dqi'].notna().any():
+        weights = (df.loc[rows, 'amount'] if weighted_by_amount else None)
+        labels, dqi = DQIArray.from_strings(
+            df.loc[rows, 'exchange_dqi']).aggregate(
+                codes[rows], method=dqi_method, weights=weights)
+        out['exchange_dqi'] = out['exchange_dqi'].astype(object)
+        out.loc[out.index[labels.astype(int)], 'exchange_dqi'] = \
+            dqi.to_strings()
+    print(f'Consolidated {len(df)} exchanges to {len(out)} '
+          f'({1 - len(out) / len(df):.1%} fewer)')
+    return out.reset_index(drop=True)
+
+
+def _fragment_key(k, v):
+    """Returns a hashable key for metadata item k with value v"""
+    try:
+        hash(v)
+        return (k, v)
+    except TypeError:
+        return (k, json.dumps(v, sort_keys=True, default=str))
+
+
 def get_process_metadata(p: olca.Process,
                          metadata: dict,
+                         fragments: dict = None,
                          **kwargs
                          ) -> olca.Process:
     """Generates and attaches process metadata to olca.Process p.
     kwargs may contain "source_objs", "actor_objs" which are dictionaries
     of olca objects with names as keys
+
+    :param fragments: dict, optional, shared across calls so that each
+        distinct metadata value (e.g. descriptions, source and actor refs) is
+        created once and the same object attached to every process using it
     """
     pdoc = olca.ProcessDocumentation()
     for k, v in metadata.items():
+        if fragments is not None:
+            key = _fragment_key(k, v)
+            if key in fragments:
+                v = fragments[key]
+                if k in dir(p):
+                    setattr(p, k, v)
+                setattr(pdoc, k, v)
+                continue
         if k in dir(p):
             # some metadata items attach directly to the process
             setattr(p, k, v)
@@ -156,6 +229,8 @@ def get_process_metadata(p: olca.Process,
                     rev.report = s
             rev_list.append(rev)
             v = rev_list
+        if fragments is not None:
+            fragments[key] = v
         setattr(pdoc, k, v)
     if 'creation_date' not in metadata.keys():
         # Set to noon local time
@@ -178,7 +253,11 @@ def make_exchanges(
     if not process_db:
         process_db = pd.DataFrame()
     exch_lst = []
-    for index, row in df.query('ProcessName==@p.name').iterrows():
+    df = df.query('ProcessName==@p.name')
+    # look up the unit and flow property refs once for each unit
+    unit_refs = {u: (units.unit_ref(u), units.property_ref(u))
+                 for u in df['unit'].unique()}
+    for index, row in df.iterrows():
         e = olca.Exchange()
         e.flow = flows[row['FlowUUID']].to_ref()
         e.is_quantitative_reference = bool(row['reference'])
@@ -186,10 +265,9 @@ def make_exchanges(
         e.amount = row['amount']
         e.description = row.get('description')
         e.is_avoided_product = bool(row.get('avoided_product', False))
-        e.unit = units.unit_ref(row['unit'])
-        # ^^ needs to be a Ref not a str
-        e.flow_property = units.property_ref(row['unit'])
-        # ^^ required when it is not the reference flow property of the flow
+        e.unit, e.flow_property = unit_refs[row['unit']]
+        # ^^ unit needs to be a Ref not a str; flow property is required
+        # when it is not the reference flow property of the flow
         if 'exchange_dqi' in row and p.exchange_dq_system is not None:
             e.dq_entry = row['exchange_dqi']
         if 'default_provider' in row and (pd.notna(row['default_provider']) and
@@ -312,6 +390,7 @@ def build_flow_dict(df: pd.DataFrame,
 def build_process_dict(df: pd.DataFrame,
                        flows: dict[str, olca.Flow],
                        meta: dict[str, str],
+                       process_meta: dict[str, dict] = None,
                        **kwargs
                        ) -> dict:
     """
@@ -319,7 +398,12 @@ def build_process_dict(df: pd.DataFrame,
 
     :param df: DataFrame of process and exchange data; see exchange_schema
     :param flows: dict of olca.Flow objects with UUID as dictionary key
-    :param meta:
+    :param meta: dict of metadata applied to all processes
+    :param process_meta: dict where the key is the process name and the value
+        is a dict of metadata for that process, e.g. from
+        metadata.read_tabular_metadata. Entries are added to (or replace)
+        those in meta; empty values fall back to meta. Identical values are
+        shared between processes rather than copied.
     :kwargs:
         loc_objs: dict[str, olca.Location]
         source_objs: dict[str, olca.Source]
@@ -347,16 +431,20 @@ def build_process_dict(df: pd.DataFrame,
     # Create Dictionary of all processes
     # https://greendelta.github.io/olca-ipc.py/olca/schema.html#olca.schema.Process
     processes = {}
+    fragments = {}
     print('Creating Dictionary of processes\n')
     cols = [c for c in ['ProcessID', 'ProcessCategory', 'ProcessName', 'location']
             if c in df.columns]
-    for i, row in df[cols].drop_duplicates().iterrows():
+    df_p = df[cols].drop_duplicates()
+    if 'ProcessID' not in cols:
+        df_p = df_p.assign(ProcessID = make_uuids(df_p['ProcessName']))
+    for i, row in df_p.iterrows():
         name = row['ProcessName']
         print(name)
         p0 = olca.Process()
         p0 = _set_base_attributes(p0, name)
         # Make sure UUID is always set based on process name so it never changes
-        p0.id = make_uuid(name) if 'ProcessID' not in cols else row['ProcessID']
+        p0.id = row['ProcessID']
         p0.process_type = olca.ProcessType.UNIT_PROCESS
         p0.category = row['ProcessCategory']
         p0.default_allocation_method = olca.AllocationType.PHYSICAL_ALLOCATION
@@ -373,7 +461,12 @@ def build_process_dict(df: pd.DataFrame,
             p0.exchange_dq_system = dq.to_ref() if dq else None
 
         # print('Creating Metadata for Process', p)
-        p0 = get_process_metadata(p = p0, metadata = meta, **kwargs)
+        metadata = meta
+        if process_meta and name in process_meta:
+            metadata = {**meta, **{k: v for k, v in process_meta[name].items()
+                                   if not (isinstance(v, str) and v == '')}}
+        p0 = get_process_metadata(p = p0, metadata = metadata,
+                                  fragments = fragments, **kwargs)
         print('Creating Exchanges for Process', name)
         p0 = make_exchanges(p = p0, df = df,
                             flows = flows,
@@ -394,6 +487,7 @@ def build_location_dict(df: pd.DataFrame,
     :param locations: dictionary of geoJsons with loc code as key
     :return: dict of olca.Location objects with ISO-code as dictionary key
     """
+    from esupy.location import olca_location_meta
     loc_objs = {}
     print('Creating dictionary of Locations...')
 
@@ -2,22 +2,94 @@
 Mapping functions
 """
 
+import ast
+import hashlib
+import operator
+import pickle
 import pandas as pd
 import numpy as np
+from pathlib import Path
+from datetime import datetime
 
-from esupy.util import make_uuid
+from flcac_utils.uuids import make_uuids
+from flcac_utils.unit_conversion import check_conversion_factors
+from flcac_utils.commons_api import get_config, get_recent_commits, login, \
+    LazyObject
 from flcac_utils.util import extract_flows, extract_processes
+from flcac_utils.name_index import NameIndex
 
-def prepare_tech_flow_mappings(df, auth=False):
+def _hash_mapping(df) -> str:
+    """Returns a hash of the contents of a mapping file"""
+    h = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values)
+    h.update(','.join(df.columns).encode())
+    return h.hexdigest()[:20]
+
+def _extract_cached(df, f_dict, p_dict, cache_path, auth, lazy, plan):
+    """
+    Returns flow_objs and provider_dict as in prepare_tech_flow_mappings,
+    reusing objects cached in cache_path for repos whose head commit has not
+    changed since they were cached for this mapping file.
+    """
+    cache_path = Path(cache_path)
+    cache_path.mkdir(parents=True, exist_ok=True)
+    cache_file = cache_path / f'tech_mapping_{_hash_mapping(df)}.pkl'
+    cache = {}
+    if cache_file.exists():
+        with open(cache_file, 'rb') as f:
+            cache = pickle.load(f)
+    token = login() if auth else None
+    config = get_config()
+    for repo in list(f_dict) + [r for r in p_dict if r not in f_dict]:
+        repo_data = config.get(repo)
+        if not repo_data:
+            raise ValueError(f'{repo} not found in config!')
+        commit = get_recent_commits(token, repo_data.get('owner'),
+                                    repo_data.get('repo'))
+        if commit and cache.get(repo, {}).get('commit') == commit:
+            print(f'Using cached mapping objects for {repo}')
+            continue
+        cache[repo] = {
+            'commit': commit,
+            'flows': extract_flows({repo: f_dict[repo]} if repo in f_dict
+                                   else {}, add_tags=False, auth=auth,
+                                   lazy=lazy, plan=plan),
+            'providers': extract_processes({repo: p_dict[repo]} if repo in p_dict
+                                           else {}, to_ref=True, auth=auth,
+                                           plan=plan),
+            }
+    with open(cache_file, 'wb') as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # combine in the same order as a single call to extract_flows
+    flow_objs = {}
+    for repo in f_dict:
+        flow_objs.update(cache[repo]['flows'])
+    if not lazy:
+        flow_objs = {k: v.materialize() if isinstance(v, LazyObject) else v
+                     for k, v in flow_objs.items()}
+    provider_dict = {}
+    for repo in p_dict:
+        provider_dict.update(cache[repo]['providers'])
+    return flow_objs, provider_dict
+
+def prepare_tech_flow_mappings(df, auth=False, lazy=False, plan=None,
+                               cache_path=None):
     """
     Prepares data objects from a technosphere flow mapping file
 
     :param df: technosphere flow mapping file see format_specs/tech_mapping.md
     :param auth: bool, if authorized access to FLCAC is required set to True
+    :param lazy: bool, if True flow_objs are LazyObject proxies that are only
+        converted to olca Flows when attributes other than id, name or
+        category are needed
+    :param plan: CommonsRequestPlan, optional, shares downloads with other
+        requests in the same build
+    :param cache_path: Path, optional, folder in which flow_objs and
+        provider_dict are cached by mapping file and repo head commit
 
     Returns:
-        flow_dict: dict where the key is the source flow name and the value is a
-            dictionary of data on the target flow with the following keys:
+        flow_dict: dict where the key is the source flow name (with the
+            MatchCondition in brackets for conditional mappings) and the value
+            is a dictionary of data on the target flow with the following keys:
                 BRIDGE
                 name
                 provider
@@ -26,13 +98,22 @@ def prepare_tech_flow_mappings(df, auth=False):
                 unit
                 bridge_flow_name
                 id
+                source (if MatchCondition is in df)
+                condition (if MatchCondition is in df)
         flow_objs: dict where the key is the soure flow name and the value is the
             olca Flow object extracted from the FLCAC
         provider_dict: dict where the key is the...
     """
+    ## Check conversion factors where source and target units are comparable
+    if {'SourceUnit', 'TargetUnit', 'ConversionFactor'}.issubset(df.columns):
+        for _, row in check_conversion_factors(df).iterrows():
+            print(f'WARNING: ConversionFactor for {row["SourceFlowName"]} '
+                  f'({row["SourceUnit"]} to {row["TargetUnit"]}) is '
+                  f'{row["ConversionFactor"]}, expected {row["ExpectedFactor"]:g}')
+
     ## Identify mappings for technosphere flows
     df = df.replace(np.nan, None)
-    flow_dict = {row['SourceFlowName']:
+    flow_dict = {rule_key(row['SourceFlowName'], row.get('MatchCondition')):
         {'BRIDGE': False if pd.isna(row.get('Bridge')) else row.get('Bridge'),
          'bridge_flow_name': row['BridgeFlowName'] if row.get('BridgeFlowName') else np.nan,
          'name': row['TargetFlowName'],
@@ -41,6 +122,14 @@ def prepare_tech_flow_mappings(df, auth=False):
          'conversion': row['ConversionFactor'],
          'unit': row['TargetUnit']} for _, row in df.iterrows()}
         ## swap the flow names for bridge processes?
+    if 'MatchCondition' in df:
+        # conditional mappings, see match_tech_flow_rules
+        for _, row in df.iterrows():
+            v = flow_dict[rule_key(row['SourceFlowName'], row['MatchCondition'])]
+            v['source'] = row['SourceFlowName']
+            v['condition'] = row['MatchCondition']
+            if v['condition']:
+                parse_match_condition(v['condition'])
     
     ## extract flow objects in flow_dict from commons via API
     f_dict = {}
@@ -59,8 +148,15 @@ def prepare_tech_flow_mappings(df, auth=False):
                 else:
                     p_dict[repo] = [v['provider']]
     
-    flow_objs = extract_flows(f_dict, add_tags=False, auth=auth) # don't add tags, all flows are internal
-    provider_dict = extract_processes(p_dict, to_ref=True, auth=auth)
+    if cache_path is not None:
+        flow_objs, provider_dict = _extract_cached(
+            df, f_dict, p_dict, cache_path, auth=auth, lazy=lazy, plan=plan)
+    else:
+        # don't add tags, all flows are internal
+        flow_objs = extract_flows(f_dict, add_tags=False, auth=auth, lazy=lazy,
+                                  plan=plan)
+        provider_dict = extract_processes(p_dict, to_ref=True, auth=auth,
+                                          plan=plan)
     
     for k, v in flow_dict.items():
         if not flow_dict[k].get('BRIDGE'):
@@ -74,13 +170,251 @@ def prepare_tech_flow_mappings(df, auth=False):
     
     return (flow_dict, flow_objs, provider_dict)
 
-def apply_tech_flow_mapping(df, flow_dict, flow_objs, provider_dict, cond=None) -> pd.DataFrame:
+def suggest_tech_flow_mappings(df, index=None, limit=3, auth=False
+                               ) -> pd.DataFrame:
+    """
+    Identifies TargetFlowName and Provider entries in a technosphere flow
+    mapping file that do not exactly match an object in the TargetRepoName,
+    and suggests ranked candidates for each.
+
+    :param df: technosphere flow mapping file see format_specs/tech_mapping.md
+    :param index: NameIndex, optional, if not passed an index is built from
+        the flows and processes of all target repos
+    :param limit: int, maximum number of suggestions per entry
+    :param auth: bool, if authorized access to FLCAC is required set to True
+    Returns a DataFrame with one row per suggestion
+    """
+    df = df.query('TargetRepoName.notna()')
+    if index is None:
+        index = NameIndex.from_commons(df['TargetRepoName'].unique(), auth=auth)
+    checks = [('TargetFlowName', 'Flow')]
+    if 'Provider' in df:
+        checks.append(('Provider', 'Process'))
+    frames = []
+    for field, object_type in checks:
+        d = (df[['SourceFlowName', 'TargetRepoName', field]]
+             .dropna()
+             .rename(columns={field: 'Query'})
+             .drop_duplicates())
+        d = d[[not index.contains(q, repo=r) for q, r
+               in zip(d['Query'], d['TargetRepoName'])]]
+        if len(d) == 0:
+            continue
+        print(f'{len(d)} unmatched entries for {field}')
+        s = (index.search_many(d['Query'].tolist(), limit=limit,
+                               repos=d['TargetRepoName'].tolist(),
+                               object_type=object_type)
+             .rename(columns={'CandidateRepo': 'TargetRepoName'})
+             .drop_duplicates(['Query', 'TargetRepoName', 'Rank']))
+        frames.append(d.assign(Field=field)
+                      .merge(s, how='left', on=['Query', 'TargetRepoName']))
+    cols = ['SourceFlowName', 'Field', 'TargetRepoName', 'Query', 'Rank',
+            'Candidate', 'CandidateType', 'Score']
+    if not frames:
+        return pd.DataFrame(columns=cols)
+    return pd.concat(frames, ignore_index=True)[cols]
+
+def rule_key(source, condition=None) -> str:
+    """Returns the flow_dict key for a mapping of source flow name under the
+    MatchCondition, if any"""
+    if condition is None or pd.isna(condition) or condition == '':
+        return source
+    return f'{source} [{condition}]'
+
+# operators supported in MatchCondition expressions
+_compare_ops = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    }
+_allowed_nodes = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp,
+                  ast.Not, ast.Compare, ast.In, ast.NotIn, ast.Name,
+                  ast.Constant, ast.List, ast.Tuple, ast.Load,
+                  *_compare_ops.keys())
+
+def parse_match_condition(expr: str, columns=None) -> ast.Expression:
+    """
+    Parses a MatchCondition expression, e.g.
+        ProcessName == 'Diesel truck' and location in ['US', 'CA']
+        Year >= 2020
+    Names refer to columns in the exchange dataframe, values must be literals.
+    Supported are comparisons, `in`/`not in` with lists, `and`, `or`, `not`.
+    If columns are passed, names are checked against them.
+    """
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f'Invalid MatchCondition: {expr}') from e
+    for node in ast.walk(tree):
+        if not isinstance(node, _allowed_nodes):
+            raise ValueError(f'Unsupported {type(node).__name__} in '
+                             f'MatchCondition: {expr}')
+        if (columns is not None and isinstance(node, ast.Name)
+                and node.id not in columns):
+            raise KeyError(f"'{node.id}' in MatchCondition not found in "
+                           "dataframe")
+    return tree
+
+def _eval_node(node, df):
+    if isinstance(node, ast.Expression):
+        return _eval_node(node.body, df)
+    if isinstance(node, ast.Name):
+        return df[node.id]
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_eval_node(e, df) for e in node.elts]
+    if isinstance(node, ast.BoolOp):
+        values = [np.asarray(_eval_node(v, df), dtype=bool) for v in node.values]
+        f = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return f.reduce(values)
+    if isinstance(node, ast.UnaryOp):
+        return ~np.asarray(_eval_node(node.operand, df), dtype=bool)
+    if isinstance(node, ast.Compare):
+        mask = np.ones(len(df), dtype=bool)
+        left = _eval_node(node.left, df)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _eval_node(comparator, df)
+            if isinstance(op, (ast.In, ast.NotIn)):
+                m = pd.Series(left, index=df.index).isin(right).to_numpy()
+                m = ~m if isinstance(op, ast.NotIn) else m
+            else:
+                m = np.asarray(_compare_ops[type(op)](left, right), dtype=bool)
+            mask &= m
+            left = right
+        return mask
+
+def evaluate_match_condition(expr: str, df: pd.DataFrame) -> np.ndarray:
+    """Returns a boolean array for the rows of df meeting the MatchCondition"""
+    tree = parse_match_condition(expr, columns=df.columns)
+    mask = _eval_node(tree, df)
+    return np.broadcast_to(np.asarray(mask, dtype=bool), (len(df),)).copy()
+
+def match_tech_flow_rules(df, flow_dict) -> tuple[pd.Series, pd.DataFrame]:
+    """
+    Assigns each exchange in df to a mapping in flow_dict by source flow name
+    ('name') and MatchCondition. Conditional mappings take precedence over a
+    mapping without a condition, and where several conditional mappings are
+    met the first in the mapping file is applied.
+
+    Returns:
+        pd.Series of flow_dict keys aligned to df (NaN where no mapping applies)
+        pd.DataFrame reporting exchanges with mappings for their source flow
+            name where no condition was met ('unmatched') or more than one
+            condition was met ('multiple')
+    """
+    n = len(df)
+    key = np.full(n, np.nan, dtype=object)
+    matched = np.zeros(n, dtype=np.int32)
+    groups = df.reset_index(drop=True).groupby('name', sort=False).indices
+    masks = {}
+    for k, v in flow_dict.items():
+        expr = v.get('condition')
+        rows = groups.get(v.get('source', k))
+        if not expr or rows is None:
+            continue
+        if expr not in masks:
+            # each distinct condition is evaluated once over the full frame
+            masks[expr] = evaluate_match_condition(expr, df)
+        hits = rows[masks[expr][rows]]
+        key[hits[matched[hits] == 0]] = k
+        matched[hits] += 1
+
+    defaults = {v.get('source', k): k for k, v in flow_dict.items()
+                if not v.get('condition')}
+    default_key = df['name'].map(defaults).to_numpy(dtype=object)
+    key = np.where(matched == 0, default_key, key)
+
+    sources = {v.get('source', k) for k, v in flow_dict.items()}
+    has_rule = df['name'].isin(sources).to_numpy()
+    status = np.select([has_rule & pd.isna(key), matched > 1],
+                       ['unmatched', 'multiple'], '')
+    idx = np.flatnonzero(status != '')
+    report = pd.DataFrame({'name': df['name'].to_numpy()[idx],
+                           'status': status[idx],
+                           'conditions_met': matched[idx]},
+                          index=df.index[idx])
+    return pd.Series(key, index=df.index, dtype=object), report
+
+def compile_tech_flow_mapping(flow_dict, flow_objs, provider_dict,
+                              bridge_registry=None) -> pd.DataFrame:
+    """
+    Compiles the outputs of prepare_tech_flow_mappings into a lookup table
+    indexed by source flow name, for use in apply_tech_flow_mapping. Bridge
+    process names and UUIDs are precomputed, using those in bridge_registry
+    (see read_bridge_registry) for bridges that already exist.
+    """
+    def get_context(n):
+        try:
+            return flow_objs.get(n).category
+        except AttributeError:
+            return ''
+
+    bridges = {k: v for k, v in flow_dict.items() if v.get('BRIDGE', False)}
+    providers = {k: v['provider'] for k, v in flow_dict.items()
+                 if not pd.isna(v['provider'])}
+    provider_ids = {k: v.id for k, v in provider_dict.items()}
+    # each column is built from a dict so values align on the source flow name
+    m = pd.DataFrame({
+        'bridge': pd.Series({k: True for k in bridges}, dtype=object),
+        'repo': pd.Series({k: list(v['repo'].keys())[0]
+                           for k, v in bridges.items()}, dtype=object),
+        'bridge_flow_name': pd.Series({k: v['bridge_flow_name']
+                                       for k, v in bridges.items()}, dtype=object),
+        'id': pd.Series({k: v['id'] for k, v in flow_dict.items() if 'id' in v},
+                        dtype=object),
+        'FlowName': pd.Series({k: v['name'] for k, v in flow_dict.items()},
+                              dtype=object),
+        'Context': pd.Series({k: get_context(v['name'])
+                              for k, v in flow_dict.items()}, dtype=object),
+        'unit': pd.Series({k: v.get('unit') for k, v in flow_dict.items()},
+                          dtype=object),
+        'conversion': pd.Series({k: v.get('conversion', 1)
+                                 for k, v in flow_dict.items()}),
+        'default_provider_process': pd.Series(providers, dtype=object),
+        'default_provider': pd.Series({k: provider_ids.get(v)
+                                       for k, v in providers.items()},
+                                      dtype=object),
+        }, index=pd.Index(list(flow_dict.keys()), dtype=object))
+    m['default_provider'] = m['default_provider'].where(
+        m['default_provider'].notna(), np.nan)
+    is_bridge = m['bridge'] == True
+    names, _ = create_bridge_names(m.loc[is_bridge, 'repo'],
+                                   m.loc[is_bridge, 'bridge_flow_name'])
+    m['bridge_process_name'] = pd.Series(names, index=m.index[is_bridge],
+                                         dtype=object)
+    m['bridge_process_id'] = make_uuids(m['bridge_process_name'].dropna())
+    m['bridge_flow_uuid'] = make_uuids(m.loc[is_bridge, 'bridge_flow_name'])
+    if bridge_registry is not None:
+        registry = (read_bridge_registry(bridge_registry)
+                    .set_index(['repo', 'bridge_flow_name']))
+        b = m.loc[is_bridge]
+        found = registry.reindex(
+            pd.MultiIndex.from_arrays([b['repo'], b['bridge_flow_name']]))
+        found.index = b.index
+        found = found.dropna(subset=['ProcessID'])
+        m.loc[found.index, 'bridge_process_name'] = found['ProcessName']
+        m.loc[found.index, 'bridge_process_id'] = found['ProcessID']
+        m.loc[found.index, 'bridge_flow_uuid'] = found['FlowUUID']
+    return m
+
+def apply_tech_flow_mapping(df, flow_dict, flow_objs, provider_dict, cond=None,
+                            compiled=None, bridge_registry=None) -> pd.DataFrame:
     """
     Updates the dataframe to implement the tech flow mapping.
     Input data frame must have:
         'name' --> SourceFlowName
         'amount' --> Source amount
     pass condition if desired, e.g., cond = df['FlowName'] != "Not this flow"
+    MatchCondition entries in the mapping file are applied per exchange, see
+    match_tech_flow_rules. The applied flow_dict key is added as 'mapping_key'
+    pass compiled from compile_tech_flow_mapping() to reuse the lookup table
+    across dataframes
+    pass bridge_registry (see read_bridge_registry) to link bridged flows to
+    existing bridge processes
     """
     if 'FlowUUID' not in df:
         df['FlowUUID'] = np.nan
@@ -91,104 +425,69 @@ def apply_tech_flow_mapping(df, flow_dict, flow_objs, provider_dict, cond=None)
     if 'unit' not in df:
         raise KeyError("'unit' must be in passed dataframe")
 
-    if not cond:
+    if cond is None:
         cond = df['FlowType'] != "ELEMENTARY_FLOW"
+    cond = np.asarray(cond, dtype=bool)
 
-    def get_context(n):
-        try:
-            return flow_objs.get(n).category
-        except AttributeError:
-            return ''
+    if compiled is None:
+        compiled = compile_tech_flow_mapping(flow_dict, flow_objs, provider_dict,
+                                             bridge_registry=bridge_registry)
+    keys = None
+    if any(v.get('condition') for v in flow_dict.values()):
+        keys, report = match_tech_flow_rules(df, flow_dict)
+        for status, n in report['status'].value_counts().items():
+            print(f'WARNING: {n} exchanges with MatchCondition status: {status}')
+    # single join of the lookup table to the exchange rows
+    m = (compiled.reindex(df['name'].values if keys is None else keys.values)
+         .set_axis(df.index))
+
+    df = df.copy()
+    if keys is not None:
+        df['mapping_key'] = keys
+    ## Handle bridge processes
+    df['bridge'] = np.where(cond, m['bridge'], False)
+    df['repo'] = np.where(cond, m['repo'], '')
+    df['bridge_flow_name'] = np.where(cond, m['bridge_flow_name'], '')
+
+    ## Flow mapping and conversions
+    df['FlowUUID'] = np.where(cond, m['id'].fillna(df['FlowUUID']),
+                              df['FlowUUID'])
+    df['FlowName'] = np.where(cond, m['FlowName'].fillna(df['name']),
+                              df['name'])
+    df['Context'] = np.where(cond, m['Context'].fillna(df['Context']),
+                             df['Context'])
+
+    ## Some modifications don't apply to flows that are bridged
+    cond2 = cond & (df['bridge'] != True).to_numpy()
+    df['unit'] = np.where(cond2, m['unit'].fillna(df['unit']), df['unit'])
+    conversion = np.where(cond2, m['conversion'].fillna(1), 1)
+    df['amount'] = df['amount'] * conversion
 
-    df = (df
-        ## Handle bridge processes
-           .assign(bridge = lambda x: np.where(cond,
-               x['name'].map(
-                   {k: True for k, v in flow_dict.items()
-                    if v.get('BRIDGE', False)}),
-               False))
-           .assign(repo = lambda x: np.where(cond,
-               x['name'].map(
-                   {k: list(v['repo'].keys())[0] for k, v in flow_dict.items()
-                    if v.get('BRIDGE', False)}),
-               ''))
-           .assign(bridge_flow_name = lambda x: np.where(cond,
-               x['name'].map(
-                   {k: v['bridge_flow_name'] for k, v in flow_dict.items()
-                    if v.get('BRIDGE', False)}),
-               ''))
-           )
-
-    df = (df
-          ## Flow mapping and conversions
-          .assign(FlowUUID = lambda x: np.where(cond,
-                x['name'].map(
-                    {k: v['id'] for k, v in flow_dict.items() if 'id' in v})
-                    .fillna(x['FlowUUID']),
-                x['FlowUUID']))
-          .assign(FlowName = lambda x: np.where(cond,
-                x['name'].map(
-                    {k: v['name'] for k, v in flow_dict.items()}).fillna(x['name']),
-                x['name']))
-          .assign(Context = lambda x: np.where(cond,
-                x['name'].map(
-                    {k: get_context(v['name']) for k, v in flow_dict.items()})
-                    .fillna(x['Context']),
-                x['Context']))
-          )
-    cond2 = cond * (df['bridge'] != True)
-    df = (df
-          ## Some modifications don't apply to flows that are bridged
-           .assign(unit = lambda x: np.where(cond2, 
-                x['name'].map(
-                    {k: v.get('unit') for k, v in flow_dict.items()}).fillna(x['unit']),
-                x['unit']))
-           .assign(conversion = lambda x: np.where(cond2, 
-                x['name'].map(
-                    {k: v.get('conversion', 1) for k, v in flow_dict.items()})
-                    .fillna(1),
-                1))
-           .assign(amount = lambda x: x['amount'] * x['conversion'])
-
-        ## Handle default providers
-           .assign(default_provider_process = lambda x: np.where(cond,
-                x['name'].map(
-                    {k: v['provider'] for k, v in flow_dict.items() 
-                     if not pd.isna(v['provider'])}),
-                ''))
-           .assign(default_provider = lambda x: np.where(cond,
-                x['default_provider_process'].map(
-                    {k: v.id for k, v in provider_dict.items()}),
-                ''))
-           )
+    ## Handle default providers
+    df['default_provider_process'] = np.where(
+        cond, m['default_provider_process'], '')
+    df['default_provider'] = np.where(cond, m['default_provider'], '')
 
     ## when the provider is a newly created process, assign that here
-    cond3 = (cond * (df['default_provider'].isna()) * 
-             (df['default_provider_process'].isin(df['ProcessName'])))
-    df = (df
-           .assign(default_provider = lambda x: np.where(cond3,
-                x['default_provider_process'].map(
-                    dict(zip(df['ProcessName'], df['ProcessID']))),
-                x['default_provider']))
-           )
-
-    df = (df
-          ## Make some special adjustments to providers for bridge flows
-           .assign(default_provider_process = lambda x: np.where(x['bridge'] == True,
-                x.apply(
-                    lambda z: create_bridge_name(z['repo'], z['bridge_flow_name']), axis=1),
-                x['default_provider_process']))
-           .assign(default_provider = lambda x: np.where(x['bridge'] == True,
-                x['default_provider_process'].apply(make_uuid),
-                x['default_provider']))
-           .assign(FlowName = lambda x: np.where(x['bridge'] == True,
-                x['bridge_flow_name'], x['FlowName']))
-           .assign(FlowUUID = lambda x: np.where(x['bridge'] == True,
-                x['FlowName'].apply(make_uuid),
-                x['FlowUUID']))
-           )
-
-    return df.drop(columns=['conversion'])
+    cond3 = (cond & df['default_provider'].isna().to_numpy() &
+             df['default_provider_process'].isin(df['ProcessName'].unique())
+             .to_numpy())
+    if cond3.any():
+        df['default_provider'] = np.where(cond3,
+            df['default_provider_process'].map(
+                dict(zip(df['ProcessName'], df['ProcessID']))),
+            df['default_provider'])
+
+    ## Make some special adjustments to providers for bridge flows
+    is_bridge = (df['bridge'] == True).to_numpy()
+    df['default_provider_process'] = np.where(
+        is_bridge, m['bridge_process_name'], df['default_provider_process'])
+    df['default_provider'] = np.where(
+        is_bridge, m['bridge_process_id'], df['default_provider'])
+    df['FlowName'] = np.where(is_bridge, df['bridge_flow_name'], df['FlowName'])
+    df['FlowUUID'] = np.where(is_bridge, m['bridge_flow_uuid'], df['FlowUUID'])
+
+    return df
 
 def create_bridge_name(repo, flowname):
     if repo == 'USLCI':
@@ -202,53 +501,130 @@ def create_bridge_category(repo, flowname):
     else:
         return f'Bridge Processes / USLCI to {repo}'
 
+def create_bridge_names(repo, flowname) -> tuple[np.ndarray, np.ndarray]:
+    """Array version of create_bridge_name and create_bridge_category,
+    returns arrays of bridge process names and categories"""
+    repo = pd.Series(repo, dtype=object).astype(str).to_numpy()
+    flowname = pd.Series(flowname, dtype=object).astype(str).to_numpy()
+    is_uslci = repo == 'USLCI'
+    names = np.where(is_uslci, flowname + ' - PROXY',
+                     flowname + ' BRIDGE, USLCI to ' + repo)
+    categories = np.where(is_uslci, 'Proxy Processes',
+                          'Bridge Processes / USLCI to ' + repo)
+    return names.astype(object), categories.astype(object)
+
+# columns of the registry of existing bridge processes
+bridge_registry_fields = ['repo', 'bridge_flow_name', 'ProcessName',
+                          'ProcessID', 'FlowUUID', 'TargetFlowName',
+                          'TargetFlowUUID', 'LastUpdated']
+
+def read_bridge_registry(registry) -> pd.DataFrame:
+    """
+    Returns the registry of existing bridge processes, keyed by target repo
+    and bridge flow name. registry may be a path to a csv (which need not
+    exist yet) or a DataFrame.
+    """
+    if isinstance(registry, pd.DataFrame):
+        return registry
+    if not Path(registry).exists():
+        return pd.DataFrame(columns=bridge_registry_fields)
+    return pd.read_csv(registry, dtype=str, keep_default_na=False,
+                       na_values=[''])
+
+def register_bridge_processes(df_bridge, registry) -> pd.DataFrame:
+    """
+    Adds the bridge processes from create_bridge_processes to the registry
+    csv at path registry, so that later datasets reuse them. Existing
+    entries are kept. Returns the updated registry.
+    """
+    reg = read_bridge_registry(registry)
+    if len(df_bridge) == 0:
+        return reg
+    # the first row of each bridge process is the new bridge flow (output)
+    new = (df_bridge
+           .drop_duplicates(subset='ProcessID', keep='first')
+           .drop(columns='bridge_flow_name', errors='ignore')
+           .rename(columns={'FlowName': 'bridge_flow_name'}))
+    target = (df_bridge
+              .drop_duplicates(subset='ProcessID', keep='last')
+              .set_index('ProcessID'))
+    new = (new
+           .assign(TargetFlowName = lambda x: x['ProcessID'].map(target['FlowName']))
+           .assign(TargetFlowUUID = lambda x: x['ProcessID'].map(target['FlowUUID']))
+           .assign(LastUpdated = datetime.now().strftime('%Y-%m-%d'))
+           .reindex(columns=bridge_registry_fields))
+    reg = (pd.concat([reg, new], ignore_index=True)
+           .drop_duplicates(subset=['repo', 'bridge_flow_name'], keep='first'))
+    if not isinstance(registry, pd.DataFrame):
+        reg.to_csv(registry, index=False)
+    return reg
 
-def create_bridge_processes(df, flow_dict, flow_objs):
-    """ Builds bridge processes to facilitate technosphere flow mapping"""
+def create_bridge_processes(df, flow_dict, flow_objs, bridge_registry=None):
+    """
+    Builds bridge processes to facilitate technosphere flow mapping.
+    Bridges found in bridge_registry (see read_bridge_registry) already exist
+    and are not rebuilt.
+    """
     flow_dict1 = {k: v for k, v in flow_dict.items() if v.get('BRIDGE', False)}
+    # conditional mappings are identified by the applied flow_dict key
+    key = 'mapping_key' if 'mapping_key' in df else 'name'
     if 'bridge' not in df:
         return pd.DataFrame()
-    if len(df.query('bridge == True')) == 0:
+    df_bridge = df[(df['bridge'] == True).to_numpy()]
+    if len(df_bridge) == 0:
         return pd.DataFrame()
-    df_bridge = (df
-                 .query('bridge == True')
+    df_bridge = (df_bridge
                  .drop_duplicates(subset = 'FlowName')
                  .drop(columns=['default_provider', 'default_provider_process'], errors='ignore')
-                 .reset_index(drop=True)
-                 .assign(amount = 1)
-                 .assign(ProcessCategory = lambda x: x.apply(
-                     lambda z: create_bridge_category(z['repo'], z['bridge_flow_name']), axis=1))
-                 .assign(ProcessName = lambda x: x.apply(
-                     lambda z: create_bridge_name(z['repo'], z['bridge_flow_name']), axis=1))
-                 .assign(FlowName = lambda x: x['bridge_flow_name'])
-                 .assign(ProcessID = lambda x: x['ProcessName'].apply(make_uuid))
-                 # ^ need more args passed to UUID to avoid duplicates?
-                 )
-    df_bridge = (pd.concat([
-            df_bridge
-                .assign(reference = lambda x: ~x['reference'])
-                .assign(IsInput = lambda x: ~x['IsInput'])
-                .assign(FlowUUID = lambda x: x['FlowName'].apply(make_uuid)),
-            # ^ first chunk is for new flows
-            df_bridge
-               .assign(FlowName = lambda x: x['name'].map(
-                   {k: v.get('name', 'ERROR') for k, v in flow_dict1.items()}))
-               .assign(FlowUUID = lambda x: x['name'].map(
-                   {k: flow_objs.get(v['name']).id for k, v in flow_dict1.items()}))
-               .assign(unit = lambda x: x['name'].map(
-                   {k: v.get('unit') for k, v in flow_dict1.items()}))
-               .assign(conversion = lambda x: x['name'].map(
-                   {k: v.get('conversion', 1) for k, v in flow_dict1.items()}))
-               .assign(amount = lambda x: x['amount'] * x['conversion'])
-               # ^ apply unit conversion
-               .drop(columns=['conversion'])
-               .assign(Tag = lambda x: x['name'].map(
-                   {k: list(v.get('repo').keys())[0] for k, v in flow_dict1.items()}))
-             # ^ second chunk is for bridged flows
-
-             ## TODO Need to add default providers for these when they are bridges WITHIN
-             # a database? Would be nice, but not required
-            ], ignore_index=True)
-            .drop(columns=['bridge'])
-        )
-    return df_bridge
+                 .reset_index(drop=True))
+    if bridge_registry is not None:
+        registry = read_bridge_registry(bridge_registry)
+        existing = pd.MultiIndex.from_frame(
+            df_bridge[['repo', 'bridge_flow_name']]).isin(
+                pd.MultiIndex.from_frame(registry[['repo', 'bridge_flow_name']]))
+        if existing.any():
+            print(f'Reusing {existing.sum()} existing bridge processes')
+            df_bridge = df_bridge[~existing].reset_index(drop=True)
+        if len(df_bridge) == 0:
+            return pd.DataFrame()
+    names, categories = create_bridge_names(df_bridge['repo'],
+                                            df_bridge['bridge_flow_name'])
+    df_bridge = df_bridge.assign(amount = 1,
+                                 ProcessCategory = categories,
+                                 ProcessName = names,
+                                 FlowName = df_bridge['bridge_flow_name'])
+    df_bridge['ProcessID'] = make_uuids(df_bridge['ProcessName'])
+    # ^ need more args passed to UUID to avoid duplicates?
+
+    ## each bridge process has two exchanges: the first for the new flow,
+    ## the second for the bridged flow. Rows are repeated once and only the
+    ## differing columns are replaced
+    n = len(df_bridge)
+    keys = df_bridge[key]
+    target = {
+        'FlowName': {k: v.get('name', 'ERROR') for k, v in flow_dict1.items()},
+        'FlowUUID': {k: flow_objs.get(v['name']).id for k, v in flow_dict1.items()},
+        'unit': {k: v.get('unit') for k, v in flow_dict1.items()},
+        'conversion': {k: v.get('conversion', 1) for k, v in flow_dict1.items()},
+        'Tag': {k: list(v.get('repo').keys())[0] for k, v in flow_dict1.items()},
+        }
+    out = df_bridge.take(np.tile(np.arange(n), 2)).reset_index(drop=True)
+
+    def stack(first, second):
+        return pd.concat([first, second], ignore_index=True)
+
+    out['reference'] = stack(~df_bridge['reference'], df_bridge['reference'])
+    out['IsInput'] = stack(~df_bridge['IsInput'], df_bridge['IsInput'])
+    out['FlowName'] = stack(df_bridge['FlowName'], keys.map(target['FlowName']))
+    out['FlowUUID'] = stack(make_uuids(df_bridge['FlowName']),
+                            keys.map(target['FlowUUID']))
+    out['unit'] = stack(df_bridge['unit'], keys.map(target['unit']))
+    # ^ apply unit conversion
+    out['amount'] = stack(df_bridge['amount'],
+                          df_bridge['amount'] * keys.map(target['conversion']))
+    tag = keys.map(target['Tag'])
+    out['Tag'] = stack(pd.Series(np.nan, index=df_bridge.index, dtype=tag.dtype),
+                       tag)
+    ## TODO Need to add default providers for these when they are bridges WITHIN
+    # a database? Would be nice, but not required
+    return out.drop(columns=['bridge'])
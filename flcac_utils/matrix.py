@@ -0,0 +1,363 @@
+"""
+Sparse matrix calculations on generated processes, e.g. to screen results
+before upload to the FLCAC without openLCA. Requires scipy, which is
+imported when a matrix is built: pip install flcac_utils[matrix]
+"""
+
+import numpy as np
+import pandas as pd
+import olca_schema as olca
+
+from flcac_utils.unit_conversion import conversion_factors, reference_units
+
+
+def exchanges_from_processes(processes: dict, flows: dict = None
+                             ) -> pd.DataFrame:
+    """
+    Returns a DataFrame of exchanges with the columns of exchange_schema
+    used in matrix calculations from a dict of olca.Process objects, e.g.
+    from build_process_dict. Exchanges only hold a reference to their flow,
+    so the FlowType is taken from flows.
+
+    :param processes: dict of olca.Process objects
+    :param flows: dict of olca.Flow objects with UUID as dictionary key, e.g.
+        the flows passed to build_process_dict
+    """
+    flows = flows or {}
+    cols = {k: [] for k in ['ProcessID', 'ProcessName', 'FlowUUID',
+                            'FlowName', 'FlowType', 'IsInput', 'reference',
+                            'avoided_product', 'amount', 'unit',
+                            'default_provider']}
+    unresolved = set()
+    for p in processes.values():
+        for e in p.exchanges or []:
+            flow = e.flow or olca.Ref()
+            flow_type = flow.flow_type
+            if flow.id in flows:
+                flow_type = flows[flow.id].flow_type
+            if flow_type is None:
+                unresolved.add(flow.id)
+            cols['ProcessID'].append(p.id)
+            cols['ProcessName'].append(p.name)
+            cols['FlowUUID'].append(flow.id)
+            cols['FlowName'].append(flow.name)
+            cols['FlowType'].append(flow_type.value if flow_type else None)
+            cols['IsInput'].append(bool(e.is_input))
+            cols['reference'].append(bool(e.is_quantitative_reference))
+            cols['avoided_product'].append(bool(e.is_avoided_product))
+            cols['amount'].append(e.amount)
+            cols['unit'].append(e.unit.name if e.unit else None)
+            cols['default_provider'].append(
+                e.default_provider.id if e.default_provider else None)
+    if unresolved:
+        raise ValueError(f'FlowType of {len(unresolved)} flows could not be '
+                         f'resolved, pass them in flows: '
+                         f'{sorted(map(str, unresolved))[:5]}')
+    return pd.DataFrame(cols).astype({'amount': float})
+
+
+def _to_exchanges(data, flows: dict = None) -> pd.DataFrame:
+    if isinstance(data, pd.DataFrame):
+        return data
+    return exchanges_from_processes(data, flows)
+
+
+def _reference_amounts(df: pd.DataFrame, unit_factor: np.ndarray = None
+                       ) -> np.ndarray:
+    """Returns the reference flow amount for each row of df, NaN for
+    processes without a reference flow"""
+    amount = df['amount'].to_numpy(dtype=float)
+    if unit_factor is not None:
+        amount = amount * unit_factor
+    ref = pd.Series(np.where(df['reference'].to_numpy(dtype=bool),
+                             amount, np.nan), index=df.index)
+    return (ref.groupby(df['ProcessID'].to_numpy())
+            .transform('first').to_numpy())
+
+
+def _unit_factors(units, target_units=None) -> np.ndarray:
+    """Factors converting units to target_units (or the reference unit of
+    their group), 1 where a unit is unknown"""
+    units = np.asarray(units, dtype=object)
+    if target_units is None:
+        target_units = reference_units(units)
+    f = conversion_factors(units, np.where(pd.isna(target_units), units,
+                                           target_units))
+    return np.where(np.isnan(f), 1.0, f)
+
+
+def characterization_matrix(categories: list) -> tuple:
+    """
+    Builds a sparse flow x impact category matrix of characterization
+    factors from olca.ImpactCategory objects, e.g. from
+    read_commons_data({repo: 'IMPACT_METHOD'}). Factors are converted to the
+    reference unit of the unit group of the factor. Regionalized factors are
+    ignored.
+
+    :return: tuple of (csr_matrix, pd.Index of flow ids, pd.Index of
+        category names)
+    """
+    import scipy.sparse as sp
+    flows, cats, values, units = [], [], [], []
+    for j, c in enumerate(categories):
+        for f in c.impact_factors or []:
+            if f.location is not None or f.flow is None or f.value is None:
+                continue
+            flows.append(f.flow.id)
+            cats.append(j)
+            values.append(f.value)
+            units.append(f.unit.name if f.unit else None)
+    codes, flow_index = pd.factorize(pd.Series(flows, dtype=object))
+    cats = np.asarray(cats, dtype=int)
+    # a factor per unit u is a factor per reference unit / (ref per u)
+    values = np.asarray(values, dtype=float) / _unit_factors(units)
+    # keep the first factor for a flow, duplicates would be summed
+    first = ~pd.DataFrame({'f': codes, 'c': cats}).duplicated().to_numpy()
+    m = sp.coo_matrix((values[first], (codes[first], cats[first])),
+                      shape=(len(flow_index), len(categories)))
+    return (m.tocsr(), pd.Index(flow_index),
+            pd.Index([c.name for c in categories]))
+
+
+def intervention_matrix(data, flow_index: pd.Index = None,
+                        normalize: bool = True, flows: dict = None) -> tuple:
+    """
+    Builds a sparse process x flow matrix of exchange amounts in the
+    reference unit of each unit group.
+
+    :param data: DataFrame of exchanges (see exchange_schema) or dict of
+        olca.Process objects from build_process_dict
+    :param flow_index: pd.Index of flow ids to use as columns, e.g. from
+        characterization_matrix; exchanges of other flows are dropped
+    :param normalize: bool, divide by the amount of the reference flow of
+        each process
+    :param flows: dict of olca.Flow objects, required if data is a dict of
+        olca.Process objects, see exchanges_from_processes
+    :return: tuple of (csr_matrix, pd.Index of ProcessIDs, pd.Index of flows)
+    """
+    import scipy.sparse as sp
+    df = _to_exchanges(data, flows)
+    unit_factor = _unit_factors(df['unit'])
+    amount = df['amount'].to_numpy(dtype=float) * unit_factor
+    if normalize:
+        amount = amount / _reference_amounts(df, unit_factor)
+    rows, process_index = pd.factorize(df['ProcessID'].astype(object))
+    if flow_index is None:
+        cols, flow_index = pd.factorize(df['FlowUUID'].astype(object))
+        flow_index = pd.Index(flow_index)
+    else:
+        cols = flow_index.get_indexer(df['FlowUUID'])
+    keep = (cols >= 0) & ~df['reference'].to_numpy(dtype=bool)
+    m = sp.csr_matrix((amount[keep], (rows[keep], cols[keep])),
+                      shape=(len(process_index), len(flow_index)))
+    return m, pd.Index(process_index), flow_index
+
+
+def direct_impacts(data, categories: list, normalize: bool = True,
+                   flows: dict = None) -> pd.DataFrame:
+    """
+    Computes the direct (gate-to-gate) impacts of all processes in one
+    sparse matrix product.
+
+    :param data: DataFrame of exchanges or dict of olca.Process objects
+    :param categories: list of olca.ImpactCategory objects
+    :param normalize: bool, report impacts per unit of reference flow
+    :param flows: dict of olca.Flow objects, see exchanges_from_processes
+    :return: DataFrame of processes x impact categories
+    """
+    c, flow_index, cat_index = characterization_matrix(categories)
+    b, process_index, _ = intervention_matrix(data, flow_index, normalize,
+                                              flows)
+    impacts = (b @ c).toarray()
+    return pd.DataFrame(impacts, index=process_index, columns=cat_index)
+
+
+def impact_outliers(impacts: pd.DataFrame, groups=None,
+                    threshold: float = 3.5) -> pd.DataFrame:
+    """
+    Flags impacts whose order of magnitude differs from that of other
+    processes, using the modified z-score of log10(|impact|) in each
+    category (and each group of processes, if provided). Zero impacts are
+    not flagged.
+
+    :param groups: array-like, optional, e.g. the ProcessCategory of each row
+    :param threshold: float, modified z-score above which values are flagged
+    :return: DataFrame of bool, same shape as impacts
+    """
+    keys = (np.zeros(len(impacts)) if groups is None else np.asarray(groups))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log = np.log10(impacts.abs()).replace(-np.inf, np.nan)
+        dev = log - log.groupby(keys).transform('median')
+        mad = dev.abs().groupby(keys).transform('median')
+        # where over half the values are equal use the mean absolute deviation
+        mean_ad = dev.abs().groupby(keys).transform('mean')
+        score = np.where(mad > 0, 0.6745 * dev / mad,
+                         dev / (1.2533 * mean_ad))
+    return pd.DataFrame(np.abs(score) > threshold, index=impacts.index,
+                        columns=impacts.columns)
+
+
+class TechnosphereMatrix:
+    """
+    Technosphere (A) and intervention (B) matrices of linked processes, with
+    a sparse LU factorization of A that is reused for every demand.
+
+    Each process is scaled to one reference unit (see unit_conversion) of
+    its reference flow. Technosphere inputs and outputs are linked to the
+    process in default_provider or, if link_unique, to the only process
+    with that flow as its reference flow. Exchanges that can not be linked
+    are listed in .unlinked and left out of A.
+
+    :param data: DataFrame of exchanges (see exchange_schema) or dict of
+        olca.Process objects from build_process_dict
+    :param providers: optional DataFrame or dict of olca.Process objects for
+        provider processes not in data, e.g. from extract_processes
+    :param link_unique: bool, link exchanges without a default_provider to
+        the only process providing the flow, if there is one
+    :param flows: dict of olca.Flow objects, required if data or providers
+        are olca.Process objects, see exchanges_from_processes
+    """
+
+    def __init__(self, data, providers=None, link_unique: bool = True,
+                 flows: dict = None):
+        import scipy.sparse as sp
+        df = _to_exchanges(data, flows)
+        if providers is not None:
+            p = _to_exchanges(providers, flows)
+            p = p[~p['ProcessID'].isin(df['ProcessID'].unique())]
+            df = pd.concat([df, p], ignore_index=True)
+        df = df.reset_index(drop=True)
+        is_ref = df['reference'].to_numpy(dtype=bool)
+        refs = df[is_ref].drop_duplicates('ProcessID')
+        missing = set(df['ProcessID']) - set(refs['ProcessID'])
+        if missing:
+            print(f'WARNING: {len(missing)} processes without a reference '
+                  'flow are excluded')
+        process_index = pd.Index(refs['ProcessID'].to_numpy(dtype=object))
+        self.process_index = process_index
+        self.process_names = pd.Series(
+            refs['ProcessName'].to_numpy(dtype=object)
+            if 'ProcessName' in refs else process_index.to_numpy(),
+            index=process_index)
+        n = len(process_index)
+
+        # amounts in the reference unit of each unit group, per one
+        # reference unit of the reference flow of each process
+        unit_factor = _unit_factors(df['unit'])
+        ref_unit_factor = _unit_factors(refs['unit'])
+        ref_amount = refs['amount'].to_numpy(dtype=float) * ref_unit_factor
+        self.ref_unit_factor = pd.Series(ref_unit_factor, index=process_index)
+        self.ref_amount = pd.Series(ref_amount, index=process_index)
+        col = process_index.get_indexer(df['ProcessID'])
+        in_system = col >= 0
+        amount = np.full(len(df), np.nan)
+        amount[in_system] = (df['amount'].to_numpy(dtype=float)[in_system] *
+                             unit_factor[in_system] / ref_amount[col[in_system]])
+        sign = np.where(df['IsInput'].to_numpy(dtype=bool), -1.0, 1.0)
+
+        ## link technosphere exchanges to providers
+        is_elem = (df['FlowType'] == 'ELEMENTARY_FLOW').to_numpy()
+        tech = in_system & ~is_ref & ~is_elem
+        if 'default_provider' in df:
+            provider = df['default_provider'].where(
+                df['default_provider'].isin(process_index))
+        else:
+            provider = pd.Series(np.nan, index=df.index, dtype=object)
+        if link_unique:
+            counts = refs['FlowUUID'].value_counts()
+            unique = refs[refs['FlowUUID'].isin(counts.index[counts == 1])]
+            provider = provider.fillna(df['FlowUUID'].map(
+                unique.set_index('FlowUUID')['ProcessID']))
+        row = process_index.get_indexer(provider.fillna(''))
+        linked = tech & (row >= 0)
+        self.unlinked = df[tech & (row < 0)]
+        if len(self.unlinked):
+            print(f'WARNING: {len(self.unlinked)} technosphere exchanges '
+                  'without a provider in the system, see .unlinked')
+
+        ref_sign = np.where(refs['IsInput'].to_numpy(dtype=bool), -1.0, 1.0)
+        rows = np.concatenate([np.arange(n), row[linked]])
+        cols = np.concatenate([np.arange(n), col[linked]])
+        vals = np.concatenate([ref_sign, sign[linked] * amount[linked]])
+        self.A = sp.csc_matrix((vals, (rows, cols)), shape=(n, n))
+
+        ## elementary flows
+        elem = in_system & is_elem
+        flow_codes, flow_index = pd.factorize(
+            df.loc[elem, 'FlowUUID'].astype(object))
+        self.flow_index = pd.Index(flow_index)
+        # signed as in openLCA (inputs negative) and unsigned for LCIA
+        self.B_unsigned = sp.csr_matrix(
+            (amount[elem], (flow_codes, col[elem])),
+            shape=(len(flow_index), n))
+        self.B = sp.csr_matrix(
+            (sign[elem] * amount[elem], (flow_codes, col[elem])),
+            shape=(len(flow_index), n))
+        self._lu = None
+
+    def _factorize(self):
+        import scipy.sparse.linalg as spla
+        if self._lu is None:
+            try:
+                self._lu = spla.splu(self.A.tocsc())
+            except RuntimeError as e:
+                raise ValueError(f'Technosphere matrix is singular: {e}')
+        return self._lu
+
+    def demand_matrix(self, demand) -> pd.DataFrame:
+        """
+        Returns a dense processes x demands array of final demand.
+
+        :param demand: dict of {ProcessID or ProcessName: amount} in the unit
+            of the reference flow of the process, a list of such dicts, or a
+            DataFrame with ProcessIDs as index and one column per demand
+        """
+        if isinstance(demand, dict):
+            demand = [demand]
+        if not isinstance(demand, pd.DataFrame):
+            demand = pd.DataFrame(demand).T.fillna(0)
+        ids = dict(zip(self.process_names.values, self.process_index))
+        demand = demand.set_axis([k if k in self.process_index
+                                  else ids.get(k, k) for k in demand.index])
+        unknown = set(demand.index) - set(self.process_index)
+        if unknown:
+            raise KeyError(f'Processes not in the system: {unknown}')
+        f = demand.groupby(level=0).sum().reindex(self.process_index,
+                                                  fill_value=0)
+        f = f.astype(float).mul(self.ref_unit_factor, axis=0)
+        # waste treatment is demanded as a negative amount of its reference
+        return f.mul(np.sign(self.A.diagonal()), axis=0)
+
+    def _solve(self, demand) -> pd.DataFrame:
+        """Returns the output of each process in reference units"""
+        f = self.demand_matrix(demand)
+        s = self._factorize().solve(f.to_numpy())
+        return pd.DataFrame(s.reshape(f.shape), index=self.process_index,
+                            columns=f.columns)
+
+    def scaling(self, demand) -> pd.DataFrame:
+        """Returns scaling factors (processes x demands) for demand, see
+        demand_matrix, relative to the process as written"""
+        return self._solve(demand).div(self.ref_amount, axis=0)
+
+    def inventory(self, demand) -> pd.DataFrame:
+        """Returns the cumulative elementary flows (flows x demands), inputs
+        negative"""
+        s = self._solve(demand)
+        return pd.DataFrame(self.B @ s.to_numpy(), index=self.flow_index,
+                            columns=s.columns)
+
+    def impacts(self, demand, categories: list) -> pd.DataFrame:
+        """Returns cumulative impacts (categories x demands)"""
+        import scipy.sparse as sp
+        c, flow_index, cat_index = characterization_matrix(categories)
+        s = self._solve(demand)
+        g = self.B_unsigned @ s.to_numpy()
+        # align the flows of the system to those of the factors
+        cols = flow_index.get_indexer(self.flow_index)
+        keep = cols >= 0
+        m = sp.csr_matrix((np.ones(keep.sum()),
+                           (cols[keep], np.flatnonzero(keep))),
+                          shape=(len(flow_index), len(self.flow_index)))
+        return pd.DataFrame(c.T @ (m @ g), index=cat_index,
+                            columns=s.columns)
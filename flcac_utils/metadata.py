@@ -2,6 +2,7 @@
 Metadata
 """
 
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
@@ -41,51 +42,109 @@ metadata_match = {
     'Access and Use Restrictions': 'use_advice',
     }
 
+def _normalize(s: str) -> str:
+    return (s.lower()
+            .replace("_", " ")
+            .strip()
+            )
+
+
+# normalized row names mapped to metadata keys, allowing the " description"
+# suffix to be omitted. Earlier keys take precedence.
+_key_index = {}
+for _key in metadata_keys:
+    _key_index.setdefault(_normalize(_key), _key)
+    _key_index.setdefault(_normalize(_key).replace(' description', ''), _key)
+
+
+def match_metadata_key(name):
+    """Returns the metadata key for a row name in tabular metadata, or None"""
+    if name in metadata_match:
+        return metadata_match[name]
+    if not isinstance(name, str):
+        return None
+    return _key_index.get(_normalize(name))
+
+
 def read_tabular_metadata(df) -> dict:
     """Reads metadata from tabular format where the column headers are process names
     and index values are keys.
     """
-    # d = df.to_dict(orient='dict')
-
-    # Normalize function
-    def normalize(s):
-        return (s.lower()
-                .replace("_", " ")
-                .strip()
-                )
-
-    # Create mapping of row index names to target metadata keys
-    mapping = {}
-    missing_list = []
-    for index in df.index:
-        norm_row = normalize(index)
-        for key in metadata_keys:
-            if normalize(key) == norm_row:
-                mapping[index] = key
-                break
-            elif normalize(key).replace(' description', '') == norm_row:
-                mapping[index] = key
-                break
-        else:
-            missing_list.append(index)
-
-    mapping.update(**metadata_match)
-
-    # Build dictionary of dictionaries
-    d = {}
-    for col in df.columns:
-        d[col] = {mapping[idx]: ("" if pd.isna(val) else val)
-                  for idx, val in df[col].items() if idx in mapping}
-
-    return d
+    keys = df.index.map(match_metadata_key)
+    matched = np.asarray(keys.notna())
+    # Build dictionary of dictionaries from the matched rows as one array
+    values = df.to_numpy(dtype=object)[matched]
+    values[pd.isna(values)] = ""
+    keys = list(keys[matched])
+    return {col: dict(zip(keys, values[:, i]))
+            for i, col in enumerate(df.columns)}
+
+
+def read_metadata_workbook(filepath, sheets, processes=None) -> pd.DataFrame:
+    """
+    Reads tabular metadata from an Excel workbook in read-only mode, streaming
+    only the requested sheets and columns and only rows that match a metadata
+    key. The result can be passed to read_tabular_metadata.
+
+    :param filepath: path to the .xlsx workbook
+    :param sheets: dict where the key is the sheet name and the value is a
+        dict with optional 'header' (row of process names, zero-based as in
+        pd.read_excel) and 'usecols' (e.g. 'A, D:F', the first being the
+        column of metadata keys)
+    :param processes: list of process names to keep, defaults to all
+    """
+    from openpyxl import load_workbook
+    from openpyxl.utils import column_index_from_string
+
+    def col_positions(usecols):
+        cols = []
+        for part in usecols.replace(' ', '').split(','):
+            first, _, last = part.partition(':')
+            cols.extend(range(column_index_from_string(first),
+                              column_index_from_string(last or first) + 1))
+        return cols
+
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+    frames = []
+    try:
+        for sheet, kwargs in sheets.items():
+            ws = wb[sheet]
+            header = kwargs.get('header', 0)
+            cols = (col_positions(kwargs['usecols'])
+                    if kwargs.get('usecols') else None)
+            rows = ws.iter_rows(min_row=header + 1,
+                                min_col=min(cols) if cols else 1,
+                                max_col=max(cols) if cols else None,
+                                values_only=True)
+            offset = min(cols) if cols else 1
+            names = next(rows, None)
+            if names is None:
+                continue
+            keep = ([c - offset for c in cols] if cols
+                    else list(range(len(names))))
+            index, data = [], []
+            for row in rows:
+                if not row or match_metadata_key(row[keep[0]]) is None:
+                    continue
+                index.append(row[keep[0]])
+                data.append([row[i] if i < len(row) else None
+                             for i in keep[1:]])
+            df = pd.DataFrame(data, index=index,
+                              columns=[names[i] for i in keep[1:]])
+            if processes is not None:
+                df = df[[c for c in df.columns if c in processes]]
+            frames.append(df)
+    finally:
+        wb.close()
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames)
 
 
 if __name__ == '__main__':
     filepath = parent_path.parents[1] / 'FDC-curation-admin' / 'aluminum' / 'aluminum_metadata.xlsx'
-    df1 = pd.read_excel(filepath, sheet_name='General information',
-                        header=1,
-                        usecols='A, D, E, F', index_col=0)
-    df2 = pd.read_excel(filepath, sheet_name='Documentation',
-                        usecols='A, D, E, F', index_col=0)
-    df = pd.concat([df1, df2])
+    df = read_metadata_workbook(
+        filepath, sheets={'General information': {'header': 1,
+                                                  'usecols': 'A, D, E, F'},
+                          'Documentation': {'usecols': 'A, D, E, F'}})
     metadict = read_tabular_metadata(df)
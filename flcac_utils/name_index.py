@@ -0,0 +1,145 @@
+"""
+Fuzzy search of flow and process names in FLCAC repositories
+"""
+
+import pickle
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from flcac_utils.commons_api import read_commons_data
+
+
+def normalize_name(name: str) -> str:
+    """Lower case with punctuation replaced by single spaces"""
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', str(name).lower()).split())
+
+
+def ngrams(name: str, n: int = 3) -> set:
+    """Character n-grams of the normalized name, padded at either end"""
+    s = f' {normalize_name(name)} '
+    return {s[i:i + n] for i in range(max(len(s) - n + 1, 1))}
+
+
+class NameIndex:
+    """
+    Inverted character n-gram index over object names. Candidates are ranked
+    by the Dice coefficient of their n-grams with the query.
+
+    :param names: list of object names
+    :param repos: list of repo labels for each name, optional
+    :param types: list of object types for each name, optional
+    """
+
+    def __init__(self, names, repos=None, types=None, n=3):
+        self.n = n
+        self.names = np.array(names, dtype=object)
+        size = len(self.names)
+        self.repos = np.array(repos if repos is not None else [''] * size,
+                              dtype=object)
+        self.types = np.array(types if types is not None else [''] * size,
+                              dtype=object)
+        self.vocab = {}
+        gram_ids = []
+        name_ids = []
+        self.gram_counts = np.zeros(size, dtype=np.int32)
+        for i, name in enumerate(self.names):
+            grams = ngrams(name, n)
+            self.gram_counts[i] = len(grams)
+            for g in grams:
+                gram_ids.append(self.vocab.setdefault(g, len(self.vocab)))
+                name_ids.append(i)
+        # postings for each n-gram stored as a compressed sparse row structure
+        gram_ids = np.array(gram_ids, dtype=np.int64)
+        order = np.argsort(gram_ids, kind='stable')
+        self.postings = np.array(name_ids, dtype=np.int64)[order]
+        self.indptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(gram_ids, minlength=len(self.vocab)),
+                  out=self.indptr[1:])
+        self.exact = set(zip(self.repos, self.names))
+        self.name_set = set(self.names)
+
+    @classmethod
+    def from_commons(cls, repos, object_types=('FLOWS', 'PROCESS'),
+                     auth=False):
+        """Builds the index from object names in the configured repos"""
+        data_dict = read_commons_data(
+            {repo: list(object_types) for repo in repos}, auth=auth, lazy=True)
+        names, repo_list, types = [], [], []
+        for repo, objs in data_dict.items():
+            for o in objs:
+                names.append(o.name)
+                repo_list.append(repo)
+                types.append(o.to_ref().ref_type.value)
+        return cls(names, repo_list, types)
+
+    def save(self, path: Path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: Path) -> 'NameIndex':
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def contains(self, name, repo=None) -> bool:
+        """True if name is an exact match in repo (or any repo)"""
+        if repo is not None:
+            return (repo, name) in self.exact
+        return name in self.name_set
+
+    def scores(self, query: str) -> np.ndarray:
+        """Returns the similarity of the query to every name in the index"""
+        grams = ngrams(query, self.n)
+        ids = [self.vocab[g] for g in grams if g in self.vocab]
+        if not ids:
+            return np.zeros(len(self.names))
+        hits = np.concatenate([self.postings[self.indptr[i]:self.indptr[i + 1]]
+                               for i in ids])
+        overlap = np.bincount(hits, minlength=len(self.names))
+        return 2 * overlap / (len(grams) + self.gram_counts)
+
+    def search(self, query: str, limit: int = 5, repo=None,
+               object_type=None, min_score: float = 0.3) -> pd.DataFrame:
+        """
+        Returns up to limit candidates for the query ranked by score
+
+        :param repo: str, optional, limit candidates to a single repo
+        :param object_type: str, optional, e.g. 'Flow' or 'Process'
+        """
+        s = self.scores(query)
+        if repo is not None:
+            s = np.where(self.repos == repo, s, 0)
+        if object_type is not None:
+            s = np.where(self.types == object_type, s, 0)
+        k = min(limit, len(s))
+        top = np.argpartition(-s, k - 1)[:k] if k else np.array([], dtype=int)
+        top = top[np.argsort(-s[top], kind='stable')]
+        top = top[s[top] >= min_score]
+        return pd.DataFrame({'Candidate': self.names[top],
+                             'CandidateRepo': self.repos[top],
+                             'CandidateType': self.types[top],
+                             'Score': s[top].round(3)})
+
+    def search_many(self, queries, limit: int = 5, repos=None,
+                    object_type=None, min_score: float = 0.3) -> pd.DataFrame:
+        """
+        Searches a list of queries, returning a long format DataFrame with
+        Query, Rank and the columns from search()
+
+        :param repos: list of repos (one per query) to limit candidates to
+        """
+        repos = repos if repos is not None else [None] * len(queries)
+        frames = []
+        for q, r in zip(queries, repos):
+            df = self.search(q, limit=limit, object_type=object_type,
+                             repo=None if pd.isna(r) else r,
+                             min_score=min_score)
+            frames.append(df.assign(Query=q, Rank=range(1, len(df) + 1)))
+        cols = ['Query', 'Rank', 'Candidate', 'CandidateRepo',
+                'CandidateType', 'Score']
+        if not frames:
+            return pd.DataFrame(columns=cols)
+        return pd.concat(frames, ignore_index=True)[cols]
@@ -0,0 +1,303 @@
+"""
+Tabular views of JSON-LD archives, e.g., from the FLCAC or write_objects
+"""
+
+import io
+import json
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from flcac_utils.commons_api import get_config, login, return_request
+from flcac_utils.generate_processes import exchange_schema
+
+parent_path = Path(__file__).parent
+data_path = parent_path / 'data'
+
+# process fields stored as lists, reported as the number of entries
+list_fields = ['exchanges', 'allocationFactors', 'parameters', 'socialAspects']
+
+
+def get_process_table_fields(assessment=None) -> list:
+    """
+    Returns the process table columns flagged to keep in
+    data/process_table_fields.csv
+
+    :param assessment: str, optional, 'quality' or 'gap' to return only those
+        columns used for Data Quality Assessment or Data Gap Assessment
+    """
+    df = pd.read_csv(data_path / 'process_table_fields.csv',
+                     encoding='utf-8-sig')
+    keep = df['Keep (Y/N)'] == 'Y'
+    if assessment == 'quality':
+        keep = keep & (df['Data Quality Assessment'] == 'Y')
+    elif assessment == 'gap':
+        keep = keep & (df['Data Gap Assessment'] == 'Y')
+    elif assessment is not None:
+        raise ValueError("assessment must be 'quality', 'gap' or None")
+    return df.loc[keep, 'Column'].tolist()
+
+
+@contextmanager
+def _open_source(source):
+    """Yields a tuple of (names, read) for a zip file, directory of JSON-LD
+    files, bytes or a response from return_request. Zip files are closed on
+    exit."""
+    if hasattr(source, 'content'):
+        source = source.content
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    elif Path(source).is_dir():
+        source = Path(source)
+        names = sorted(f.relative_to(source).as_posix()
+                       for f in source.rglob('*.json'))
+        yield names, lambda name: (source / name).read_bytes()
+        return
+    with zipfile.ZipFile(source, 'r') as z:
+        yield z.namelist(), z.read
+
+
+def iter_archive_folders(source, folders, chunk_size=5000):
+    """
+    Yields tuples of (folder, list of raw json bytes) for entries in any of
+    the folders of the archive, e.g. ('processes', 'flows'), in chunks of
+    chunk_size entries per folder. The archive is read in a single pass.
+    """
+    chunks = {f: [] for f in folders}
+    with _open_source(source) as (names, read):
+        for name in names:
+            folder = name.split('/', 1)[0]
+            if folder not in chunks or not name.endswith('.json'):
+                continue
+            chunks[folder].append(read(name))
+            if len(chunks[folder]) >= chunk_size:
+                yield folder, chunks[folder]
+                chunks[folder] = []
+    for folder, chunk in chunks.items():
+        if chunk:
+            yield folder, chunk
+
+
+def iter_archive_entries(source, folder, chunk_size=5000):
+    """
+    Yields lists of raw json bytes for entries in the folder of the archive,
+    e.g. 'processes', in chunks of chunk_size entries.
+    """
+    for _, chunk in iter_archive_folders(source, [folder], chunk_size):
+        yield chunk
+
+
+def _summarize_process(d: dict) -> dict:
+    """Replaces nested lists in a process dict with scalar summaries"""
+    for e in d.get('exchanges', []):
+        if e.get('isQuantitativeReference'):
+            d['ref_flow'] = e.get('flow', {}).get('name')
+            d['ref_flow_id'] = e.get('flow', {}).get('@id')
+            break
+    doc = d.get('processDocumentation', {})
+    if 'sources' in doc:
+        doc['sources'] = '; '.join(s.get('name', '') for s in doc['sources'])
+    for field in list_fields:
+        if field in d:
+            d[field] = len(d[field])
+    return d
+
+
+def _decode_processes(chunk: list) -> list:
+    return [_summarize_process(json.loads(b)) for b in chunk if b]
+
+
+def _iter_decoded(source, decoders, workers=1, chunk_size=5000):
+    """Yields (folder, decode(chunk)) for chunks of entries in the archive,
+    where decoders is a dict of folder to decode function, decoding chunks
+    in parallel when workers > 1"""
+    chunks = iter_archive_folders(source, list(decoders), chunk_size)
+    if workers <= 1:
+        for folder, chunk in chunks:
+            yield folder, decoders[folder](chunk)
+        return
+    # keep a bounded number of chunks in flight so the archive is streamed
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for folder, chunk in chunks:
+            pending.append((folder, executor.submit(decoders[folder], chunk)))
+            if len(pending) >= 2 * workers:
+                folder, future = pending.pop(0)
+                yield folder, future.result()
+        for folder, future in pending:
+            yield folder, future.result()
+
+
+def iter_process_records(source, workers=1, chunk_size=5000):
+    """Yields lists of flattened process dicts from the archive"""
+    for _, records in _iter_decoded(source, {'processes': _decode_processes},
+                                    workers, chunk_size):
+        yield records
+
+
+def build_process_table(sources: dict,
+                        columns: list = None,
+                        assessment: str = None,
+                        workers: int = 1,
+                        auth: bool = False,
+                        ) -> pd.DataFrame:
+    """
+    Creates a flattened process table with one row per process, following
+    data/process_table_fields.csv
+
+    :param sources: dict where the key is the repo label and the value is the
+        archive: a zip file, directory of JSON-LD files or a response from
+        return_request. When the value is None the repo is downloaded from
+        the FLCAC.
+    :param columns: list of columns to return, defaults to those flagged to
+        keep in process_table_fields.csv
+    :param assessment: str, optional, see get_process_table_fields
+    :param workers: int, number of processes used to decode entries
+    :param auth: bool, if authorized access to FLCAC is required set to True
+    """
+    if columns is None:
+        columns = get_process_table_fields(assessment)
+    token = None
+    if auth and any(v is None for v in sources.values()):
+        token = login()
+    config = get_config()
+    frames = []
+    for repo, source in sources.items():
+        if source is None:
+            repo_data = config.get(repo)
+            if not repo_data:
+                raise ValueError(f'{repo} not found in config!')
+            print(f'Accessing API for {repo}')
+            source = return_request(owner=repo_data.get('owner'),
+                                    repo=repo_data.get('repo'),
+                                    object_type='PROCESS',
+                                    token=token)
+        for records in iter_process_records(source, workers=workers):
+            df = pd.json_normalize(records)
+            df['repo'] = repo
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True)
+    if 'category' in df:
+        df['last_cat'] = df['category'].str.rsplit('/', n=1).str[-1].str.strip()
+    return df.reindex(columns=columns)
+
+
+def _decode_exchanges(chunk: list) -> dict:
+    """Returns a dict of column arrays with one entry per exchange for the
+    process entries in chunk"""
+    cols = {k: [] for k in exchange_columns}
+    for b in chunk:
+        if not b:
+            continue
+        d = json.loads(b)
+        exchanges = d.get('exchanges', [])
+        n = len(exchanges)
+        cols['ProcessID'].extend([d.get('@id')] * n)
+        cols['ProcessCategory'].extend([d.get('category')] * n)
+        cols['ProcessName'].extend([d.get('name')] * n)
+        cols['location'].extend([d.get('location', {}).get('@id')] * n)
+        for e in exchanges:
+            flow = e.get('flow', {})
+            provider = e.get('defaultProvider', {})
+            cols['FlowUUID'].append(flow.get('@id'))
+            cols['FlowName'].append(flow.get('name'))
+            cols['Context'].append(flow.get('category'))
+            cols['FlowType'].append(flow.get('flowType'))
+            cols['IsInput'].append(e.get('isInput', False))
+            cols['reference'].append(e.get('isQuantitativeReference', False))
+            cols['default_provider'].append(provider.get('@id'))
+            cols['default_provider_name'].append(provider.get('name'))
+            cols['description'].append(e.get('description'))
+            cols['amount'].append(e.get('amount'))
+            cols['unit'].append(e.get('unit', {}).get('name'))
+            cols['avoided_product'].append(e.get('isAvoidedProduct', False))
+            cols['exchange_dqi'].append(e.get('dqEntry'))
+    return cols
+
+
+def _decode_flows(chunk: list) -> dict:
+    cols = {'FlowUUID': [], 'flow_type': [], 'flow_category': []}
+    for b in chunk:
+        if not b:
+            continue
+        d = json.loads(b)
+        cols['FlowUUID'].append(d.get('@id'))
+        cols['flow_type'].append(d.get('flowType'))
+        cols['flow_category'].append(d.get('category'))
+    return cols
+
+
+def _decode_locations(chunk: list) -> dict:
+    cols = {'location': [], 'code': []}
+    for b in chunk:
+        if not b:
+            continue
+        d = json.loads(b)
+        cols['location'].append(d.get('@id'))
+        cols['code'].append(d.get('code'))
+    return cols
+
+
+# columns in the exchange table, as in exchange_schema plus process location
+# and the name of the default provider
+exchange_columns = (list(exchange_schema.keys()) +
+                    ['location', 'default_provider_name'])
+
+
+def build_exchange_table(source,
+                         workers: int = 1,
+                         chunk_size: int = 5000
+                         ) -> pd.DataFrame:
+    """
+    Creates a long format table with one row per exchange for all processes
+    in a JSON-LD archive, using the columns in exchange_schema so that the
+    table can be compared to (or used as) input to build_process_dict.
+
+    :param source: zip file, directory of JSON-LD files, bytes or a response
+        from return_request, e.g. a FLCAC download or write_objects output
+    :param workers: int, number of processes used to decode entries
+    """
+    # exchanges, flows and locations are collected in one pass of the archive
+    frames = {'processes': [], 'flows': [pd.DataFrame(_decode_flows([]))],
+              'locations': [pd.DataFrame(_decode_locations([]))]}
+    for folder, cols in _iter_decoded(source,
+                                      {'processes': _decode_exchanges,
+                                       'flows': _decode_flows,
+                                       'locations': _decode_locations},
+                                      workers, chunk_size):
+        frames[folder].append(pd.DataFrame(cols))
+    if not frames['processes']:
+        return pd.DataFrame(columns=exchange_columns)
+    df = pd.concat(frames['processes'], ignore_index=True)
+
+    # flow type and context are not always stored on the exchange, fill from
+    # the flow objects in the archive when available
+    flows = pd.concat(frames['flows'], ignore_index=True)
+    if len(flows):
+        flows = flows.drop_duplicates('FlowUUID').set_index('FlowUUID')
+        df['FlowType'] = df['FlowType'].fillna(
+            df['FlowUUID'].map(flows['flow_type']))
+        df['Context'] = df['Context'].fillna(
+            df['FlowUUID'].map(flows['flow_category']))
+
+    # replace location ids with location codes when available
+    locs = pd.concat(frames['locations'], ignore_index=True)
+    if len(locs):
+        locs = locs.drop_duplicates('location').set_index('location')['code']
+        df['location'] = df['location'].map(locs).fillna(df['location'])
+
+    return df.astype({'IsInput': bool, 'reference': bool,
+                      'avoided_product': bool, 'amount': float})
+
+
+def write_process_table(df: pd.DataFrame, path: Path):
+    """Writes the process table to parquet (requires pyarrow)"""
+    # mixed types in object columns are stored as strings
+    obj_cols = df.select_dtypes(include='object').columns
+    df = df.astype({c: 'string' for c in obj_cols})
+    df.to_parquet(path, index=False)
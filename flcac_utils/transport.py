@@ -0,0 +1,200 @@
+"""
+Transports used by commons_api to send requests to the FLCAC. Responses can be
+recorded to a fixture directory and replayed, either directly or through a
+local stand-in server with configurable latency and bandwidth.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+def fixture_key(method, url):
+    """Returns the fixture file stem for a request. The host is ignored so
+    that fixtures recorded from the FLCAC can be served from any address."""
+    parts = urlsplit(url)
+    path = parts.path
+    if parts.query:
+        path = f'{path}?{parts.query}'
+    return hashlib.sha1(f'{method.upper()} {path}'.encode()).hexdigest()[:20]
+
+
+def save_fixture(fixture_path, method, url, status_code, content,
+                 headers=None, cookies=None):
+    """Writes a single response to the fixture directory"""
+    fixture_path = Path(fixture_path)
+    fixture_path.mkdir(parents=True, exist_ok=True)
+    key = fixture_key(method, url)
+    (fixture_path / f'{key}.bin').write_bytes(content)
+    meta = {'method': method.upper(),
+            'url': url,
+            'status_code': status_code,
+            'headers': dict(headers or {}),
+            'cookies': dict(cookies or {})}
+    with open(fixture_path / f'{key}.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_fixture(fixture_path, method, url):
+    """Returns a FixtureResponse for the request or None if not recorded"""
+    fixture_path = Path(fixture_path)
+    key = fixture_key(method, url)
+    if not (fixture_path / f'{key}.json').exists():
+        return None
+    with open(fixture_path / f'{key}.json') as f:
+        meta = json.load(f)
+    content = (fixture_path / f'{key}.bin').read_bytes()
+    return FixtureResponse(status_code=meta['status_code'],
+                           content=content,
+                           headers=meta.get('headers'),
+                           cookies=meta.get('cookies'),
+                           url=url)
+
+
+class FixtureResponse:
+    """Minimal stand-in for requests.Response built from a fixture"""
+
+    def __init__(self, status_code, content, headers=None, cookies=None,
+                 url=''):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.cookies = cookies or {}
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class LiveTransport:
+    """Sends requests to the network"""
+
+    def get(self, url, **kwargs):
+        import requests
+        return requests.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        import requests
+        return requests.post(url, **kwargs)
+
+
+class RecordingTransport(LiveTransport):
+    """Sends requests to the network and records each response to
+    fixture_path"""
+
+    def __init__(self, fixture_path):
+        self.fixture_path = Path(fixture_path)
+
+    def _record(self, method, url, resp):
+        save_fixture(self.fixture_path, method, url,
+                     status_code=resp.status_code,
+                     content=resp.content,
+                     headers={'Content-Type':
+                              resp.headers.get('Content-Type', '')},
+                     cookies=resp.cookies.get_dict())
+        return resp
+
+    def get(self, url, **kwargs):
+        return self._record('GET', url, super().get(url, **kwargs))
+
+    def post(self, url, **kwargs):
+        return self._record('POST', url, super().post(url, **kwargs))
+
+
+class ReplayTransport:
+    """Returns responses recorded in fixture_path without using the network"""
+
+    def __init__(self, fixture_path):
+        self.fixture_path = Path(fixture_path)
+
+    def _replay(self, method, url):
+        resp = load_fixture(self.fixture_path, method, url)
+        if resp is None:
+            raise FileNotFoundError(f'No fixture recorded for {method} {url}')
+        return resp
+
+    def get(self, url, **kwargs):
+        return self._replay('GET', url)
+
+    def post(self, url, **kwargs):
+        return self._replay('POST', url)
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+
+    def _send(self, method):
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        body = self.rfile.read(length) if length else b''
+        server = self.server
+        resp = None
+        for handler in server.post_handlers if method == 'POST' else []:
+            resp = handler(self.path, self.headers, body)
+            if resp is not None:
+                break
+        if resp is None:
+            resp = load_fixture(server.fixture_path, method, self.path)
+        if server.latency:
+            time.sleep(server.latency)
+        if resp is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(resp.status_code)
+        for k, v in resp.headers.items():
+            if k.lower() not in ('content-length', 'transfer-encoding'):
+                self.send_header(k, v)
+        for k, v in resp.cookies.items():
+            self.send_header('Set-Cookie', f'{k}={v}; Path=/')
+        self.send_header('Content-Length', str(len(resp.content)))
+        self.end_headers()
+        if not server.bandwidth:
+            self.wfile.write(resp.content)
+            return
+        # throttle by writing fixed chunks at the configured bytes per second
+        chunk = max(1, int(server.bandwidth / 20))
+        for i in range(0, len(resp.content), chunk):
+            self.wfile.write(resp.content[i:i + chunk])
+            time.sleep(chunk / server.bandwidth)
+
+    def do_GET(self):
+        self._send('GET')
+
+    def do_POST(self):
+        self._send('POST')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_fixtures(fixture_path, host='127.0.0.1', port=0, latency=0,
+                   bandwidth=None, post_handlers=None):
+    """
+    Starts a local HTTP server in a background thread that serves responses
+    recorded in fixture_path.
+
+    :param latency: float, seconds to wait before each response
+    :param bandwidth: float, bytes per second used to send response bodies
+    :param post_handlers: list of functions called with (path, headers, body)
+        for POST requests, returning a FixtureResponse or None to fall back
+        to the recorded fixtures
+    :return: server, call server.shutdown() when done. The base url to use in
+        place of commons_api.commons_base is available as server.base_url
+    """
+    server = ThreadingHTTPServer((host, port), _FixtureHandler)
+    server.fixture_path = Path(fixture_path)
+    server.latency = latency
+    server.bandwidth = bandwidth
+    server.post_handlers = post_handlers or []
+    server.base_url = (f'http://{host}:{server.server_address[1]}'
+                       '/lca-collaboration')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,140 @@
+"""
+Unit conversion within openLCA unit groups. Units and groups follow
+olca_schema.units; conversion factors to the reference unit of each group are
+in data/unit_conversions.csv.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import olca_schema.units as units
+
+parent_path = Path(__file__).parent
+data_path = parent_path / 'data'
+
+# convert units to units in olca_schema.units
+unit_dict = {
+    "metric ton": "ton"
+}
+
+_conversions = None
+_matrix = None
+
+
+def get_unit_conversions() -> pd.DataFrame:
+    """
+    Returns a DataFrame indexed by unit with the unit group (from
+    olca_schema.units), the reference unit of the group and the factor to
+    convert one unit to the reference unit
+    """
+    global _conversions
+    if _conversions is None:
+        df = pd.read_csv(data_path / 'unit_conversions.csv',
+                         encoding='utf-8', dtype={'Unit': str,
+                                                  'ReferenceUnit': str})
+        df['UnitGroup'] = [units.group_ref(u).name for u in df['Unit']]
+        _conversions = df.set_index('Unit')
+    return _conversions
+
+
+def conversion_matrix() -> pd.DataFrame:
+    """
+    Returns a square DataFrame of factors where the value at [a, b] converts
+    an amount in unit a to unit b, NaN when the units are in different groups
+    """
+    global _matrix
+    if _matrix is None:
+        df = get_unit_conversions()
+        factor = df['ConversionFactor'].to_numpy()
+        group = df['UnitGroup'].to_numpy()
+        m = np.where(group[:, None] == group[None, :],
+                     factor[:, None] / factor[None, :], np.nan)
+        _matrix = pd.DataFrame(m, index=df.index, columns=df.index)
+    return _matrix
+
+
+def _unit_codes(unit) -> np.ndarray:
+    """Position of each unit in conversion_matrix, -1 if unknown"""
+    unit = pd.Series(np.asarray(unit, dtype=object)).replace(unit_dict)
+    return conversion_matrix().index.get_indexer(unit)
+
+
+def conversion_factors(from_unit, to_unit) -> np.ndarray:
+    """
+    Vectorized factors converting each entry of from_unit to the matching
+    entry of to_unit (either may be a single unit). Returns NaN where either
+    unit is unknown or the units are not in the same group.
+    """
+    n = max(np.size(from_unit), np.size(to_unit))
+    i = np.broadcast_to(_unit_codes(np.atleast_1d(from_unit)), n)
+    j = np.broadcast_to(_unit_codes(np.atleast_1d(to_unit)), n)
+    m = conversion_matrix().to_numpy()
+    known = (i >= 0) & (j >= 0)
+    return np.where(known, m[i, np.where(known, j, 0)], np.nan)
+
+
+def reference_units(unit) -> np.ndarray:
+    """Returns the reference unit of the group of each unit, NaN if unknown"""
+    ref = get_unit_conversions()['ReferenceUnit'].to_numpy(dtype=object)
+    codes = _unit_codes(np.atleast_1d(unit))
+    return np.where(codes >= 0, ref[codes], np.nan)
+
+
+def unknown_units(unit) -> list:
+    """Returns the units that can not be resolved by olca_schema.units, see
+    harmonize_units to replace units in unit_dict"""
+    return sorted({u for u in pd.unique(np.asarray(unit, dtype=object))
+                   if units.unit_ref(u) is None}, key=str)
+
+
+def harmonize_units(df: pd.DataFrame,
+                    target=None,
+                    amount_col: str = 'amount',
+                    unit_col: str = 'unit'
+                    ) -> pd.DataFrame:
+    """
+    Converts the amount column of df to a common unit in a single step.
+
+    :param target: str, a unit that all rows are converted to; dict, of unit
+        group name to unit, e.g. {'Units of mass': 't'}; or None to convert
+        each row to the reference unit of its group. Rows with unknown units,
+        or groups not in a target dict, are unchanged.
+    """
+    df = df.copy()
+    unit = df[unit_col].replace(unit_dict).to_numpy(dtype=object)
+    if target is None:
+        to_unit = reference_units(unit)
+    elif isinstance(target, dict):
+        group = get_unit_conversions()['UnitGroup']
+        to_unit = pd.Series(unit).map(group).map(target).to_numpy(dtype=object)
+    else:
+        to_unit = np.full(len(df), target, dtype=object)
+    to_unit = np.where(pd.isna(to_unit), unit, to_unit)
+    factor = conversion_factors(unit, to_unit)
+    if target is not None and not isinstance(target, dict):
+        bad = pd.unique(unit[np.isnan(factor)])
+        if len(bad):
+            print(f'WARNING: unable to convert {", ".join(map(str, bad))} '
+                  f'to {target}')
+    convert = ~np.isnan(factor)
+    df[amount_col] = np.where(convert, df[amount_col] * factor, df[amount_col])
+    df[unit_col] = np.where(convert, to_unit, unit)
+    return df
+
+
+def check_conversion_factors(df: pd.DataFrame, rtol: float = 0.01
+                             ) -> pd.DataFrame:
+    """
+    Compares the ConversionFactor in a tech flow mapping file to the factor
+    between SourceUnit and TargetUnit. Returns the rows where these units are
+    in the same group and the ConversionFactor differs by more than rtol
+    (including missing factors), with the expected factor added.
+    """
+    df = df.copy()
+    df['ExpectedFactor'] = conversion_factors(df['SourceUnit'],
+                                              df['TargetUnit'])
+    given = pd.to_numeric(df['ConversionFactor'], errors='coerce').fillna(1)
+    mismatch = (df['ExpectedFactor'].notna() &
+                ~np.isclose(given, df['ExpectedFactor'], rtol=rtol))
+    return df[mismatch.to_numpy()]
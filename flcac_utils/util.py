@@ -3,15 +3,19 @@ Supporting functions
 """
 
 import datetime
+import hashlib
 import math
+import pickle
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import olca_schema as o
-import esupy.bibtex
-from esupy.location import extract_coordinates
 from flcac_utils.commons_api import read_commons_data, get_single_object
 from flcac_utils.generate_processes import _set_base_attributes
 import zipfile
+import fnmatch
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 
 def assign_year_to_meta(meta, year1, year2=None):
@@ -38,6 +42,7 @@ def generate_locations_from_exchange_df(df):
     if 'location' not in df.columns:
         raise KeyError('"location" must be present in the dataframe to '
                        'generate location objects')
+    from esupy.location import extract_coordinates
     geo_json = extract_coordinates(group='countries')
     locations = dict((k, geo_json[k]) for k in df['location'].unique()
                      if not pd.isnull(k))
@@ -106,7 +111,8 @@ def extract_actors_from_process_meta(process_meta: dict,
     actor_objs = {}
     if actor_dict:
         # Extract actors from API, recreate dictionary in correct format
-        actors = read_commons_data(actor_dict, auth=kwargs.get('auth', False))
+        actors = read_commons_data(actor_dict, auth=kwargs.get('auth', False),
+                                   plan=kwargs.get('plan'))
         for repo, a_list in actors.items():
             actor_objs = {a.name: a for a in a_list}
     if len(actor_list) != len(actor_objs):
@@ -119,8 +125,81 @@ def extract_actors_from_process_meta(process_meta: dict,
     return process_meta, actor_objs
 
 
+# olca.Source objects generated from each bib file, keyed by file path,
+# modification time and size, then by (bib id, Source.name); None where the
+# bib id is not in the file. See generate_bib_sources
+_bib_cache = {}
+
+
+def _bib_cache_file(bib_path: Path, cache_path: Path) -> Path:
+    digest = hashlib.sha1(bib_path.read_bytes()).hexdigest()[:16]
+    return Path(cache_path) / f'{bib_path.stem}_{digest}.sources.pkl'
+
+
+def _load_bib_index(bib_path: Path, bibids: dict,
+                    cache_path: Path = None) -> dict:
+    """Returns a dict of (bib id, Source.name) to olca.Source for bib_path
+    that includes all items of bibids, generating only those not generated
+    before for this version of the file"""
+    stat = bib_path.stat()
+    key = (str(bib_path.resolve()), stat.st_mtime_ns, stat.st_size)
+    index = _bib_cache.get(key)
+    if index is None:
+        index = {}
+        if cache_path is not None:
+            cache_file = _bib_cache_file(bib_path, cache_path)
+            if cache_file.exists():
+                with open(cache_file, 'rb') as f:
+                    index = pickle.load(f)
+        _bib_cache[key] = index
+    missing = {k: v for k, v in bibids.items() if (k, v) not in index}
+    if not missing:
+        return index
+    import esupy.bibtex
+    # esupy derives attributes such as the id from the requested name, so
+    # sources are generated for each requested name
+    generated = {s.name: s for s in esupy.bibtex.generate_sources(
+        bib_path = bib_path,
+        bibids = missing)}
+    for k, v in missing.items():
+        s = generated.get(v)
+        if s is not None and s.year == '':
+            # esupy assigns blank when it needs to be None due to int type
+            # see #3, consider direct fix in esupy
+            s.year = None
+        index[(k, v)] = s
+    if cache_path is not None:
+        cache_file = _bib_cache_file(bib_path, cache_path)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_file, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return index
+
+
+def generate_bib_sources(bib_path: Path,
+                         bibids: dict,
+                         cache_path: Path = None
+                         ) -> list:
+    """
+    Returns olca.Source objects for bibids ({'bib_id': 'Source.name'}) using
+    esupy.bibtex.generate_sources. Sources are kept in memory (and in
+    cache_path if provided) for each version of the .bib file, so that
+    esupy is only called for ids and names not requested before. Each call
+    returns new copies, so changes to a returned Source do not affect later
+    calls. Ids not in the bib file are skipped.
+    """
+    index = _load_bib_index(Path(bib_path), bibids, cache_path)
+    sources = []
+    for k, v in bibids.items():
+        s = index.get((k, v))
+        if s is not None:
+            sources.append(o.Source.from_dict(s.to_dict()))
+    return sources
+
+
 def extract_sources_from_process_meta(process_meta: dict,
-                                      bib_path: Path
+                                      bib_path: Path,
+                                      cache_path: Path = None
                                       ) -> (dict, dict):
     """
     Based on a metadata file, for all potential metadata fields which are sources,
@@ -128,6 +207,9 @@ def extract_sources_from_process_meta(process_meta: dict,
     Metadata fields must be in the format of {'bib_id': 'Source.name'}
     Process metadata file is modified and returned to leave only the source name
 
+    :param cache_path: Path, optional, folder in which generated sources are
+        stored by bib file, see generate_bib_sources
+
     Returns a dictionary of {'Source.name': olca.Source}
     """
     print('Identifying sources from metadata')
@@ -143,17 +225,12 @@ def extract_sources_from_process_meta(process_meta: dict,
                 all_source_dict.update(s_dict)
                 l.append(list(s_dict.values())[0])
             process_meta[field] = l
-    source_list = esupy.bibtex.generate_sources(
+    source_list = generate_bib_sources(
         bib_path = bib_path,
-        bibids = all_source_dict)
+        bibids = all_source_dict,
+        cache_path = cache_path)
     # rearrange the structure of the dictionary to {name: olca.Source}
-    source_objs = {}
-    for k in source_list:
-        if k.year == '':
-            # esupy assigns blank when it needs to be None due to int type
-            # see #3, consider direct fix in esupy
-            k.year = None
-        source_objs[k.name] = k
+    source_objs = {k.name: k for k in source_list}
 
     return process_meta, source_objs
 
@@ -180,7 +257,8 @@ def extract_dqsystems(dq_dict: dict, **kwargs) -> dict['str', o.DQSystem]:
     #                   'US EPA - Flow Pedigree Matrix']}
     #     }
     # Extract dq_systems from API, recreate dictionary in correct format
-    dqsystems = read_commons_data(api_dict, auth=kwargs.get('auth', False))
+    dqsystems = read_commons_data(api_dict, auth=kwargs.get('auth', False),
+                                  plan=kwargs.get('plan'))
     dq_objs = {}
     for repo, dq_list in dqsystems.items():
         for d in dq_list:
@@ -197,11 +275,16 @@ def extract_flows(flow_dict: dict, add_tags=False, **kwargs) -> dict['str', o.Fl
     """
     :param: flow_dict dictionary that takes the form of
         {<repo>: [flow.Name, flow.Name, ...]}
+    :kwargs:
+        lazy: bool, if True flows are returned as LazyObject proxies which
+            are only converted to o.Flow when needed
     Returns a dictionary of {'flow.Name': o.Flow}
     """
     print('Extracting flows')
     flow_dict = {k: {'FLOWS': v} for k,v in flow_dict.items()}
-    api_flows = read_commons_data(flow_dict, auth=kwargs.get('auth', False))
+    api_flows = read_commons_data(flow_dict, auth=kwargs.get('auth', False),
+                                  lazy=kwargs.get('lazy', False),
+                                  plan=kwargs.get('plan'))
 
     # rearrange the structure of the dictionary to {name: olca.Flow}
     flow_objs = {}
@@ -222,7 +305,9 @@ def extract_processes(process_dict: dict, to_ref = False, **kwargs
     """
     print('Extracting processes')
     process_dict = {k: {'PROCESS': v} for k,v in process_dict.items()}
-    api_processes = read_commons_data(process_dict, auth=kwargs.get('auth', False))
+    # only the reference is kept, so full objects are not built when to_ref
+    api_processes = read_commons_data(process_dict, auth=kwargs.get('auth', False),
+                                      lazy=to_ref, plan=kwargs.get('plan'))
 
     # rearrange the structure of the dictionary to {name: olca.Process}
     process_objs = {}
@@ -278,6 +363,75 @@ def round_to_sig_figs(number, sig_figs):
     return round(number, decimal_places)
 
 
+def round_array_to_sig_figs(values, sig_figs):
+    """
+    Array version of round_to_sig_figs, giving identical results for each
+    element. Zeros are returned as 0.0, NaN and inf are returned unchanged.
+
+    Args:
+        values (array-like or pd.Series): The numbers to round.
+        sig_figs (int or array-like): Significant figures, either one value
+            for all elements or one per element.
+
+    Returns:
+        np.ndarray (or pd.Series if values is a Series) of floats.
+    """
+    x = np.asarray(values, dtype=float)
+    sig = np.broadcast_to(np.asarray(sig_figs, dtype=int), x.shape)
+    out = x.copy()
+    ok = np.isfinite(x) & (x != 0)
+    out[x == 0] = 0.0
+    # non-finite values and zeros are masked out by ok
+    with np.errstate(all='ignore'):
+        log = np.log10(np.abs(x))
+        # np.log10 and math.log10 can disagree by an ulp, which matters only
+        # when the result is close to an integer
+        near = ok & (np.abs(log - np.rint(log)) < 1e-9)
+        log[near] = [math.log10(abs(float(v))) for v in x[near]]
+        places = np.zeros(x.shape, dtype=int)
+        places[ok] = sig[ok] - 1 - np.floor(log[ok]).astype(int)
+
+        # Round by scaling to an integer. This is exact where the power of ten
+        # is exactly representable and the scaled value is not close to a
+        # rounding tie, otherwise use round() as in round_to_sig_figs
+        fast = ok & (np.abs(places) <= 22)
+        scale = 10.0 ** np.abs(np.where(fast, places, 0))
+        scaled = np.where(places >= 0, x * scale, x / scale)
+        frac = np.abs(scaled - np.trunc(scaled))
+        fast &= ((np.abs(frac - 0.5) > 2 * np.abs(np.spacing(scaled))) &
+                 (np.abs(scaled) < 2 ** 52))
+        n = np.rint(scaled)
+        out[fast] = np.where(places >= 0, n / scale, n * scale)[fast]
+    slow = ok & ~fast
+    out[slow] = [round(float(v), int(p))
+                 for v, p in zip(x[slow], places[slow])]
+    if isinstance(values, pd.Series):
+        return pd.Series(out, index=values.index, name=values.name)
+    return out
+
+
+def round_exchange_amounts(df: pd.DataFrame, sig_figs) -> pd.DataFrame:
+    """
+    Optional stage before build_process_dict to round the amount column.
+
+    :param df: DataFrame of process and exchange data; see exchange_schema
+    :param sig_figs: int, or dict of FlowType to significant figures, e.g.
+        {'ELEMENTARY_FLOW': 3, 'PRODUCT_FLOW': 4}. Flow types not in the
+        dict are not rounded unless a 'default' key is given.
+    """
+    df = df.copy()
+    if isinstance(sig_figs, dict):
+        sig = df['FlowType'].map(sig_figs)
+        if 'default' in sig_figs:
+            sig = sig.fillna(sig_figs['default'])
+        rounded = sig.notna().to_numpy()
+        df.loc[rounded, 'amount'] = round_array_to_sig_figs(
+            df.loc[rounded, 'amount'], sig[rounded].astype(int).to_numpy())
+    else:
+        df['amount'] = round_array_to_sig_figs(df['amount'], sig_figs)
+    return df
+
+
 if __name__ == "__main__":
     dq_dict = {'Process': {'Federal LCA Commons Core Database':
                            'US EPA - Process Pedigree Matrix'},
@@ -294,12 +448,67 @@ if __name__ == "__main__":
     flow_dict = extract_flows(flow_dict)
 
 
+def _latest_zip(fpath_zip: Path) -> Path:
+    """Returns fpath_zip or the most recently created ZIP file in it"""
+    if not fpath_zip.exists():
+        raise FileNotFoundError(f"Path not found: {fpath_zip}")
+    if fpath_zip.is_dir():
+        zip_files = list(fpath_zip.glob("*.zip"))
+        if not zip_files:
+            raise FileNotFoundError(f"No ZIP files found in directory: {fpath_zip}")
+        return max(zip_files, key=lambda z: z.stat().st_ctime)
+    return fpath_zip
+
+
+def _select_members(infos: list, members: list | None) -> list:
+    """Filters ZipInfo entries to those in a folder (e.g. 'processes') or
+    matching a glob pattern (e.g. 'flows/*.json') in members"""
+    infos = [i for i in infos if not i.is_dir()]
+    if members is None:
+        return infos
+    if isinstance(members, str):
+        members = [members]
+    folders = tuple(m.rstrip('/') + '/' for m in members
+                    if not any(c in m for c in '*?['))
+    patterns = [m for m in members if any(c in m for c in '*?[')]
+    return [i for i in infos if i.filename.startswith(folders) or
+            any(fnmatch.fnmatchcase(i.filename, p) for p in patterns)]
+
+
+def _is_unchanged(info: zipfile.ZipInfo, path: Path) -> bool:
+    """True if the file at path matches the size and CRC stored in the ZIP"""
+    if not path.is_file() or path.stat().st_size != info.file_size:
+        return False
+    crc = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            crc = zlib.crc32(chunk, crc)
+    return crc == info.CRC
+
+
+def _member_folder(output_folder: Path, name: str) -> Path:
+    """Folder that ZipFile.extract writes member name to, with absolute and
+    parent ('..') path components removed in the same way"""
+    parts = [p for p in name.split('/')[:-1] if p not in ('', '.', '..')]
+    return output_folder.joinpath(*parts)
+
+
+def _extract_members(fpath_zip: Path, names: list, output_folder: Path):
+    # each worker reads from its own handle on the archive
+    with zipfile.ZipFile(fpath_zip, 'r') as archive:
+        for name in names:
+            archive.extract(name, output_folder)
+
+
 def extract_latest_zip(
     fpath_zip: Path,
     working_dir: Path,
     output_folder_name: str | None = None,
     overwrite: bool = True,
     delete_zip: bool = False,
+    members: list[str] | None = None,
+    workers: int = 1,
+    skip_unchanged: bool = False,
 ) -> Path:
     """
     Extract the most recently created ZIP file from a directory (or a single ZIP file),
@@ -310,24 +519,20 @@ def extract_latest_zip(
         working_dir (Path): Main working directory where extracted files will be placed.
         output_folder_name (str | None): Optional name for the output folder. Defaults to ZIP name.
         overwrite (bool): Whether to overwrite existing files. Defaults to True.
+        members (list[str] | None): Folders (e.g. 'processes') or glob patterns
+            (e.g. 'flows/*.json') to extract. Defaults to all files.
+        workers (int): Number of threads used to decompress files.
+        skip_unchanged (bool): Skip files that already exist with the size and
+            CRC stored in the ZIP.
 
     Returns:
         Path: Path to the directory where files were extracted.
     """
-    if not fpath_zip.exists():
-        raise FileNotFoundError(f"Path not found: {fpath_zip}")
-
     if not working_dir.exists():
         working_dir.mkdir(parents=True)
 
     # Determine the ZIP file to extract
-    if fpath_zip.is_dir():
-        zip_files = list(fpath_zip.glob("*.zip"))
-        if not zip_files:
-            raise FileNotFoundError(f"No ZIP files found in directory: {fpath_zip}")
-        latest_zip = max(zip_files, key=lambda z: z.stat().st_ctime)
-    else:
-        latest_zip = fpath_zip
+    latest_zip = _latest_zip(fpath_zip)
 
     # Decide output folder name
     if output_folder_name:
@@ -339,17 +544,63 @@ def extract_latest_zip(
 
     try:
         with zipfile.ZipFile(latest_zip, 'r') as archive:
-            if not overwrite:
-                existing_files = [output_folder / name for name in archive.namelist() if (output_folder / name).exists()]
-                if existing_files:
-                    print(f"Skipping extraction; files already exist: {existing_files}")
-                    return output_folder
-            archive.extractall(output_folder)
+            infos = _select_members(archive.infolist(), members)
     except zipfile.BadZipFile:
         raise ValueError(f"Invalid ZIP file: {latest_zip}")
+    if not overwrite:
+        existing_files = [output_folder / i.filename for i in infos
+                          if (output_folder / i.filename).exists()]
+        if existing_files:
+            print(f"Skipping extraction; files already exist: {existing_files}")
+            return output_folder
+    if skip_unchanged:
+        n = len(infos)
+        infos = [i for i in infos
+                 if not _is_unchanged(i, output_folder / i.filename)]
+        if n > len(infos):
+            print(f"Skipping {n - len(infos)} unchanged files")
+
+    # extract the largest files first so work is spread evenly
+    names = [i.filename for i in
+             sorted(infos, key=lambda i: i.compress_size, reverse=True)]
+    if workers > 1 and len(names) > 1:
+        # create all folders first, parallel extracts race to create shared
+        # parent folders
+        for folder in {_member_folder(output_folder, n) for n in names}:
+            folder.mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_extract_members, latest_zip,
+                                       names[k::workers], output_folder)
+                       for k in range(workers)]
+            for future in futures:
+                future.result()
+    else:
+        _extract_members(latest_zip, names, output_folder)
 
     if delete_zip:
         latest_zip.unlink()
 
     print(f"Extracted files from {latest_zip.name} to {output_folder}")
     return output_folder
+
+
+def iter_zip_entries(fpath_zip: Path, members: list[str] | None = None):
+    """
+    Reads files straight from the most recently created ZIP file in a
+    directory (or a single ZIP file) without extracting them to disk.
+
+    Args:
+        fpath_zip (Path): Path to a ZIP file or a directory containing ZIP files.
+        members (list[str] | None): Folders or glob patterns to read, as in
+            extract_latest_zip. Defaults to all files.
+
+    Yields:
+        tuple: (name, bytes) for each selected file.
+    """
+    latest_zip = _latest_zip(fpath_zip)
+    try:
+        with zipfile.ZipFile(latest_zip, 'r') as archive:
+            for info in _select_members(archive.infolist(), members):
+                yield info.filename, archive.read(info)
+    except zipfile.BadZipFile:
+        raise ValueError(f"Invalid ZIP file: {latest_zip}")
@@ -0,0 +1,60 @@
+"""
+Deterministic UUIDs for flows and processes. Ids are generated with
+esupy.util.make_uuid, so are identical to those already published, but each
+unique input is hashed only once.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# maximum number of ids kept in memory across a build
+memo_size = 2 ** 18
+
+
+def _typed_key(args) -> tuple:
+    """Cache key for args that keeps values of different types apart, e.g.
+    2020 and 2020.0 or 1 and True, which esupy hashes as different strings"""
+    return tuple((type(a), a) for a in args)
+
+
+@lru_cache(maxsize=memo_size)
+def _memo_uuid(key: tuple) -> str:
+    from esupy.util import make_uuid
+    return make_uuid(*(a for _, a in key))
+
+
+def cached_uuid(*args) -> str:
+    """Returns make_uuid(*args), memoized for repeated inputs"""
+    try:
+        return _memo_uuid(_typed_key(args))
+    except TypeError:
+        # unhashable arguments, e.g. lists
+        from esupy.util import make_uuid
+        return make_uuid(*args)
+
+
+def make_uuids(*columns):
+    """
+    Vectorized make_uuid over one or more equal length columns, equivalent to
+    [make_uuid(*row) for row in zip(*columns)]. Each unique combination of
+    values is hashed once and the result broadcast back to every row.
+
+    :param columns: Series, arrays or lists of values
+    :return: Series with the index of the first column if it is a Series,
+        otherwise an object array
+    """
+    first = columns[0]
+    rows = [(v,) for v in first] if len(columns) == 1 else list(zip(*columns))
+    keys = [_typed_key(r) for r in rows]
+    ids = {k: cached_uuid(*r) for k, r in dict(zip(keys, rows)).items()}
+    out = np.array([ids[k] for k in keys], dtype=object)
+    if isinstance(first, pd.Series):
+        return pd.Series(out, index=first.index, dtype=object)
+    return out
+
+
+def clear_uuid_cache():
+    """Clears the ids memoized by cached_uuid"""
+    _memo_uuid.cache_clear()
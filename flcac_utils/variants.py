@@ -0,0 +1,215 @@
+"""
+Generation of process variants (e.g. years, regions or scenarios) that share
+the structure of a template process set built with build_process_dict and
+differ only in exchange amounts, names and metadata. Variants are written
+directly to a JSON-LD archive without building an olca.Process for each.
+"""
+
+import json
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import olca_schema as olca
+
+from flcac_utils.generate_processes import outPath
+from flcac_utils.util import assign_year_to_meta
+from flcac_utils.uuids import make_uuids
+
+
+def exchange_index(template: dict[str, olca.Process]) -> pd.DataFrame:
+    """
+    Returns one row per exchange of the template processes, in the order
+    used for the columns of an amount matrix
+    """
+    rows = []
+    for p in template.values():
+        for i, e in enumerate(p.exchanges or []):
+            rows.append({'ProcessID': p.id,
+                         'ProcessName': p.name,
+                         'position': i,
+                         'FlowUUID': e.flow.id if e.flow else None,
+                         'FlowName': e.flow.name if e.flow else None,
+                         'IsInput': bool(e.is_input),
+                         'reference': bool(e.is_quantitative_reference),
+                         'amount': e.amount})
+    return pd.DataFrame(rows, columns=['ProcessID', 'ProcessName', 'position',
+                                       'FlowUUID', 'FlowName', 'IsInput',
+                                       'reference', 'amount'])
+
+
+def amount_matrix(df: pd.DataFrame,
+                  template: dict[str, olca.Process],
+                  variant_col: str = 'Year'
+                  ) -> pd.DataFrame:
+    """
+    Builds the amount matrix (variants x template exchanges) from stacked
+    exchange data, e.g. the input DataFrame with a Year column. Exchanges are
+    matched on ProcessName, FlowUUID and IsInput; exchanges not in df for a
+    variant are NaN, which keeps the template amount.
+
+    :param df: DataFrame of exchange data; see exchange_schema
+    :param variant_col: str, column of df identifying the variant
+    :return: DataFrame indexed by variant
+    """
+    keys = ['ProcessName', 'FlowUUID', 'IsInput']
+    idx = exchange_index(template)
+    n = len(idx)
+    idx['column'] = np.arange(n)
+    idx = idx.drop_duplicates(keys)
+    data = df[keys + [variant_col, 'amount']].astype({'IsInput': bool})
+    data = data.merge(idx[keys + ['column']], on=keys, how='inner')
+    codes, labels = pd.factorize(data[variant_col], sort=True)
+    m = np.full((len(labels), n), np.nan)
+    m[codes, data['column'].to_numpy()] = data['amount'].to_numpy(dtype=float)
+    return pd.DataFrame(m, index=pd.Index(labels, name=variant_col))
+
+
+def _camel(k: str) -> str:
+    """Converts an olca_schema attribute name to its JSON-LD key"""
+    first, *rest = k.split('_')
+    return first + ''.join(w.title() for w in rest)
+
+
+def iter_variants(template: dict[str, olca.Process],
+                  amounts,
+                  variants: pd.DataFrame = None,
+                  name_pattern: str = '{name} - {variant}',
+                  meta_patterns: dict[str, str] = None,
+                  loc_objs: dict[str, olca.Location] = None):
+    """
+    Yields a JSON-LD dict for each template process and variant.
+
+    Each template process is converted to a dict once. Variants share the
+    flow, unit, location and source refs of the template, and amounts are
+    taken from the amount matrix in a single vectorized step.
+
+    :param template: dict of olca.Process objects, see build_process_dict
+    :param amounts: DataFrame or 2D array of amounts (variants x exchanges)
+        with columns in the order of exchange_index(template), see
+        amount_matrix. NaN keeps the template amount.
+    :param variants: DataFrame of variant parameters with one row per row of
+        amounts, e.g. Year or location. Defaults to the index of amounts.
+        A Year column sets valid_from and valid_until (see
+        util.assign_year_to_meta) and a location column sets the location
+        from loc_objs.
+    :param name_pattern: str, formatted with name (the template process
+        name), variant (the variant label) and the columns of variants
+    :param meta_patterns: dict of process or process documentation
+        attributes to str patterns formatted like name_pattern, e.g.
+        {'time_description': 'Data for {Year}'}
+    :return: generator of (variant label, template ProcessID, dict)
+    """
+    idx = exchange_index(template)
+    m = amounts.to_numpy(dtype=float) if isinstance(amounts, pd.DataFrame) \
+        else np.atleast_2d(np.asarray(amounts, dtype=float))
+    if m.shape[1] != len(idx):
+        raise ValueError(f'Amount matrix has {m.shape[1]} columns, template '
+                         f'has {len(idx)} exchanges')
+    if variants is None:
+        if isinstance(amounts, pd.DataFrame):
+            variants = amounts.index.to_frame()
+        else:
+            variants = pd.DataFrame(index=pd.RangeIndex(len(m)))
+    if len(variants) != len(m):
+        raise ValueError('variants and amounts have a different number of '
+                         'rows')
+    # the template amount is kept where the matrix is NaN
+    m = np.where(np.isnan(m), idx['amount'].to_numpy(dtype=float), m)
+    bounds = np.cumsum([0] + [len(p.exchanges or [])
+                              for p in template.values()])
+    dicts = [p.to_dict() for p in template.values()]
+    template_names = [p.name for p in template.values()]
+    pids = list(template)
+
+    for v, (label, params) in enumerate(zip(variants.index,
+                                            variants.to_dict('records'))):
+        fmt = {'variant': label, **params}
+        names = [name_pattern.format(name=n, **fmt) for n in template_names]
+        ids = make_uuids(names)
+        id_map = dict(zip(pids, zip(ids, names)))
+        fields = {}
+        if 'Year' in params and pd.notna(params['Year']):
+            fields = assign_year_to_meta({}, params['Year'])
+        loc = None
+        if loc_objs and params.get('location') in loc_objs:
+            loc = loc_objs[params['location']].to_ref().to_dict()
+        for j, d in enumerate(dicts):
+            fields_j = {**fields, **{k: p.format(name=template_names[j], **fmt)
+                                     for k, p in (meta_patterns or {}).items()}}
+            out = dict(d)
+            out['@id'] = ids[j]
+            out['name'] = names[j]
+            if loc is not None:
+                out['location'] = loc
+            doc = dict(out.get('processDocumentation', {}))
+            for k, value in fields_j.items():
+                if k in dir(olca.Process):
+                    out[_camel(k)] = value
+                else:
+                    doc[_camel(k)] = value
+            if doc:
+                out['processDocumentation'] = doc
+            exchanges = []
+            for e, amount in zip(d.get('exchanges', []),
+                                 m[v, bounds[j]:bounds[j + 1]].tolist()):
+                e = dict(e, amount=amount)
+                provider = e.get('defaultProvider', {}).get('@id')
+                if provider in id_map:
+                    # link to the provider of the same variant
+                    e['defaultProvider'] = dict(
+                        e['defaultProvider'], **{'@id': id_map[provider][0],
+                                                 'name': id_map[provider][1]})
+                exchanges.append(e)
+            out['exchanges'] = exchanges
+            yield label, pids[j], out
+
+
+def write_variants(file: str,
+                   template: dict[str, olca.Process],
+                   amounts,
+                   variants: pd.DataFrame = None,
+                   name_pattern: str = '{name} - {variant}',
+                   meta_patterns: dict[str, str] = None,
+                   loc_objs: dict[str, olca.Location] = None,
+                   path: Path = outPath
+                   ) -> pd.DataFrame:
+    """
+    Writes all variants of the template processes to the json-ld archive
+    file in path as they are generated, see iter_variants. Flows, sources and
+    other objects are written separately, e.g. with write_objects. Objects
+    already in file are kept, except for processes with the same id as a
+    variant, which are replaced, e.g. when variants are written again.
+
+    :return: DataFrame of variant, template ProcessID, ProcessID and
+        ProcessName of each written process
+    """
+    path.mkdir(parents=False, exist_ok=True)
+    target = path / file
+    tmp = target.with_name(f'{target.name}.tmp')
+    rows = []
+    with zipfile.ZipFile(tmp, mode='w', compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr('olca-schema.json', '{"version": 2}')
+        written = {'olca-schema.json'}
+        for label, pid, d in iter_variants(template, amounts, variants,
+                                           name_pattern, meta_patterns,
+                                           loc_objs):
+            name = f'processes/{d["@id"]}.json'
+            if name in written:
+                print(f'WARNING: duplicate process variant {d["name"]}')
+                continue
+            z.writestr(name, json.dumps(d))
+            written.add(name)
+            rows.append((label, pid, d['@id'], d['name']))
+        # copy the other objects of an existing archive
+        if target.exists():
+            with zipfile.ZipFile(target) as old:
+                for info in old.infolist():
+                    if info.filename not in written:
+                        z.writestr(info, old.read(info.filename),
+                                   compress_type=zipfile.ZIP_DEFLATED)
+    tmp.replace(target)
+    print(f'{len(rows)} process variants written to {target}')
+    return pd.DataFrame(rows, columns=['variant', 'TemplateID', 'ProcessID',
+                                       'ProcessName'])
@@ -14,5 +14,7 @@ setup(
                       "numpy>=2.1",
                       "pyyaml>=5.3"
                       ],
+    # optional dependencies, e.g. pip install -e .[matrix]
+    extras_require={"matrix": ["scipy>=1.13"]},
     # description=''
 )
@@ -0,0 +1,99 @@
+"""
+Test chunked upload of a JSON-LD archive to a local stand-in server
+"""
+
+import io
+import json
+import zipfile
+
+import pytest
+
+import flcac_utils.commons_api as api
+from flcac_utils.commons_upload import archive_delta, split_archive, \
+    upload_archive
+from flcac_utils.transport import FixtureResponse, save_fixture, \
+    serve_fixtures
+
+
+def write_archive(path, n=6, version=1):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for i in range(n):
+            d = {'@type': 'Flow', '@id': f'flow-{i}', 'name': f'Flow {i}',
+                 'version': version if i == 0 else 1,
+                 'description': ' '.join(str(j) for j in range(i * 200))}
+            z.writestr(f'flows/flow-{i}.json', json.dumps(d))
+
+
+def set_head(fixture_path, commit_id):
+    repo = api.get_config()['USLCI']
+    save_fixture(fixture_path, 'GET',
+                 f'{api.default_base}/ws/public/repository/'
+                 f'{repo["owner"]}/{repo["repo"]}',
+                 200, json.dumps({'settings': {'id': commit_id}}).encode())
+
+
+class StandInRepository:
+    """POST handler that accepts uploads, failing selected batches"""
+
+    def __init__(self, fixture_path):
+        self.fixture_path = fixture_path
+        self.received = {}
+        self.posts = {}
+        self.fail_once = set()
+        self.down = set()
+
+    def __call__(self, path, headers, body):
+        parts = path.split('/ws/upload/')[-1].split('/')
+        if len(parts) == 2:
+            return FixtureResponse(200, b'{"uploadId": "u1"}')
+        if parts[-1] == 'commit':
+            set_head(self.fixture_path, 'commit-2')
+            return FixtureResponse(200, b'{}')
+        index = int(parts[-1])
+        self.posts[index] = self.posts.get(index, 0) + 1
+        if index in self.down or index in self.fail_once:
+            self.fail_once.discard(index)
+            return FixtureResponse(503, b'')
+        with zipfile.ZipFile(io.BytesIO(body)) as z:
+            self.received.update({n: z.read(n) for n in z.namelist()})
+        return FixtureResponse(200, b'{}')
+
+
+def test_split_archive(tmp_path):
+    write_archive(tmp_path / 'a.zip')
+    write_archive(tmp_path / 'b.zip', version=2)
+    batches = split_archive(tmp_path / 'a.zip', max_batch_bytes=500)
+    assert len(batches) > 1
+    assert sum(batches, []) == [f'flows/flow-{i}.json' for i in range(6)]
+    assert archive_delta(tmp_path / 'b.zip', tmp_path / 'a.zip') == [
+        'flows/flow-0.json']
+
+
+def test_resumable_upload(tmp_path):
+    write_archive(tmp_path / 'a.zip')
+    set_head(tmp_path, 'commit-1')
+    handler = StandInRepository(tmp_path)
+    handler.fail_once = {0}
+    handler.down = {1}
+    server = serve_fixtures(tmp_path, post_handlers=[handler])
+    api.set_transport(base_url=server.base_url)
+    kwargs = {'max_batch_bytes': 500, 'workers': 2, 'retries': 1,
+              'backoff': 0}
+    try:
+        with pytest.raises(RuntimeError):
+            upload_archive('USLCI', tmp_path / 'a.zip', 'test', **kwargs)
+        assert (tmp_path / 'a.upload.json').exists()
+        posts = dict(handler.posts)
+        handler.down = set()
+        head = upload_archive('USLCI', tmp_path / 'a.zip', 'test', **kwargs)
+    finally:
+        api.set_transport()
+        server.shutdown()
+    assert head == 'commit-2'
+    assert posts[0] == 2
+    # only the failed batch is sent again
+    assert {k: v - posts[k] for k, v in handler.posts.items()} == {
+        k: int(k == 1) for k in posts}
+    with zipfile.ZipFile(tmp_path / 'a.zip') as z:
+        assert handler.received == {n: z.read(n) for n in z.namelist()}
+    assert not (tmp_path / 'a.upload.json').exists()
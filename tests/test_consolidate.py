@@ -0,0 +1,38 @@
+"""
+Test consolidation of duplicate exchanges before building processes
+"""
+
+import numpy as np
+import pandas as pd
+
+from flcac_utils.generate_processes import consolidate_exchanges
+
+
+def make_exchange_df():
+    return pd.DataFrame({
+        'ProcessName': ['Truck', 'Truck', 'Truck', 'Truck', 'Truck'],
+        'FlowUUID': ['truck', 'co2', 'co2', 'diesel', 'diesel'],
+        'IsInput': [False, False, False, True, True],
+        'reference': [True, False, False, False, False],
+        'default_provider': [None, None, '', 'p-refinery', 'p-other'],
+        'unit': ['t*km', 'kg', 'kg', 'kg', 'kg'],
+        'amount': [1.0, 0.2, 0.6, 0.05, 0.01],
+        'description': [None, 'running', 'start', None, None],
+        'exchange_dqi': [None, '(1;2;3;2;2)', '(3;1;3;2;4)', None, None]})
+
+
+def test_consolidate_exchanges():
+    df = make_exchange_df()
+    out = consolidate_exchanges(df)
+    assert len(out) == 4
+    co2 = out.query('FlowUUID == "co2"').iloc[0]
+    assert np.isclose(co2['amount'], 0.8)
+    assert co2['description'] == 'running; start'
+    assert co2['exchange_dqi'] == '(3;2;3;2;4)'
+    # exchanges with different providers are kept separate
+    assert list(out.query('FlowUUID == "diesel"')['amount']) == [0.05, 0.01]
+    # totals by flow are unchanged
+    pd.testing.assert_series_equal(df.groupby('FlowUUID')['amount'].sum(),
+                                   out.groupby('FlowUUID')['amount'].sum())
+    weighted = consolidate_exchanges(df, dqi_method='weighted')
+    assert weighted.loc[1, 'exchange_dqi'] == '(3;1;3;2;4)'
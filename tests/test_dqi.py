@@ -0,0 +1,50 @@
+"""
+Test bulk operations on DQI scores
+"""
+
+import numpy as np
+import olca_schema as olca
+import pytest
+
+from flcac_utils.dqi import DQIArray
+from flcac_utils.util import increment_dqi_value
+
+
+def test_parse_and_format():
+    values = ['(1;2;3;2;2)', None, '(1;;3;2;2)', '(1;2;3;2;2)']
+    dqi = DQIArray.from_strings(values)
+    assert dqi.scores.tolist() == [[1, 2, 3, 2, 2], [0] * 5,
+                                   [1, 0, 3, 2, 2], [1, 2, 3, 2, 2]]
+    assert dqi.to_strings().tolist() == values
+    assert (dqi.increment(2).to_strings()[0] ==
+            increment_dqi_value(values[0], 2))
+    assert dqi.increment(3, by=4).scores[:, 2].tolist() == [5, 0, 5, 5]
+
+
+def test_aggregate_and_validate():
+    dqi = DQIArray.from_strings(['(1;2;3)', '(3;2;1)', '(2;;4)'])
+    labels, worst = dqi.aggregate(['a', 'a', 'b'])
+    assert labels.tolist() == ['a', 'b']
+    assert worst.to_strings().tolist() == ['(3;2;3)', '(2;;4)']
+    _, weighted = dqi.aggregate(['a', 'a', 'b'], method='weighted',
+                                weights=[3, -1, 1])
+    assert weighted.scores[0].tolist() == [2, 2, 3]
+
+    system = olca.DQSystem(name='Flow pedigree', indicators=[
+        olca.DQIndicator(name=f'i{i}', position=i,
+                         scores=[olca.DQScore(position=s) for s in range(1, 6)])
+        for i in range(1, 4)])
+    dqi.validate(system)
+    with pytest.raises(ValueError):
+        DQIArray(np.full((1, 5), 2)).validate(system)
+
+
+def test_aggregate_process_dqi():
+    import pandas as pd
+    from flcac_utils.dqi import aggregate_process_dqi
+
+    df = pd.DataFrame({'ProcessID': ['p1', 'p1', 'p2'],
+                       'exchange_dqi': ['(1;2;3)', '(3;2;1)', None],
+                       'amount': [1.0, 2.0, 3.0]})
+    assert aggregate_process_dqi(df).to_dict() == {'p1': '(3;2;3)',
+                                                   'p2': None}
@@ -0,0 +1,38 @@
+"""
+Import-time benchmark: modules used for short tasks (validating and mapping
+data, rounding, building processes) must not load heavy dependencies until
+they are used
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+deferred = ['requests', 'yaml', 'esupy.bibtex', 'esupy.location',
+            'esupy.util', 'fedelemflowlist', 'openpyxl', 'scipy']
+
+
+def import_profile(module):
+    """Imports module in a new interpreter and returns the deferred modules
+    that were loaded and the cumulative import time in seconds"""
+    code = (f'import sys, {module}; '
+            f'print(",".join(m for m in {deferred!r} if m in sys.modules))')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          capture_output=True, text=True, check=True)
+    loaded = [m for m in proc.stdout.strip().split(',') if m]
+    cumulative = [int(line.split('|')[1]) for line in proc.stderr.splitlines()
+                  if line.startswith('import time:') and
+                  line.split('|')[2].strip() == module]
+    return loaded, cumulative[0] / 1e6
+
+
+@pytest.mark.parametrize('module', [
+    'flcac_utils.commons_api', 'flcac_utils.dqi',
+    'flcac_utils.generate_processes', 'flcac_utils.mapping',
+    'flcac_utils.matrix',
+    'flcac_utils.metadata', 'flcac_utils.unit_conversion',
+    'flcac_utils.util', 'flcac_utils.uuids', 'flcac_utils.variants'])
+def test_deferred_imports(module):
+    loaded, seconds = import_profile(module)
+    assert loaded == [], f'{module} loaded {loaded} in {seconds:.2f}s'
@@ -0,0 +1,167 @@
+"""
+Test technosphere flow mapping without access to the FLCAC
+"""
+
+import numpy as np
+import olca_schema as olca
+import pandas as pd
+from esupy.util import make_uuid
+
+from flcac_utils.name_index import NameIndex
+from flcac_utils.mapping import apply_tech_flow_mapping, \
+    create_bridge_processes, match_tech_flow_rules, read_bridge_registry, \
+    register_bridge_processes, rule_key, suggest_tech_flow_mappings
+
+names = ['Diesel, at refinery',
+         'Gasoline, at refinery',
+         'Electricity, AC, 120 V',
+         'Diesel, combusted in industrial boiler']
+index = NameIndex(names, repos=['USLCI'] * 4,
+                  types=['Flow', 'Flow', 'Flow', 'Process'])
+
+
+def test_name_index():
+    df = index.search('diesel at refinary', repo='USLCI')
+    assert df['Candidate'].iloc[0] == 'Diesel, at refinery'
+    assert index.contains('Diesel, at refinery', repo='USLCI')
+    assert not index.contains('Diesel, at refinery', repo='USEEIO')
+
+
+def test_suggest_tech_flow_mappings():
+    df = pd.DataFrame({'SourceFlowName': ['diesel', 'gasoline'],
+                       'TargetRepoName': ['USLCI', 'USLCI'],
+                       'TargetFlowName': ['Diesel, at refinery',
+                                          'Gasolene at refinery']})
+    s = suggest_tech_flow_mappings(df, index=index)
+    assert set(s['SourceFlowName']) == {'gasoline'}
+    assert s.query('Rank == 1')['Candidate'].item() == 'Gasoline, at refinery'
+
+
+flow_dict = {
+    'diesel': {'BRIDGE': False, 'bridge_flow_name': np.nan,
+               'name': 'Diesel, at refinery', 'provider': 'Diesel production',
+               'repo': {'USLCI': 'Diesel, at refinery'},
+               'conversion': 2.0, 'unit': 'kg',
+               'id': make_uuid('Diesel, at refinery')},
+    'steel': {'BRIDGE': True, 'bridge_flow_name': 'Steel; bridged',
+              'name': 'Steel', 'provider': np.nan,
+              'repo': {'USEEIO': 'Steel'}, 'conversion': 1, 'unit': 'USD'},
+    }
+flow_objs = {'Diesel, at refinery': olca.Flow(
+    id=make_uuid('Diesel, at refinery'), name='Diesel, at refinery',
+    category='Technosphere Flows / Fuels'),
+             'Steel': olca.Flow(id='s1', name='Steel')}
+provider_dict = {'Diesel production': olca.Ref(id='p1', name='Diesel production')}
+
+
+def test_apply_tech_flow_mapping():
+    df = pd.DataFrame({'name': ['diesel', 'steel', 'CO2'],
+                       'amount': [1.0, 1.0, 1.0],
+                       'unit': ['L', 'kg', 'kg'],
+                       'FlowType': ['PRODUCT_FLOW', 'PRODUCT_FLOW',
+                                    'ELEMENTARY_FLOW'],
+                       'Context': ['', '', 'emission/air'],
+                       'ProcessName': ['A', 'A', 'A'],
+                       'ProcessID': ['a', 'a', 'a']})
+    df = apply_tech_flow_mapping(df, flow_dict, flow_objs, provider_dict)
+    diesel, steel, co2 = (r for _, r in df.iterrows())
+    assert diesel['amount'] == 2.0 and diesel['unit'] == 'kg'
+    assert diesel['Context'] == 'Technosphere Flows / Fuels'
+    assert diesel['default_provider'] == 'p1'
+    assert steel['FlowName'] == 'Steel; bridged'
+    assert steel['FlowUUID'] == make_uuid('Steel; bridged')
+    assert steel['default_provider'] == make_uuid(
+        'Steel; bridged BRIDGE, USLCI to USEEIO')
+    assert co2['FlowName'] == 'CO2' and co2['amount'] == 1.0
+
+
+def test_mapping_cache(tmp_path):
+    import flcac_utils.commons_api as api
+    from flcac_utils.mapping import prepare_tech_flow_mappings
+    from flcac_utils.transport import ReplayTransport, save_fixture
+    from test_transport import flow, write_repo_fixtures
+
+    repo = api.get_config()['USLCI']
+    commit_url = (f'{api.default_base}/ws/public/repository/'
+                  f'{repo["owner"]}/{repo["repo"]}')
+    save_fixture(tmp_path / 'head', 'GET', commit_url, 200,
+                 b'{"settings": {"id": "commit1"}}')
+    write_repo_fixtures(tmp_path / 'head')
+    df = pd.DataFrame({'SourceFlowName': ['diesel'],
+                       'TargetRepoName': ['USLCI'],
+                       'TargetFlowName': [flow['name']],
+                       'ConversionFactor': [1.0],
+                       'TargetUnit': ['kg']})
+    try:
+        api.set_transport(ReplayTransport(tmp_path / 'head'))
+        flow_dict, _, _ = prepare_tech_flow_mappings(
+            df, cache_path=tmp_path / 'cache')
+        # archive fixtures are not available, objects must come from the cache
+        save_fixture(tmp_path / 'commit_only', 'GET', commit_url, 200,
+                     b'{"settings": {"id": "commit1"}}')
+        api.set_transport(ReplayTransport(tmp_path / 'commit_only'))
+        cached_dict, flow_objs, _ = prepare_tech_flow_mappings(
+            df, cache_path=tmp_path / 'cache')
+    finally:
+        api.set_transport()
+    assert cached_dict == flow_dict
+    assert flow_objs[flow['name']].id == flow['@id']
+
+
+def test_match_conditions():
+    us = rule_key('diesel', "location == 'US'")
+    late = rule_key('diesel', 'Year >= 2022')
+    rules = {us: {**flow_dict['diesel'], 'source': 'diesel',
+                  'condition': "location == 'US'", 'conversion': 3.0},
+             late: {**flow_dict['diesel'], 'source': 'diesel',
+                    'condition': 'Year >= 2022', 'conversion': 4.0},
+             'diesel': {**flow_dict['diesel'], 'source': 'diesel',
+                        'condition': None}}
+    df = pd.DataFrame({'name': ['diesel'] * 3,
+                       'location': ['US', 'CA', 'US'],
+                       'Year': [2020, 2020, 2022],
+                       'amount': [1.0, 1.0, 1.0],
+                       'unit': ['L', 'L', 'L'],
+                       'FlowType': ['PRODUCT_FLOW'] * 3,
+                       'Context': [''] * 3,
+                       'ProcessName': ['A'] * 3,
+                       'ProcessID': ['a'] * 3})
+    keys, report = match_tech_flow_rules(df, rules)
+    assert keys.tolist() == [us, 'diesel', us]
+    assert report['status'].tolist() == ['multiple']
+    df = apply_tech_flow_mapping(df, rules, flow_objs, provider_dict)
+    assert df['amount'].tolist() == [3.0, 2.0, 3.0]
+
+
+def test_unmatched_conditions():
+    rules = {rule_key(n, 'Year == 2020'): {**flow_dict['diesel'], 'source': n,
+                                          'condition': 'Year == 2020'}
+             for n in ['A', 'B']}
+    df = pd.DataFrame({'name': ['A', 'B'], 'Year': [2021, 2021]})
+    keys, report = match_tech_flow_rules(df, rules)
+    assert keys.isna().all()
+    assert report['name'].tolist() == ['A', 'B']
+    assert report['status'].tolist() == ['unmatched', 'unmatched']
+
+def test_bridge_registry(tmp_path):
+    df = pd.DataFrame({'name': ['steel'], 'amount': [2.0], 'unit': ['kg'],
+                       'FlowType': ['PRODUCT_FLOW'], 'Context': [''],
+                       'ProcessName': ['A'], 'ProcessID': ['a'],
+                       'reference': [False], 'IsInput': [True]})
+    mapped = apply_tech_flow_mapping(df, flow_dict, flow_objs, provider_dict)
+    df_bridge = create_bridge_processes(mapped, flow_dict, flow_objs)
+    assert len(df_bridge) == 2
+    assert df_bridge['FlowUUID'].tolist() == [make_uuid('Steel; bridged'), 's1']
+    assert df_bridge['reference'].tolist() == [True, False]
+
+    registry = tmp_path / 'bridges.csv'
+    register_bridge_processes(df_bridge, registry)
+    reg = read_bridge_registry(registry)
+    assert reg['TargetFlowUUID'].tolist() == ['s1']
+    # published bridges are linked and not rebuilt
+    reg.loc[0, 'ProcessID'] = 'published-id'
+    mapped = apply_tech_flow_mapping(df, flow_dict, flow_objs, provider_dict,
+                                     bridge_registry=reg)
+    assert mapped['default_provider'].item() == 'published-id'
+    assert len(create_bridge_processes(mapped, flow_dict, flow_objs,
+                                       bridge_registry=reg)) == 0
@@ -0,0 +1,119 @@
+"""
+Test sparse matrix calculations on exchange data
+"""
+
+import numpy as np
+import olca_schema as olca
+import pandas as pd
+import pytest
+
+# scipy is an optional dependency, see extras_require in setup.py
+pytest.importorskip('scipy')
+
+from flcac_utils.matrix import (direct_impacts, exchanges_from_processes,
+                                impact_outliers)
+
+
+def make_exchanges():
+    rows = []
+    for i in range(20):
+        pid = f'p{i}'
+        rows += [(pid, 'product', 'PRODUCT_FLOW', False, True, 2.0, 'kg', None),
+                 (pid, 'co2', 'ELEMENTARY_FLOW', False, False,
+                  (1000.0 if i == 7 else 1.0 + i / 20), 'kg', None),
+                 (pid, 'ch4', 'ELEMENTARY_FLOW', False, False, 10.0, 'g', None),
+                 (pid, 'coal', 'PRODUCT_FLOW', True, False, 1.0, 'kg',
+                  'p0' if i else None)]
+    return pd.DataFrame(rows, columns=['ProcessID', 'FlowUUID', 'FlowType',
+                                       'IsInput', 'reference', 'amount',
+                                       'unit', 'default_provider'])
+
+
+def make_processes(df):
+    """Builds the processes and flows of df with build_process_dict"""
+    from flcac_utils.generate_processes import build_process_dict
+
+    df = df.assign(ProcessName=df['ProcessID'], ProcessCategory='',
+                   FlowName=df['FlowUUID'])
+    flows = {u: olca.Flow(id=u, name=u, flow_type=olca.FlowType[t])
+             for u, t in df[['FlowUUID', 'FlowType']].drop_duplicates().values}
+    return build_process_dict(df, flows, meta={}), flows
+
+
+gwp = olca.ImpactCategory(name='GWP', impact_factors=[
+    olca.ImpactFactor(flow=olca.Ref(id='co2'), value=1.0,
+                      unit=olca.Ref(name='kg')),
+    olca.ImpactFactor(flow=olca.Ref(id='ch4'), value=28.0,
+                      unit=olca.Ref(name='kg'))])
+
+
+def test_direct_impacts():
+    df = make_exchanges()
+    impacts = direct_impacts(df, [gwp])
+    assert np.isclose(impacts.loc['p1', 'GWP'], (1.05 + 0.28) / 2)
+    assert impacts.shape == (20, 1)
+    flagged = impact_outliers(impacts)
+    assert flagged.index[flagged['GWP']].tolist() == ['p7']
+
+
+def test_exchanges_from_processes():
+    df = make_exchanges()
+    processes, flows = make_processes(df)
+    exchanges = exchanges_from_processes(processes, flows)
+    cols = ['ProcessID', 'FlowUUID', 'FlowType', 'IsInput', 'reference',
+            'amount', 'unit', 'default_provider']
+    pd.testing.assert_frame_equal(
+        exchanges[cols].fillna(np.nan).reset_index(drop=True),
+        df[cols].fillna(np.nan).reset_index(drop=True), check_dtype=False)
+    from_objects = direct_impacts(processes, [gwp], flows=flows)
+    impacts = direct_impacts(df, [gwp])
+    assert np.allclose(from_objects.loc[impacts.index], impacts)
+    # exchanges only hold a Ref without the flow type
+    with pytest.raises(ValueError):
+        exchanges_from_processes(processes)
+
+
+def test_technosphere_matrix():
+    from flcac_utils.matrix import TechnosphereMatrix
+
+    df = make_exchanges()
+    # p0 consumes coal without a provider, coal mining is a Commons process
+    mine = pd.DataFrame({'ProcessID': ['mine', 'mine', 'mine'],
+                         'FlowUUID': ['coal', 'co2', 'diesel'],
+                         'FlowType': ['PRODUCT_FLOW', 'ELEMENTARY_FLOW',
+                                      'PRODUCT_FLOW'],
+                         'IsInput': [False, False, True],
+                         'reference': [True, False, False],
+                         'amount': [1000.0, 5.0, 1.0],
+                         'unit': ['kg', 'kg', 'l'],
+                         'default_provider': [None, None, None]})
+    tm = TechnosphereMatrix(df, providers=mine)
+    assert tm.unlinked['FlowUUID'].tolist() == ['diesel']
+
+    # 1 t of product from p1 requires 500 kg coal from p0, which requires
+    # 250 t of coal from mine
+    s = tm.scaling({'p1': 1000})
+    assert np.isclose(s.loc['p1', 0], 500)
+    assert np.isclose(s.loc['p0', 0], 250)
+    assert np.isclose(s.loc['mine', 0], 0.25)
+    inv = tm.inventory([{'p1': 1000}, {'p0': 2}])
+    assert np.isclose(inv.loc['co2', 0], 500 * 1.05 + 250 * 1.0 + 0.25 * 5)
+    assert np.isclose(inv.loc['co2', 1], 1.0 + 5 / 1000)
+    lcia = tm.impacts({'p0': 2}, [gwp])
+    assert np.isclose(lcia.loc['GWP', 0], 1.0 + 0.28 + 0.005)
+
+
+def test_technosphere_matrix_processes():
+    from flcac_utils.matrix import TechnosphereMatrix
+
+    df = make_exchanges()
+    processes, flows = make_processes(df)
+    tm = TechnosphereMatrix(processes, flows=flows)
+    expected = TechnosphereMatrix(df)
+    assert tm.B.shape == expected.B.shape == (2, 20)
+    assert tm.flow_index.tolist() == ['co2', 'ch4']
+    assert tm.unlinked['FlowUUID'].tolist() == ['coal']
+    s = tm.scaling({'p1': 1000})
+    assert np.allclose(s, expected.scaling({'p1': 1000}))
+    assert np.allclose(tm.inventory({'p1': 1000}),
+                       expected.inventory({'p1': 1000}))
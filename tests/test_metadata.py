@@ -0,0 +1,74 @@
+"""
+Test reading tabular process metadata
+"""
+
+import pandas as pd
+import pytest
+
+from flcac_utils.metadata import read_metadata_workbook, read_tabular_metadata
+
+
+def test_read_tabular_metadata():
+    df = pd.DataFrame({'Process A': ['A desc', 'Geo A', None, 'x'],
+                       'Process B': ['B desc', 'Geo B', 'Sampled', 'y']},
+                      index=['Description', 'Geography',
+                             'Sampling Procedure', 'Not a key'])
+    meta = read_tabular_metadata(df)
+    assert meta['Process A'] == {'description': 'A desc',
+                                 'geography_description': 'Geo A',
+                                 'sampling_description': ''}
+    assert meta['Process B']['sampling_description'] == 'Sampled'
+
+
+def test_read_metadata_workbook(tmp_path):
+    openpyxl = pytest.importorskip('openpyxl')
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'General information'
+    ws.append(['Process metadata'])
+    ws.append(['Field', 'Notes', 'Process A', 'Process B'])
+    ws.append(['Description', 'skipped', 'A desc', 'B desc'])
+    ws.append(['Comment', 'skipped', 'x', 'y'])
+    ws = wb.create_sheet('Documentation')
+    ws.append(['Field', 'Notes', 'Process A', 'Process B'])
+    ws.append(['Use advice', 'skipped', None, 'Advice'])
+    wb.create_sheet('Unused')
+    wb.save(tmp_path / 'meta.xlsx')
+
+    df = read_metadata_workbook(
+        tmp_path / 'meta.xlsx',
+        sheets={'General information': {'header': 1, 'usecols': 'A, C:D'},
+                'Documentation': {'usecols': 'A, C:D'}},
+        processes=['Process B'])
+    assert df.columns.tolist() == ['Process B']
+    assert read_tabular_metadata(df) == {
+        'Process B': {'description': 'B desc', 'use_advice': 'Advice'}}
+
+
+def test_process_meta():
+    import olca_schema as olca
+    from pathlib import Path
+    from flcac_utils.generate_processes import build_process_dict
+
+    df = pd.read_csv(Path(__file__).parent / 'test_electricity.csv')
+    flows = {u: olca.Flow(id=u, name=n) for u, n in
+             df[['FlowUUID', 'FlowName']].drop_duplicates().values}
+    actor_objs = {'EPA': olca.Actor(id='a1', name='EPA')}
+    argentina, uk = df['ProcessName'].unique()
+    meta = {'description': 'Grid mix', 'data_set_owner': 'EPA',
+            'use_advice': 'General advice'}
+    # values read separately from a workbook are equal but distinct objects
+    process_meta = {argentina: {'use_advice': ''.join(['Specific ', 'advice'])},
+                    uk: {'use_advice': ''.join(['Specific ', 'advice']),
+                         'description': ''}}
+    processes = build_process_dict(df, flows, meta=meta,
+                                   process_meta=process_meta,
+                                   actor_objs=actor_objs)
+    p1, p2 = processes.values()
+    assert p1.description == p2.description == 'Grid mix'
+    assert p1.process_documentation.use_advice == 'Specific advice'
+    assert (p1.process_documentation.use_advice is
+            p2.process_documentation.use_advice)
+    assert (p1.process_documentation.data_set_owner is
+            p2.process_documentation.data_set_owner)
+    assert p1.process_documentation.data_set_owner.id == 'a1'
@@ -0,0 +1,104 @@
+"""
+Test tabular views of JSON-LD archives
+"""
+
+import io
+import json
+import zipfile
+
+from flcac_utils.tables import build_exchange_table, build_process_table, \
+    get_process_table_fields
+
+process = {
+    '@type': 'Process',
+    '@id': 'b5b0e1a4-0000-4000-8000-000000000001',
+    'name': 'Electricity; at grid; generation mix - Argentina',
+    'category': '22: Utilities / 2211: Electric Power Generation',
+    'processType': 'UNIT_PROCESS',
+    'location': {'@type': 'Location', '@id': 'a', 'name': 'Argentina'},
+    'exchanges': [
+        {'@type': 'Exchange', 'internalId': 1, 'amount': 1.0,
+         'isInput': False, 'isQuantitativeReference': True,
+         'flow': {'@type': 'Flow', '@id': 'f1',
+                  'name': 'Electricity, AC, 2300-7650 V'},
+         'unit': {'@type': 'Unit', 'name': 'MJ'}},
+        {'@type': 'Exchange', 'internalId': 2, 'amount': 0.5,
+         'isInput': True, 'isQuantitativeReference': False,
+         'dqEntry': '(1;2;3;2;1)',
+         'flow': {'@type': 'Flow', '@id': 'f2', 'name': 'Coal',
+                  'flowType': 'PRODUCT_FLOW',
+                  'category': 'Technosphere Flows'},
+         'unit': {'@type': 'Unit', 'name': 'kg'},
+         'defaultProvider': {'@type': 'Process', '@id': 'p2',
+                             'name': 'Coal mining'}},
+        ],
+    'processDocumentation': {'sources': [{'name': 'Ember Climate 1'}]},
+    }
+
+
+def make_archive():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as z:
+        z.writestr(f'processes/{process["@id"]}.json', json.dumps(process))
+    return buffer.getvalue()
+
+
+def test_process_table():
+    df = build_process_table({'Test': make_archive()})
+    assert list(df.columns) == get_process_table_fields()
+    row = df.iloc[0]
+    assert row['last_cat'] == '2211: Electric Power Generation'
+    assert row['ref_flow'] == 'Electricity, AC, 2300-7650 V'
+    assert row['location.name'] == 'Argentina'
+    assert row['exchanges'] == 2
+
+
+def test_exchange_table():
+    from flcac_utils.generate_processes import exchange_schema
+    df = build_exchange_table(make_archive())
+    assert set(exchange_schema).issubset(df.columns)
+    assert len(df) == 2
+    assert df['reference'].tolist() == [True, False]
+    assert df.loc[1, 'default_provider'] == 'p2'
+    assert df.loc[1, 'exchange_dqi'] == '(1;2;3;2;1)'
+
+
+class TrackedZipFile(zipfile.ZipFile):
+    """Records each archive opened by flcac_utils.tables"""
+    opened = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened.append(self)
+
+
+def test_archive_closed(tmp_path, monkeypatch):
+    import flcac_utils.tables as tables
+    TrackedZipFile.opened = []
+    monkeypatch.setattr(tables.zipfile, 'ZipFile', TrackedZipFile)
+    path = tmp_path / 'archive.zip'
+    path.write_bytes(make_archive())
+    build_process_table({'Test': path})
+    build_exchange_table(path)
+    assert TrackedZipFile.opened
+    assert all(z.fp is None for z in TrackedZipFile.opened)
+
+
+def test_exchange_table_single_pass(tmp_path, monkeypatch):
+    import flcac_utils.tables as tables
+    TrackedZipFile.opened = []
+    monkeypatch.setattr(tables.zipfile, 'ZipFile', TrackedZipFile)
+    flow = {'@type': 'Flow', '@id': 'f1', 'flowType': 'PRODUCT_FLOW',
+            'category': 'Electricity'}
+    location = {'@type': 'Location', '@id': 'a', 'code': 'AR'}
+    path = tmp_path / 'archive.zip'
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('flows/f1.json', json.dumps(flow))
+        z.writestr(f'processes/{process["@id"]}.json', json.dumps(process))
+        z.writestr('locations/a.json', json.dumps(location))
+    TrackedZipFile.opened = []
+    df = build_exchange_table(path)
+    assert len(TrackedZipFile.opened) == 1
+    assert list(df['location'].unique()) == ['AR']
+    assert df.loc[0, 'FlowType'] == 'PRODUCT_FLOW'
+    assert df.loc[0, 'Context'] == 'Electricity'
@@ -0,0 +1,127 @@
+"""
+Test offline access of the commons API using recorded fixtures
+"""
+
+import io
+import json
+import zipfile
+
+import flcac_utils.commons_api as api
+from flcac_utils.transport import ReplayTransport, save_fixture, serve_fixtures
+
+flow = {'@type': 'Flow',
+        '@id': '0e0a5c8d-0000-4000-8000-000000000001',
+        'name': 'Diesel, at refinery',
+        'category': 'Technosphere Flows',
+        'flowType': 'PRODUCT_FLOW'}
+
+
+def write_repo_fixtures(fixture_path):
+    """Records the two requests used by return_request for USLCI"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as z:
+        z.writestr(f'flows/{flow["@id"]}.json', json.dumps(flow))
+    repo = api.get_config()['USLCI']
+    base = api.default_base
+    save_fixture(fixture_path, 'GET',
+                 f'{base}/ws/public/download/json/prepare/'
+                 f'{repo["owner"]}/{repo["repo"]}?path=PROCESS',
+                 200, b'token123')
+    save_fixture(fixture_path, 'GET',
+                 f'{base}/ws/public/download/json/token123',
+                 200, buffer.getvalue())
+
+
+def test_replay(tmp_path):
+    write_repo_fixtures(tmp_path)
+    api.set_transport(ReplayTransport(tmp_path))
+    try:
+        data = api.read_commons_data({'USLCI': 'FLOWS'})
+    finally:
+        api.set_transport()
+    assert [f.name for f in data['USLCI']] == [flow['name']]
+
+
+def test_standin_server(tmp_path):
+    write_repo_fixtures(tmp_path)
+    server = serve_fixtures(tmp_path, latency=0.01, bandwidth=1e6)
+    api.set_transport(base_url=server.base_url)
+    try:
+        data = api.read_commons_data({'USLCI': {'FLOWS': [flow['name']]}})
+    finally:
+        api.set_transport()
+        server.shutdown()
+    assert data['USLCI'][0].id == flow['@id']
+
+
+def test_lazy_objects(tmp_path):
+    write_repo_fixtures(tmp_path)
+    api.set_transport(ReplayTransport(tmp_path))
+    try:
+        lazy = api.read_commons_data({'USLCI': 'FLOWS'}, lazy=True)['USLCI'][0]
+        full = api.read_commons_data({'USLCI': 'FLOWS'})['USLCI'][0]
+    finally:
+        api.set_transport()
+    assert lazy.to_ref().to_dict() == full.to_ref().to_dict()
+    assert lazy.flow_type == full.flow_type
+
+
+def test_request_plan(tmp_path):
+    write_repo_fixtures(tmp_path)
+    api.set_transport(ReplayTransport(tmp_path))
+    plan = api.CommonsRequestPlan()
+    try:
+        plan.add({'USLCI': {'FLOWS': [flow['name']]}})
+        plan.add({'USLCI': 'ACTORS'})
+        flows = api.read_commons_data({'USLCI': {'FLOWS': [flow['name']]}},
+                                      plan=plan)
+        actors = api.read_commons_data({'USLCI': 'ACTORS'}, plan=plan)
+        all_flows = api.read_commons_data({'USLCI': 'FLOWS'}, plan=plan)
+    finally:
+        api.set_transport()
+    assert plan.n_downloads == 1
+    assert [f.id for f in flows['USLCI']] == [flow['@id']]
+    assert actors['USLCI'] == []
+    assert all_flows['USLCI'][0] is flows['USLCI'][0]
+
+
+def write_sync_fixtures(fixture_path, process_status):
+    repo = api.get_config()['USLCI']
+    path = f'{api.default_base}/ws/public'
+    owner_repo = f'{repo["owner"]}/{repo["repo"]}'
+    save_fixture(fixture_path, 'GET', f'{path}/repository/{owner_repo}', 200,
+                 json.dumps({'settings': {'id': 'c2'}}).encode())
+    save_fixture(fixture_path, 'GET', f'{path}/history/{owner_repo}', 200,
+                 json.dumps([{'id': 'c1', 'commitTimestamp': 1},
+                             {'id': 'c2', 'commitTimestamp': 2}]).encode())
+    save_fixture(fixture_path, 'GET',
+                 f'{path}/history/references/{owner_repo}/c2', 200,
+                 json.dumps([{'type': 'PROCESS', 'refId': 'p1'},
+                             {'type': 'ACTOR', 'refId': 'a1'}]).encode())
+    process = {'@type': 'Process', '@id': 'p1', 'name': 'Process 1'}
+    save_fixture(fixture_path, 'GET', f'{path}/browse/{owner_repo}/PROCESS/p1',
+                 process_status,
+                 json.dumps(process if process_status == 200
+                            else {'error': 'server error'}).encode())
+
+
+def test_sync_failed_object(tmp_path):
+    mirror_path = tmp_path / 'mirror'
+    (mirror_path / 'USLCI' / 'processes').mkdir(parents=True)
+    (mirror_path / 'sync_state.yml').write_text('USLCI:\n  commit: c1\n')
+    fixture_path = tmp_path / 'fixtures'
+    try:
+        write_sync_fixtures(fixture_path, 500)
+        api.set_transport(ReplayTransport(fixture_path))
+        head = api.sync_repository('USLCI', mirror_path)
+        assert head == 'c1'
+        assert not (mirror_path / 'USLCI/processes/p1.json').exists()
+        write_sync_fixtures(fixture_path, 200)
+        head = api.sync_repository('USLCI', mirror_path)
+    finally:
+        api.set_transport()
+    assert head == 'c2'
+    assert json.loads((mirror_path / 'USLCI/processes/p1.json').read_text()
+                      )['name'] == 'Process 1'
+    # actors are not an object type of the repo
+    assert not (mirror_path / 'USLCI' / 'actors').exists()
@@ -0,0 +1,38 @@
+"""
+Test unit conversion within olca_schema unit groups
+"""
+
+import numpy as np
+import pandas as pd
+
+from flcac_utils.unit_conversion import (check_conversion_factors,
+                                         conversion_factors, harmonize_units,
+                                         unknown_units)
+
+
+def test_conversion_factors():
+    f = conversion_factors(['kg', 'lb', 'MJ', 'kWh', 'kg', 'foo'],
+                           ['g', 'kg', 'kWh', 'btu', 'MJ', 'kg'])
+    assert np.allclose(f[:4], [1000, 0.45359237, 1 / 3.6, 3412.14163],
+                       rtol=1e-6)
+    assert np.isnan(f[4:]).all()
+    assert conversion_factors('metric ton', 'kg') == 1000
+
+
+def test_harmonize_units():
+    df = pd.DataFrame({'amount': [2.0, 500.0, 1.0, 3.0],
+                       'unit': ['t', 'g', 'kWh', 'foo']})
+    ref = harmonize_units(df)
+    assert ref['amount'].tolist() == [2000.0, 0.5, 3.6, 3.0]
+    assert ref['unit'].tolist() == ['kg', 'kg', 'MJ', 'foo']
+    mass = harmonize_units(df, target={'Units of mass': 'lb'})
+    assert mass['unit'].tolist() == ['lb', 'lb', 'kWh', 'foo']
+    assert unknown_units(df['unit']) == ['foo']
+
+
+def test_check_conversion_factors():
+    df = pd.DataFrame({'SourceFlowName': ['a', 'b', 'c', 'd'],
+                       'SourceUnit': ['kg', 'kg', 'kg', 'kg'],
+                       'TargetUnit': ['t', 't', 'kg', 'MJ'],
+                       'ConversionFactor': [0.001, 1000, None, 44.0]})
+    assert check_conversion_factors(df)['SourceFlowName'].tolist() == ['b']
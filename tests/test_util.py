@@ -0,0 +1,117 @@
+"""
+Test supporting functions in util
+"""
+
+import uuid
+import zipfile
+
+import esupy.bibtex
+import numpy as np
+import olca_schema as olca
+import pandas as pd
+
+import flcac_utils.util as util
+from flcac_utils.util import (extract_latest_zip, iter_zip_entries,
+                              round_array_to_sig_figs, round_exchange_amounts,
+                              round_to_sig_figs)
+
+
+def test_round_array_to_sig_figs():
+    rng = np.random.default_rng(0)
+    x = np.concatenate([rng.lognormal(0, 10, 10000) * rng.choice([-1, 1], 10000),
+                        [0.15, -0.15, 0.025, 2.675, 1000.0, 1e-30, 5e-324]])
+    for sig_figs in (1, 3, 4):
+        expected = [round_to_sig_figs(float(v), sig_figs) for v in x]
+        assert round_array_to_sig_figs(x, sig_figs).tolist() == expected
+    s = pd.Series([0.0, np.nan, -1234.5678], index=[3, 2, 1])
+    rounded = round_array_to_sig_figs(s, 3)
+    assert rounded.index.tolist() == [3, 2, 1]
+    assert rounded.fillna(-1).tolist() == [0.0, -1, -1230.0]
+
+
+def test_round_exchange_amounts():
+    df = pd.DataFrame({'FlowType': ['PRODUCT_FLOW', 'ELEMENTARY_FLOW',
+                                    'WASTE_FLOW'],
+                       'amount': [1.23456, 1.23456, 1.23456]})
+    assert (round_exchange_amounts(df, 2)['amount'].tolist() ==
+            [1.2, 1.2, 1.2])
+    df = round_exchange_amounts(df, {'ELEMENTARY_FLOW': 3, 'default': 2})
+    assert df['amount'].tolist() == [1.2, 1.23, 1.2]
+
+
+def test_extract_latest_zip(tmp_path):
+    fpath = tmp_path / 'export.zip'
+    with zipfile.ZipFile(fpath, 'w', zipfile.ZIP_DEFLATED) as z:
+        for folder in ('processes', 'flows', 'actors'):
+            for i in range(5):
+                z.writestr(f'{folder}/{i}.json', f'{{"@id": "{folder}{i}"}}')
+    out = extract_latest_zip(tmp_path, tmp_path / 'work',
+                             members=['processes', 'flows/1*'], workers=2)
+    assert sorted(f.relative_to(out).as_posix() for f in out.rglob('*.json')
+                  ) == ['flows/1.json'] + [f'processes/{i}.json'
+                                           for i in range(5)]
+    (out / 'processes' / '0.json').write_text('changed')
+    mtime = (out / 'processes' / '1.json').stat().st_mtime_ns
+    extract_latest_zip(fpath, tmp_path / 'work', members=['processes'],
+                       skip_unchanged=True)
+    assert (out / 'processes' / '0.json').read_text() == '{"@id": "processes0"}'
+    assert (out / 'processes' / '1.json').stat().st_mtime_ns == mtime
+
+    entries = dict(iter_zip_entries(fpath, members=['actors/*.json']))
+    assert entries['actors/2.json'] == b'{"@id": "actors2"}'
+    assert len(entries) == 5
+
+
+def test_extract_nested_folders(tmp_path):
+    fpath = tmp_path / 'export.zip'
+    names = [f'processes/{i}/sub/{j}.json' for i in range(50) for j in range(4)]
+    with zipfile.ZipFile(fpath, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name in names + ['../outside.json']:
+            z.writestr(name, name)
+    for k in range(5):
+        work = tmp_path / f'work{k}'
+        out = extract_latest_zip(fpath, work, workers=8)
+        assert len(list(out.rglob('*.json'))) == len(names) + 1
+        assert (out / 'outside.json').exists()
+        assert not (work / 'outside.json').exists()
+
+
+def test_generate_bib_sources(tmp_path, monkeypatch):
+    calls = []
+
+    def generate_sources(bib_path, bibids):
+        # as in esupy, entries not in the file are skipped and the id is
+        # derived from the requested name
+        calls.append(dict(bibids))
+        return [olca.Source(id=str(uuid.uuid3(uuid.NAMESPACE_OID, v)), name=v,
+                            year='' if k == 'b' else 2020)
+                for k, v in bibids.items() if k in ('a', 'b')]
+
+    monkeypatch.setattr(esupy.bibtex, 'generate_sources',
+                        generate_sources)
+    bib_path = tmp_path / 'refs.bib'
+    bib_path.write_text('@misc{a, title = {A}}\n@Article{ b ,\n title={B}}\n')
+    bibids = {'a': 'Source A', 'b': 'Source B'}
+    s = util.generate_bib_sources(bib_path, bibids, cache_path=tmp_path)
+    direct = generate_sources(bib_path, bibids)
+    assert [(x.id, x.name) for x in s] == [(x.id, x.name) for x in direct]
+    assert s[1].year is None
+    s[1].name = 'Changed'
+    # the same id under another name is a different source
+    s2 = util.generate_bib_sources(bib_path, {'b': 'Other name',
+                                              'missing': 'Other'})
+    direct = generate_sources(bib_path, {'b': 'Other name'})
+    assert [(x.id, x.name) for x in s2] == [(x.id, x.name) for x in direct]
+    assert s2[0].id != s[1].id
+    calls.clear()
+    s3 = util.generate_bib_sources(bib_path, {'b': 'Source B',
+                                              'missing': 'Other'})
+    assert s3[0].name == 'Source B' and s3[0] is not s[1]
+    # sources already generated are not generated again
+    assert calls == []
+
+    # sources are reloaded from disk for a new session
+    util._bib_cache.clear()
+    s4 = util.generate_bib_sources(bib_path, {'a': 'Source A'},
+                                   cache_path=tmp_path)
+    assert s4[0].name == 'Source A' and calls == []
@@ -0,0 +1,32 @@
+"""
+Test that batched UUIDs match esupy.util.make_uuid
+"""
+
+import numpy as np
+import pandas as pd
+from esupy.util import make_uuid
+
+from flcac_utils.uuids import cached_uuid, make_uuids
+
+
+def test_make_uuids():
+    names = pd.Series(['Diesel', ' diesel ', 'Steel', 'Diesel', None, np.nan],
+                      index=[5, 4, 3, 2, 1, 0])
+    years = [2020, 2020, None, 2021, 2020, 2020]
+    ids = make_uuids(names)
+    assert ids.index.tolist() == names.index.tolist()
+    assert ids.tolist() == [make_uuid(n) for n in names]
+    assert (make_uuids(names, years).tolist() ==
+            [make_uuid(n, y) for n, y in zip(names, years)])
+    assert cached_uuid('Steel', 'kg') == make_uuid('Steel', 'kg')
+
+
+def test_mixed_types():
+    # equal values of different types are hashed as different strings
+    assert cached_uuid('Steel', 2020.0) == make_uuid('Steel', 2020.0)
+    assert cached_uuid('Steel', 2020) == make_uuid('Steel', 2020)
+    assert cached_uuid('Steel', True) == make_uuid('Steel', True)
+    assert cached_uuid('Steel', 1) == make_uuid('Steel', 1)
+    years = pd.Series([2020, 2020.0, 1, True], dtype=object)
+    assert (make_uuids(['Steel'] * 4, years).tolist() ==
+            [make_uuid('Steel', y) for y in years])
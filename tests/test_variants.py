@@ -0,0 +1,82 @@
+"""
+Test generation of process variants from a template process set
+"""
+
+import json
+import zipfile
+
+import pandas as pd
+import olca_schema as olca
+
+from flcac_utils.variants import amount_matrix, exchange_index, write_variants
+
+
+def make_template():
+    def exchange(flow, amount, is_input, ref=False, provider=None):
+        return olca.Exchange(
+            flow=olca.Ref(id=flow, name=flow.title()), amount=amount,
+            is_input=is_input, is_quantitative_reference=ref,
+            default_provider=(olca.Ref(id=provider, name='Steel')
+                              if provider else None))
+    steel = olca.Process(id='p-steel', name='Steel',
+                         exchanges=[exchange('steel', 1.0, False, ref=True),
+                                    exchange('coal', 0.5, True)])
+    car = olca.Process(id='p-car', name='Car',
+                       exchanges=[exchange('car', 1.0, False, ref=True),
+                                  exchange('steel', 900.0, True,
+                                           provider='p-steel')])
+    return {p.id: p for p in (steel, car)}
+
+
+def test_write_variants(tmp_path):
+    template = make_template()
+    assert len(exchange_index(template)) == 4
+    df = pd.DataFrame({'ProcessName': ['Steel', 'Steel', 'Car'],
+                       'FlowUUID': ['coal', 'coal', 'steel'],
+                       'IsInput': [True, True, True],
+                       'Year': [2020, 2030, 2030],
+                       'amount': [0.6, 0.4, 800.0]})
+    amounts = amount_matrix(df, template)
+    assert list(amounts.index) == [2020, 2030]
+    out = write_variants('variants.zip', template, amounts,
+                         name_pattern='{name}; {Year}',
+                         meta_patterns={'time_description': 'Data for {Year}'},
+                         path=tmp_path)
+    assert len(out) == 4
+    with zipfile.ZipFile(tmp_path / 'variants.zip') as z:
+        procs = {d['name']: d for d in
+                 (json.loads(z.read(n)) for n in z.namelist()
+                  if n.startswith('processes/'))}
+    assert sorted(procs) == ['Car; 2020', 'Car; 2030',
+                             'Steel; 2020', 'Steel; 2030']
+    assert [e['amount'] for e in procs['Steel; 2020']['exchanges']] == [1.0, 0.6]
+    # missing amounts keep the template amount
+    assert procs['Car; 2020']['exchanges'][1]['amount'] == 900.0
+    assert procs['Car; 2030']['exchanges'][1]['amount'] == 800.0
+    # providers are linked within each variant
+    provider = procs['Car; 2030']['exchanges'][1]['defaultProvider']
+    assert provider['@id'] == procs['Steel; 2030']['@id']
+    doc = procs['Steel; 2030']['processDocumentation']
+    assert doc['validFrom'].startswith('2030-01-01')
+    assert doc['timeDescription'] == 'Data for 2030'
+    # the template is unchanged
+    assert template['p-steel'].exchanges[1].amount == 0.5
+
+
+def test_rewrite_variants(tmp_path):
+    template = make_template()
+    with zipfile.ZipFile(tmp_path / 'variants.zip', 'w') as z:
+        z.writestr('flows/coal.json', json.dumps({'@id': 'coal'}))
+    amounts = pd.DataFrame([[1.0, 0.5, 1.0, 900.0]],
+                           index=pd.Index([2020], name='Year'))
+    write_variants('variants.zip', template, amounts, path=tmp_path)
+    # written again with new amounts
+    write_variants('variants.zip', template, amounts * 2, path=tmp_path)
+    with zipfile.ZipFile(tmp_path / 'variants.zip') as z:
+        names = z.namelist()
+        procs = [json.loads(z.read(n)) for n in names
+                 if n.startswith('processes/')]
+    assert len(names) == len(set(names)) == 4
+    assert 'flows/coal.json' in names
+    assert sorted(e['amount'] for p in procs for e in p['exchanges']) == [
+        1.0, 2.0, 2.0, 1800.0]